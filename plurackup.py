@@ -29,10 +29,93 @@ _apiKey = ''
 # Default is style.css
 cssFilename = ''
 
+# Set up "should the HTML output be split into pages?" If so, a directory named after the output file, with _html appended, is written
+# instead of one .html file: an index.html, a page per month and a style.css shared by them. Large accounts open much faster this way.
+# Set htmlPlurksPerPage to put that many plurks on each page instead of a month's. Paged output can't be used together with streamingOutput.
+htmlPaged = False
+htmlPlurksPerPage = 0
+
+# Set up "should the output files be compressed?" "" writes them as they are; "gzip", "bz2" or "lzma" (python 3 only) compresses
+# them while they are written, and appends .gz, .bz2 or .xz to their names. Paged HTML output is not compressed.
+# outputCompressionLevel is the compressor's level (1-9); None takes the compressor's default.
+outputCompression = ""
+outputCompressionLevel = None
+
+# Set up "should the plurks also be written into a SQLite database?" If so, the output filename with .sqlite appended
+# holds all plurks, responses and people, ready for queries. Runs into an existing database update it in place.
+sqliteOutput = False
+
+# Set up "should the plurks also be written as JSON Lines?" If so, the output filename with .jsonl appended holds one plurk per line,
+# with its responses and the people they refer to, for other tools to read a line at a time. It is compressed as outputCompression says.
+jsonlOutput = False
+
 # Set up "how many plurks should each request to server return?"
-# This affects parallelism of this script (the larger the value, the more parallelism). The author hasn't tried any value > 50.
+# This affects how many plurks are queued for response fetching at once. The author hasn't tried any value > 50.
 plurksPerRequest = 50
 
+# Set up "how many threads should fetch responses simultaneously?"
+# This is the actual parallelism of this script; each thread reuses its own connection session.
+responseFetcherCount = 16
+
+# Set up "how many plurks may wait in line for their responses to be fetched?"
+# Fetching of further timeline pages pauses when the line is full, which bounds memory usage.
+fetchQueueSize = 200
+
+# Set up "how many keep-alive connections to plurk.com should be kept open for reuse?"
+# 0 means one for each response fetcher thread plus one for the timeline.
+connectionPoolSize = 0
+
+# Set up "how many times should a failed request be attempted?"
+# Failed attempts are retried after a random, exponentially growing wait.
+maxAttempts = 5
+
+# Set up "at most how many requests per second should be sent to plurk.com?" 0 means no limit.
+requestsPerSecond = 0
+
+# Set up "should only what changed since the previous backup be fetched?"
+# The previous backup is remembered in FILENAME.manifest.json and FILENAME.archive.jsonl next to the output files.
+# Plurks posted up to incrementalLookbackDays before the previous backup's newest plurk are checked for new responses/favorites/replurks;
+# older plurks are taken from the previous backup as they are.
+incrementalBackup = False
+incrementalLookbackDays = 30
+
+# Set up "should plurks be written out as soon as their responses arrive, instead of all at the end?"
+# This keeps memory usage low for large accounts. It can't be used together with incrementalBackup.
+streamingOutput = False
+
+# Set up "into how many time windows should the timeline be split, to be paged through simultaneously?"
+# The windows split the time since your account was created evenly. 1 pages through the timeline in one go.
+# More windows page a large timeline faster, but send plurk.com that many more requests at once; try 4 to 8 for accounts of many thousand plurks.
+timelineWindowCount = 1
+
+# Set up "in how many processes should the output files be rendered?" 0 uses one process per CPU core; 1 renders in this process.
+# Rendering in several processes speeds up writing large backups, but needs python 3.7 or later and an OS which can fork,
+# and does not apply to streamingOutput; elsewhere the output files are rendered in this process anyway.
+renderProcessCount = 1
+
+# Select the fetch engine: "threads" or "asyncio" (python 3.7 or later).
+# The asyncio engine runs all requests as coroutines in a single thread instead of using responseFetcherCount threads.
+fetchEngine = "threads"
+
+# For the asyncio engine: "how many response requests may be in flight at once?"
+maxRequestsInFlight = 64
+
+# Set up "should the number of response requests in flight adapt to how plurk.com copes?" If so, it starts at 1, grows while responses
+# come back as fast as usual and without errors, and is cut back as soon as they slow down or fail. responseFetcherCount (or
+# maxRequestsInFlight for the asyncio engine) is then only the most it may grow to, and may be set higher.
+adaptiveConcurrency = False
+
+# Set up "where is the Plurk API?" Leave empty for plurk.com. To try things out without plurk.com, run "python plurkmock.py"
+# and set this to the host it names, e.g. "127.0.0.1:8080"; it is spoken to in plain HTTP, and takes any username and password.
+apiHost = ""
+
+# Set up "should a report of the run be written?" If so, FILENAME.report.json tells how long the requests to plurk.com took and how often
+# they were retried, how busy the response fetchers were and how long each output took to write; handy for tuning the settings above.
+runReport = False
+
+# Set up "should a line with the progress, the throughput and the time still to go be shown while fetching?"
+showProgress = False
+
 
 
 """
@@ -41,6 +124,7 @@ plurksPerRequest = 50
 """
 
 import re
+import sys
 import time
 import getpass
 
@@ -50,9 +134,22 @@ import plurackuplib
 if "raw_input" in vars(__builtins__):
     input = raw_input
 
+# "python plurackup.py --resume" picks up an interrupted backup where it stopped
+resumeBackup = "--resume" in sys.argv[1:]
+
+# "python plurackup.py --rerender FILENAME.xml" (or .jsonl) writes the output files again from an earlier backup, without logging in
+rerenderArchive = sys.argv[sys.argv.index("--rerender") + 1] if "--rerender" in sys.argv[1:-1] else ""
+
 def _outLog(message):
+    if showProgress:
+        # wipe the progress line; it is drawn again below the message within a second
+        sys.stdout.write("\r" + " " * 79 + "\r")
     print(message)
 
+def _showProgress(text):
+    sys.stdout.write("\r" + text.ljust(79))
+    sys.stdout.flush()
+
 def _quesAsk(question):
     return input(question)
 
@@ -62,7 +159,7 @@ plurackup Plurk Backup Tool.
 - Please note: this backup tool will backup only your plurks and their responses, and not plurks by your friends or those who you follow.
 =========================================""")
 
-if _apiKey == "":
+if _apiKey == "" and rerenderArchive == "":
     _apiKey = input("Plurk API Key is undefined. Please input your API key retrieved from http://www.plurk.com/API/1.0/#key :")
     print("========================================")
 
@@ -126,10 +223,32 @@ print("----------------------------------------")
 outFilename = input("- The default output filename is your plurk username. *Existing files will be overwritten*\n- Enter output filename if you wish to override the default; .xml and/or .html will be appended: ")
 
 print("========================================")
+
+# how the output files are written, whether re-rendered or backed up
+outputOptions = dict(outFilename = outFilename, xmlOut = xmlOutput, htmlOut = htmlOutput,
+                     htmlTimeOffsetSign = zoneOffsetSign, htmlTimeOffsetHour = zoneOffsetHour, htmlTimeOffsetMinute = zoneOffsetMin, cssFilename = cssFilename,
+                     htmlPaged = htmlPaged, htmlPlurksPerPage = htmlPlurksPerPage, outputCompression = outputCompression, outputCompressionLevel = outputCompressionLevel,
+                     sqliteOut = sqliteOutput, jsonlOut = jsonlOutput, renderProcessCount = renderProcessCount)
+
+if rerenderArchive != "":
+    backupAgent = plurackuplib.BackupAgent(_apiKey, _outLog, _quesAsk, **outputOptions)
+    username = input("- Re-rendering " + rerenderArchive + ". Whose plurks are they? Plurk username: ")
+    backupAgent.rerenderArchive(rerenderArchive, username)
+    sys.exit(0)
+
 print("LOGIN CREDENTIALS")
 print("----------------------------------------")
 
-backupAgent = plurackuplib.BackupAgent(_apiKey, _outLog, _quesAsk, outFilename, xmlOutput, htmlOutput, zoneOffsetSign, zoneOffsetHour, zoneOffsetMin, cssFilename, plurksPerRequest)
+backupOptions = dict(outputOptions, plurksPerRequest = plurksPerRequest, responseFetcherCount = responseFetcherCount, fetchQueueSize = fetchQueueSize,
+                     connectionPoolSize = connectionPoolSize, maxAttempts = maxAttempts, requestsPerSecond = requestsPerSecond, adaptiveConcurrency = adaptiveConcurrency,
+                     incremental = incrementalBackup, incrementalLookbackDays = incrementalLookbackDays, streamingOutput = streamingOutput, timelineWindowCount = timelineWindowCount,
+                     apiHost = apiHost, runReport = runReport, progressFunc = _showProgress if showProgress else None)
+
+if fetchEngine == "asyncio":
+    import plurackupasynclib
+    backupAgent = plurackupasynclib.AsyncBackupAgent(_apiKey, _outLog, _quesAsk, maxRequestsInFlight = maxRequestsInFlight, **backupOptions)
+else:
+    backupAgent = plurackuplib.BackupAgent(_apiKey, _outLog, _quesAsk, **backupOptions)
 
 print("- Please have your login credentials ready. Your username and password will be sent through HTTPS (encrypted).")
 
@@ -140,7 +259,7 @@ password = getpass.getpass("Your plurk password: ")
 
 print("========================================")
 
-backupAgent.doBackup(username, password)
+backupAgent.doBackup(username, password, resumeBackup)
 
 _apiKey = ""
 backAgent = None
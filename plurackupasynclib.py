@@ -0,0 +1,252 @@
+"""
+    Copyright (c) 2011-2013 Mnjul/purincess (Min-Zhong Lu)
+    With plurklib from Kurt Karakurt (http://code.google.com/p/plurklib/)
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+"""
+"""
+    asyncio fetch engine for plurackup. python 3.7 or later only.
+
+    AsyncBackupAgent is a drop-in replacement of plurackuplib.BackupAgent: timeline paging and
+    response fetching run as coroutines on one thread, while the collected data go through the
+    very same _DataStorage and file fronts, so the output files are identical.
+"""
+import asyncio
+import collections
+import datetime
+
+import plurackuplib
+import plurkasynclib
+import plurktime
+
+
+class _AdaptiveSemaphore:
+    """ Stands in for the asyncio.Semaphore of maxRequestsInFlight, letting in as many as an _AdaptiveConcurrency's limit says. """
+    def __init__(self, concurrency):
+        self._concurrency = concurrency
+        self._inFlight = 0
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        while self._inFlight >= self._concurrency.getLimit():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._inFlight += 1
+
+    def release(self):
+        self._inFlight -= 1
+        # the limit may have grown meanwhile, so as many waiters as there is room for are woken; each checks again
+        room = self._concurrency.getLimit() - self._inFlight
+        while room > 0 and len(self._waiters) > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                room -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, excType, excValue, traceback):
+        self.release()
+
+
+class AsyncBackupAgent(plurackuplib.BackupAgent):
+    def __init__(self, *args, **kwargs):
+        """ Takes the same parameters as BackupAgent, plus:
+                maxRequestsInFlight: How many /API/Responses/get calls may be outstanding at once; with adaptiveConcurrency, the most that may be.
+        """
+        maxRequestsInFlight = kwargs.pop("maxRequestsInFlight", 64)
+        plurackuplib.BackupAgent.__init__(self, *args, **kwargs)
+        self._maxRequestsInFlight = max(maxRequestsInFlight, 1)
+        if self._concurrency is not None:
+            self._concurrency = plurackuplib._AdaptiveConcurrency(1, self._maxRequestsInFlight)
+
+    def _runSettings(self):
+        settings = plurackuplib.BackupAgent._runSettings(self)
+        settings.update({"engine": "asyncio", "max_requests_in_flight": self._maxRequestsInFlight})
+        del settings["response_fetcher_count"]
+        return settings
+
+    async def _getResponsesWithRetry(self, plurkObj, plurk, fromResponse):
+        # same as BackupAgent._getResponsesWithRetry, but waits without blocking the event loop
+        attempt = 1
+        while True:
+            grRes = await plurkObj.getResponses(plurk.plurk_id, fromResponse)
+            if self._isUsableGetResponsesRes(grRes, attempt):
+                return grRes
+            await asyncio.sleep(self._retryPolicy.delay(attempt))
+            attempt += 1
+
+    async def _fetchPage(self, plurkObj, responsePages, fromResponse, semaphore, peopleDirectory):
+        # the run report sees the requests waiting for the semaphore as queued, and the ones in flight as busy workers
+        self._runReport.workQueued()
+        async with semaphore:
+            self._runReport.workTaken()
+            try:
+                grRes = await self._getResponsesWithRetry(plurkObj, responsePages.plurk, fromResponse)
+                responsePages.addPage(plurackuplib.BackupAgent._extractResponsesFromGetResponsesRes(grRes, self._keepContentRaw, self._keepContent), plurackuplib.BackupAgent._extractPeopleFromGetResponsesRes(grRes, peopleDirectory))
+            except Exception as e:
+                responsePages.addError(e)
+            self._runReport.workFinished()
+
+    async def _fetchResponses(self, plurkObj, plurk, dataStorage, peopleDirectory, semaphore, failedPlurks, journal, incrementalState):
+        try:
+            try:
+                grRes = await self._getResponsesWithRetry(plurkObj, plurk, 0)
+            finally:
+                # further pages take their own turns within maxRequestsInFlight
+                semaphore.release()
+                self._runReport.workFinished()
+
+            responses = plurackuplib.BackupAgent._extractResponsesFromGetResponsesRes(grRes, self._keepContentRaw, self._keepContent)
+            people = plurackuplib.BackupAgent._extractPeopleFromGetResponsesRes(grRes, peopleDirectory)
+            fromResponses = plurackuplib._ResponsePages.remainingOffsets(responses, grRes["response_count"] if "response_count" in grRes else plurk.response_count)
+            if len(fromResponses) > 0:
+                responsePages = plurackuplib._ResponsePages(plurk, responses, people, len(fromResponses))
+                await asyncio.gather(*[self._fetchPage(plurkObj, responsePages, fromResponse, semaphore, peopleDirectory) for fromResponse in fromResponses])
+                if responsePages.getError() is not None:
+                    raise responsePages.getError()
+                responses = responsePages.getResponses()
+                people = responsePages.getPeople()
+
+            journal.recordResponses(plurk.plurk_id, responses, people)
+            peopleDirectory.addPeople(people)
+            plurk.responses = responses
+            self._outLogFunc("Consumed plurk posted at: " + plurk.posted_time)
+        except Exception as e:
+            plurackuplib.BackupAgent._failPlurk(plurk, e, failedPlurks, incrementalState)
+        self._runReport.plurkFetched()
+        dataStorage.plurkCompleted(plurk)
+
+    async def _pageWindow(self, plurkObj, upperDateTime, lowerDateTime, pageQueue):
+        # same as BackupAgent._TimelinePager.run
+        try:
+            currentOffsetDateTime = upperDateTime
+            while currentOffsetDateTime is not None:
+                gpRes = await plurkObj.getOwnPlurks(currentOffsetDateTime.strftime("%Y-%m-%dT%H:%M:%S"), self._plurksPerRequest)
+                plurks, people, currentOffsetDateTime = self._takeTimelinePage(gpRes, lowerDateTime)
+                if len(plurks) > 0:
+                    await pageQueue.put((plurks, people))
+            await pageQueue.put(None)
+        except Exception as e:
+            await pageQueue.put(e)
+
+    async def _submitFetch(self, plurkObj, plurk, dataStorage, peopleDirectory, semaphore, failedPlurks, journal, incrementalState, fetchTasks):
+        # paging pauses here while too many requests are in flight
+        self._runReport.workQueued()
+        await semaphore.acquire()
+        self._runReport.workTaken()
+        fetchTasks.append(asyncio.ensure_future(self._fetchResponses(plurkObj, plurk, dataStorage, peopleDirectory, semaphore, failedPlurks, journal, incrementalState)))
+
+    async def _doBackupAsync(self, username, password, resume):
+        self._runReport.begin(self._runSettings())
+        plurkObj = plurkasynclib.AsyncPlurkAPI(self._apiKey, self._retryPolicy, self._rateLimiter, self._apiHost, self._apiSecure, self._callObserver())
+        try:
+            self._outLogFunc("Logging in...")
+            loginRes = await plurkObj.login(username, password)
+            if "error_text" in loginRes:
+                self._outLogFunc("Login failed.")
+                return
+
+            displayName = plurackuplib.BackupAgent._extractDisplayNameFromLoginRes(loginRes, username)
+            joinDateTime = plurackuplib.BackupAgent._extractJoinDateFromLoginRes(loginRes)
+
+            self._outLogFunc((b"Login was successful; Display name: " + displayName.encode("utf-8")).decode("utf-8"))
+
+            filename = self._outFilename if self._outFilename != "" else username
+
+            fileFronts = self._createFileFronts(filename, username, displayName)
+            dataStorage = plurackuplib._StreamingDataStorage(fileFronts, self._outputSink.isCompressing()) if self._streamingOutput else plurackuplib._DataStorage()
+            peopleDirectory = plurackuplib._PeopleDirectory(dataStorage.addPeople)
+            semaphore = asyncio.Semaphore(self._maxRequestsInFlight) if self._concurrency is None else _AdaptiveSemaphore(self._concurrency)
+            fetchTasks = []
+            failedPlurks = []
+
+            incrementalState = self._loadIncrementalState(filename, username)
+            if incrementalState is not None:
+                dataStorage.addPeople(incrementalState.getArchivedPeople())
+            fetchPlanner = plurackuplib._ResponseFetchPlanner(incrementalState)
+            seenPlurkIds = set()
+            oldestPostedTime = None
+            pagingEnded = False
+
+            journal, replayed = self._openJournal(filename, username, resume)
+
+            if replayed is not None:
+                plurksToFetch, oldestPostedTime, pagingEnded = self._replayJournal(replayed, dataStorage, incrementalState, fetchPlanner, seenPlurkIds)
+                for plurk in plurksToFetch:
+                    await self._submitFetch(plurkObj, plurk, dataStorage, peopleDirectory, semaphore, failedPlurks, journal, incrementalState, fetchTasks)
+
+            self._outLogFunc("Begin to fetch plurks and responses...")
+
+            # add one day to get around any timezone issues, just like BackupAgent does
+            newestDateTime = (datetime.datetime.now() + datetime.timedelta(1)) if oldestPostedTime is None else plurktime.parsePlurkTime(oldestPostedTime)
+            windows = [] if pagingEnded else self._splitTimeline(newestDateTime, joinDateTime, incrementalState)
+            pageQueueSize = max(self._fetchQueueSize // max(self._plurksPerRequest, 1), 1) if self._streamingOutput else 0
+            pageQueues = [asyncio.Queue(pageQueueSize) for window in windows]
+            pagerTasks = [asyncio.ensure_future(self._pageWindow(plurkObj, upperDateTime, lowerDateTime, pageQueue)) for (upperDateTime, lowerDateTime), pageQueue in zip(windows, pageQueues)]
+            if len(pagerTasks) > 1:
+                self._outLogFunc("Paging the timeline in " + str(len(pagerTasks)) + " windows at once...")
+            progressLine = self._startProgressLine(windows, newestDateTime, joinDateTime)
+
+            try:
+                # the windows are paged concurrently, but their pages are taken in timeline order
+                for pageQueue in pageQueues:
+                    while True:
+                        page = await pageQueue.get()
+                        if page is None:
+                            break
+                        if isinstance(page, Exception):
+                            raise page
+
+                        plurks, people = page
+                        plurksToFetch = self._takePage(plurks, people, journal, peopleDirectory.addPeople, dataStorage, fetchPlanner, seenPlurkIds)
+                        for plurk in plurksToFetch:
+                            await self._submitFetch(plurkObj, plurk, dataStorage, peopleDirectory, semaphore, failedPlurks, journal, incrementalState, fetchTasks)
+                        oldestPostedTime = plurks[len(plurks) - 1].posted_time
+            finally:
+                for pagerTask in pagerTasks:
+                    pagerTask.cancel()
+
+            journal.recordEnd()
+            self._runReport.pagingEnded()
+            self._finishIncrementalPaging(dataStorage, incrementalState, seenPlurkIds)
+
+            self._outLogFunc("Waiting for outstanding response fetches to finish...")
+            await asyncio.gather(*fetchTasks)
+            journal.close()
+            self._stopProgressLine(progressLine)
+
+            self._outLogFunc("Fetching is done. Logging out.")
+            await plurkObj.logout()
+            self._reportConcurrency()
+            self._reportFetchPlan(fetchPlanner)
+            self._reportPeopleDirectory(peopleDirectory)
+            self._reportFailedPlurks(failedPlurks)
+        finally:
+            await plurkObj.close()
+
+        self._saveIncrementalState(incrementalState, username, dataStorage, failedPlurks)
+        self._writeOutput(dataStorage, fileFronts, filename)
+        self._writeRunReport(filename, fetchPlanner, failedPlurks)
+        journal.remove()
+
+    def doBackup(self, username, password, resume = False):
+        asyncio.run(self._doBackupAsync(username, password, resume))
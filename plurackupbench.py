@@ -0,0 +1,755 @@
+"""
+    Copyright (c) 2011-2013 Mnjul/purincess (Min-Zhong Lu)
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+"""
+from __future__ import print_function
+
+# Micro-benchmarks of plurackup's internals, run on synthetic data without any network access.
+# Usage: python plurackupbench.py [benchmark ...]
+# Runs all benchmarks if none is named.
+
+import codecs
+import copy
+import datetime
+import filecmp
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import plurackuplib
+import plurkmock
+import plurktime
+
+
+def _timeIt(func):
+    startTime = time.time()
+    func()
+    return time.time() - startTime
+
+def _writeToFile(fileFront, plurks, people, outFilename):
+    fileFront._outfile = codecs.open(outFilename, "w", "utf-8")
+    fileFront.writePlurks(plurks, people)
+    fileFront._outfile.close()
+
+def _report(name, seconds, baselineSeconds = None):
+    print("  {0:<40} {1:9.3f} s".format(name, seconds) + ("" if baselineSeconds is None else "  ({0:.1f}x)".format(baselineSeconds / seconds if seconds > 0 else float("inf"))))
+
+
+def syntheticPlurks(count, maxResponses = 0, seed = 1):
+    """ Returns count plurks, new-entry-first, in the format of BackupAgent._extractPlurksFromGetPlurksRes,
+        each with up to maxResponses responses by people 1..120 (syntheticPeople() knows only 1..100).
+    """
+    rand = random.Random(seed)
+    postedTime = datetime.datetime(2013, 1, 1)
+    plurks = []
+    for plurkIndex in range(count):
+        postedTime -= datetime.timedelta(seconds = rand.randint(60, 86400))
+        responses = []
+        for responseIndex in range(rand.randint(0, maxResponses) if maxResponses > 0 else 0):
+            responses.append(plurackuplib._Response(plurkIndex * 1000 + responseIndex, rand.randint(1, 120), (postedTime + datetime.timedelta(seconds = responseIndex * 60)).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+                                                    "en", rand.choice([":", "says", "likes"]), rand.choice(["", "says", "likes"]),
+                                                    "response <" + str(responseIndex) + "> & ]]> more", "response <b>" + str(responseIndex) + "</b> &amp; more"))
+        plurks.append(plurackuplib._Plurk(100000000 + plurkIndex, postedTime.strftime("%a, %d %b %Y %H:%M:%S GMT"), "en",
+                                          rand.choice([":", "says", "loves"]), rand.choice(["says", "loves"]),
+                                          2, [1, 2], 1, [3], len(responses),
+                                          rand.choice([[], [0], [4, 5]]), "plurk " + str(plurkIndex) + " & <raw>", "plurk <i>" + str(plurkIndex) + "</i>",
+                                          responses))
+    return plurks
+
+def syntheticPeople(count = 100):
+    return dict((uid, plurackuplib._Person("user" + str(uid), "User <" + str(uid) + "> & co" if uid % 3 else "")) for uid in range(1, count + 1))
+
+
+def benchStorage():
+    """ Accumulating 100k plurks in pages of 50 into _DataStorage. """
+
+    class QuadraticDataStorage:
+        # _DataStorage.addPlurks as it used to be: copies the whole archive on every page
+        def __init__(self):
+            self._plurks = []
+
+        def addPlurks(self, plurks):
+            plurksCopy = copy.copy(plurks)
+            plurksCopy.reverse()
+            plurksCopy.extend(self._plurks)
+            self._plurks = plurksCopy
+
+    plurks = syntheticPlurks(100000)
+    pages = [plurks[pageStart:pageStart + 50] for pageStart in range(0, len(plurks), 50)]
+
+    def fill(dataStorage):
+        for page in pages:
+            dataStorage.addPlurks(page)
+
+    quadraticStorage = QuadraticDataStorage()
+    chunkedStorage = plurackuplib._DataStorage()
+    baselineSeconds = _timeIt(lambda: fill(quadraticStorage))
+    _report("copy-and-extend (previous)", baselineSeconds)
+    _report("chunked _DataStorage", _timeIt(lambda: fill(chunkedStorage)), baselineSeconds)
+    _report("chunked _DataStorage, iterating", _timeIt(lambda: list(plurackuplib._OldFirstPlurks(chunkedStorage._pages))))
+
+    if [plurk.plurk_id for plurk in quadraticStorage._plurks] != [plurk.plurk_id for plurk in chunkedStorage.getPlurks()]:
+        raise AssertionError("chunked _DataStorage yields a different order")
+
+
+def benchRecords():
+    """ Memory taken by 200k responses, as dicts and as slotted records. """
+    try:
+        import tracemalloc
+    except ImportError:
+        print("  (needs python 3.4+)")
+        return
+
+    def measure(build):
+        tracemalloc.start()
+        records = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size, records
+
+    def asDicts():
+        return [{"rid": rid, "uid": rid % 100, "posted_time": "Tue, 01 Jan 2013 00:00:00 GMT", "lang": "en", "qualifier": "says", "qualifier_translated": "says",
+                 "content_raw": "raw " + str(rid), "content": "html " + str(rid)} for rid in range(200000)]
+
+    def asRecords(keepContentRaw, keepContent):
+        return [plurackuplib._Response(rid, rid % 100, "Tue, 01 Jan 2013 00:00:00 GMT", "en", "says", "says", "raw " + str(rid) if keepContentRaw else None, "html " + str(rid) if keepContent else None) for rid in range(200000)]
+
+    baselineSize = measure(asDicts)[0]
+    for name, build in (("dicts (previous)", asDicts), ("_Response records", lambda: asRecords(True, True)), ("_Response records, HTML only", lambda: asRecords(False, True))):
+        size = measure(build)[0]
+        print("  {0:<40} {1:9.1f} MB  ({2:.1f}x)".format(name, size / 1048576.0, baselineSize / float(size)))
+
+
+class _PreviousHTMLFileFront(plurackuplib._HTMLFileFront):
+    # _HTMLFileFront.writePlurks as it used to be: many small writes, each field encoded and decoded
+    def writePlurks(self, plurks, people):
+        timeZoneDelta = datetime.timedelta(hours = self._htmlTimeOffsetHour, minutes = self._htmlTimeOffsetMinute)
+
+        # since there is no html manipulation, let's output the file plain-text-ly, and not using any dom modules
+        for plurk in plurks:
+            plurkTime = datetime.datetime.strptime(plurk.posted_time, "%a, %d %b %Y %H:%M:%S %Z")
+            if self._htmlTimeOffsetSign == 1:
+                plurkTime += timeZoneDelta
+            else:
+                plurkTime -= timeZoneDelta
+                
+            plurk_id = plurk.plurk_id
+            b36chars = '0123456789abcdefghijklmnopqrstuvwxyz'
+            plurkID36 = ""
+            while plurk_id:
+                plurk_id, mod = divmod(plurk_id, 36)
+                plurkID36 = b36chars[mod] + plurkID36
+
+            self._outfile.write('\n')
+            self._outfile.write('\t\t<div class="plurk_block">\n')
+            self._outfile.write('\t\t\t<table class="pb_plurk">\n')
+            self._outfile.write('\t\t\t\t<tr>\n')
+            self._outfile.write((b'\t\t\t\t\t<td class="pb_plurk_name_qualifier"><a href="http://www.plurk.com/' + plurackuplib._escapeHTML(self._username, True).encode("ascii") + b'" class="plurk_name">' + plurackuplib._escapeHTML(self._displayName).encode("utf-8") + b'</a> <span class="' + ((b"qualifier qualifier_" + plurackuplib._escapeHTML(plurk.qualifier, True).encode("utf-8")) if plurk.qualifier != "" and plurk.qualifier != ":" else b"" ) + b'">' + plurackuplib._escapeHTML(plurk.qualifier_translated).encode("utf-8") + b'</span></td>\n').decode("utf-8"))
+            self._outfile.write((b'\t\t\t\t\t\t<td class="pb_plurk_content">' + plurk.content.encode("utf-8") + b'<br />\n').decode("utf-8"))
+            self._outfile.write('\t\t\t\t\t\t\t<p class="pb_plurk_timestamp_and_other_stats"><a href="http://www.plurk.com/p/' + plurkID36 + '">' + plurkTime.strftime("%Y-%m-%d %H:%M:%S") + '</a> - ' + str(len(plurk.responses)) + ' response(s) - ' + str(plurk.favorite_count) + ' favorite(s) - ' + str(plurk.replurkers_count) + ' replurker(s)</p>\n')
+            self._outfile.write('\t\t\t\t\t\t</td>\n')
+            self._outfile.write('\t\t\t\t</tr>\n')
+            self._outfile.write('\t\t\t</table>\n')
+            self._outfile.write('\t\t\t\n')
+            self._outfile.write('\t\t\t<hr class="pb_hr" />\n')
+            self._outfile.write('\t\t\t\n')
+            
+            self._outfile.write('\t\t\t<div class="pb_responseoffset">\n')
+            
+            rowAlternating = 0
+            for response in plurk.responses:
+                responseTime = datetime.datetime.strptime(response.posted_time, "%a, %d %b %Y %H:%M:%S %Z")
+                if self._htmlTimeOffsetSign == 1:
+                    responseTime += timeZoneDelta
+                else:
+                    responseTime -= timeZoneDelta                
+                
+                if not response.uid in people:
+                    self._outfile.write('\t\t\t\t<table class="pb_response pb_response_bg' + str(rowAlternating) + ' pb_response_unknown_user">\n')
+                    self._outfile.write('\t\t\t\t\t<tr>\n')
+                    self._outfile.write('\t\t\t\t\t\t<td class="pb_response_name_qualifier"><span class="plurk_name">' + self._unknownUserDisplayName + '</span>')
+                else:
+                    username = people[response.uid].username
+                    displayname = people[response.uid].displayname if people[response.uid].displayname != "" else username
+                    self._outfile.write('\t\t\t\t<table class="pb_response pb_response_bg' + str(rowAlternating) + '">\n')
+                    self._outfile.write('\t\t\t\t\t<tr>\n')
+                    self._outfile.write((b'\t\t\t\t\t\t<td class="pb_response_name_qualifier"><a href="http://www.plurk.com/' + plurackuplib._escapeHTML(username, True).encode("utf-8") + b'" class="plurk_name">' + plurackuplib._escapeHTML(displayname).encode("utf-8") + b'</a>').decode("utf-8"))
+
+                self._outfile.write((b' <span class="' + ((b"qualifier qualifier_" + plurackuplib._escapeHTML(response.qualifier, True).encode("utf-8")) if response.qualifier != "" and response.qualifier != ":" else b"" ) + b'">' + plurackuplib._escapeHTML(response.qualifier_translated).encode("utf-8") + b'</span></td>\n').decode("utf-8"))
+                self._outfile.write((b'\t\t\t\t\t\t<td class="pb_response_content">' + response.content.encode("utf-8") + b'<br />\n').decode("utf-8"))
+                self._outfile.write('\t\t\t\t\t\t\t<p class="pb_response_timestamp">' + responseTime.strftime("%Y-%m-%d %H:%M:%S") + '</p>\n')
+                self._outfile.write('\t\t\t\t\t\t</td>\n')
+                self._outfile.write('\t\t\t\t\t</tr>\n')
+                self._outfile.write('\t\t\t\t</table>\n')
+
+                rowAlternating = (rowAlternating + 1) % 2
+                              
+            self._outfile.write('\t\t\t</div>\n')
+            self._outfile.write('\t\t\t<hr class="pb_hr" />\n')
+            self._outfile.write('\t\t\t<table class="pb_misc_people">\n')
+            
+            def outputMiscPeople(plurkKey, typeText, breakCallback = None):
+                if len(getattr(plurk, plurkKey)) > 0:
+                    self._outfile.write('\t\t\t\t<tr>\n')
+                    self._outfile.write('\t\t\t\t\t<th>' + typeText + '</th>\n')
+                    self._outfile.write('\t\t\t\t\t<td>\n')
+                    
+                    if not breakCallback is None:
+                        if breakCallback(getattr(plurk, plurkKey)):
+                            return
+    
+                    buffer_to_write = '\t\t\t\t\t\t'
+                    for miscPerson in getattr(plurk, plurkKey):
+                        if not miscPerson in people:
+                            buffer_to_write += '<span class="plurk_name">' + self._unknownUserDisplayName + '</span>, '
+                        else:
+                            username = people[miscPerson].username
+                            displayname = people[miscPerson].displayname if people[miscPerson].displayname != "" else username
+                            buffer_to_write += (b'<a href="http://www.plurk.com/' + plurackuplib._escapeHTML(username, True).encode("utf-8") + b'" class="plurk_name">' + plurackuplib._escapeHTML(displayname).encode("utf-8") + b'</a>, ').decode("utf-8")
+                    buffer_to_write = buffer_to_write[:-2]    # get rid of trailing ", "...stupid but works
+                    self._outfile.write(buffer_to_write + '\n')
+                    self._outfile.write('\t\t\t\t\t</td>\n')
+                    self._outfile.write('\t\t\t\t</tr>\n')  
+                
+            def checkAudienceListForFriend(audienceList):
+                if audienceList[0] == 0:
+                    self._outfile.write('\t\t\t\t\t\t(friends)\n')
+                    return True
+                return False
+
+            outputMiscPeople("favorers", "Favorers")
+            outputMiscPeople("replurkers", "Replurkers")
+            outputMiscPeople("limited_to", "Audience", checkAudienceListForFriend)
+
+            self._outfile.write('\t\t\t</table>\n')
+            self._outfile.write('\t\t</div>\n')
+
+
+def benchHTML():
+    """ Rendering 10k plurks with 100k responses into HTML. """
+    plurks = syntheticPlurks(10000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+    print("  ({0} responses)".format(sum(len(plurk.responses) for plurk in plurks)))
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        previousFilename = os.path.join(outDirectory, "previous.html")
+        currentFilename = os.path.join(outDirectory, "current.html")
+        baselineSeconds = _timeIt(lambda: _writeToFile(_PreviousHTMLFileFront("bench", "benchuser", "Bench <User>", 1, 8, 0, "style.css", print), oldFirstPlurks, people, previousFilename))
+        _report("small writes (previous)", baselineSeconds)
+        _report("templates, caches, batched writes", _timeIt(lambda: _writeToFile(plurackuplib._HTMLFileFront("bench", "benchuser", "Bench <User>", 1, 8, 0, "style.css", print), oldFirstPlurks, people, currentFilename)), baselineSeconds)
+
+        if not filecmp.cmp(previousFilename, currentFilename, False):
+            raise AssertionError("_HTMLFileFront renders differently than before")
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+class _PreviousXMLFileFront(plurackuplib._XMLFileFront):
+    # _XMLFileFront.writePlurks as it used to be: many small writes, each field encoded and decoded
+    def writePlurks(self, plurks, people):
+        # since there is no xml manipulation, let's output the file plain-text-ly, and not using any dom modules
+        for plurk in plurks:
+            self._outfile.write('\t<plurk id="{0}" posted_time="{1}" lang="{2}" favorite_count="{3}" replurkers_count="{4}">\n'.format(str(plurk.plurk_id), plurk.posted_time, plurk.lang, plurk.favorite_count, plurk.replurkers_count))
+            self._outfile.write((b'\t\t<qualifier>' + plurackuplib._escapeHTML(plurk.qualifier).encode("utf-8") + b'</qualifier>\n').decode("utf-8"))
+            self._outfile.write((b'\t\t<qualifier_translated>' + plurackuplib._escapeHTML(plurk.qualifier_translated).encode("utf-8") + b'</qualifier_translated>\n').decode("utf-8"))
+            self._outfile.write((b'\t\t<content_raw><![CDATA[' + plurk.content_raw.replace("]]>","]]]]><![CDATA[>").encode("utf-8") + b']]></content_raw>\n').decode("utf-8"))
+            self._outfile.write('\t\t<responses>\n')
+            for response in plurk.responses:
+                if response.uid in people:
+                    username = people[response.uid].username
+                    displayname = people[response.uid].displayname if people[response.uid].displayname != "" else username                    
+                    self._outfile.write('\t\t\t<response id="{0}" posted_time="{1}" lang="{2}" username="{3}"'.format(str(response.rid), response.posted_time, response.lang, username))
+                    self._outfile.write((b' displayname="' + plurackuplib._escapeHTML(displayname, True).encode("utf-8") + b'">\n').decode("utf-8"))
+                else:
+                    self._outfile.write('\t\t\t<response id="{0}" posted_time="{1}" lang="{2}" unknown_user="unknown_user">\n'.format(str(response.rid), response.posted_time, response.lang))                    
+                self._outfile.write((b'\t\t\t\t<qualifier>' + plurackuplib._escapeHTML(response.qualifier).encode("utf-8") + b'</qualifier>\n').decode("utf-8"))
+                self._outfile.write((b'\t\t\t\t<qualifier_translated>' + plurackuplib._escapeHTML(response.qualifier_translated).encode("utf-8") + b'</qualifier_translated>\n').decode("utf-8"))
+                self._outfile.write((b'\t\t\t\t<content_raw><![CDATA[' + response.content_raw.replace("]]>","]]]]><![CDATA[>").encode("utf-8") + b']]></content_raw>\n').decode("utf-8"))
+                self._outfile.write('\t\t\t</response>\n')
+                              
+            self._outfile.write('\t\t</responses>\n')
+            
+            def outputMiscPeople(peopleTypeSingular, plurkKeyUsesPlural, breakCallback = None):
+                self._outfile.write('\t\t<' + peopleTypeSingular + 's>\n')
+                if not breakCallback is None:
+                    if breakCallback(getattr(plurk, peopleTypeSingular + ("s" if plurkKeyUsesPlural else ""))):
+                        return
+                    
+                for miscPerson in getattr(plurk, peopleTypeSingular + ("s" if plurkKeyUsesPlural else "")):
+                    if not miscPerson in people:
+                        self._outfile.write('\t\t\t<' + peopleTypeSingular + ' unknown_user="unknown_user" />\n')
+                    else:
+                        username = people[miscPerson].username
+                        displayname = people[miscPerson].displayname if people[miscPerson].displayname != "" else username
+                        self._outfile.write((b'\t\t\t<' + peopleTypeSingular.encode("ascii") + b' username="' + plurackuplib._escapeHTML(username, True).encode("utf-8") + b'" displayname="' + plurackuplib._escapeHTML(displayname, True).encode("utf-8") + b'" />\n').decode("utf-8"))
+    
+                self._outfile.write('\t\t</' + peopleTypeSingular + 's>\n')
+                
+            def checkAudienceListForFriend(audienceList):
+                if len(audienceList) > 0 and audienceList[0] == 0:
+                    self._outfile.write('\t\t\t<friends />\n')
+                    # it used to return without closing <limited_tos>; closed here to compare with today's writer
+                    self._outfile.write('\t\t</limited_tos>\n')
+                    return True
+                return False
+
+            outputMiscPeople("favorer", True)
+            outputMiscPeople("replurker", True)
+            outputMiscPeople("limited_to", False, checkAudienceListForFriend)
+            
+            self._outfile.write('\t</plurk>\n')
+
+
+def benchXML():
+    """ Writing 10k plurks with 100k responses into XML. """
+    plurks = syntheticPlurks(10000, 19)
+    people = syntheticPeople()
+    print("  ({0} responses)".format(sum(len(plurk.responses) for plurk in plurks)))
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        previousFilename = os.path.join(outDirectory, "previous.xml")
+        currentFilename = os.path.join(outDirectory, "current.xml")
+        baselineSeconds = _timeIt(lambda: _writeToFile(_PreviousXMLFileFront("bench"), plurks, people, previousFilename))
+        _report("small writes (previous)", baselineSeconds)
+        _report("templates, cached people, batched writes", _timeIt(lambda: _writeToFile(plurackuplib._XMLFileFront("bench"), plurks, people, currentFilename)), baselineSeconds)
+
+        if not filecmp.cmp(previousFilename, currentFilename, False):
+            raise AssertionError("_XMLFileFront writes differently than before")
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchTimestamps():
+    """ Parsing and displaying 1M plurk times. """
+    rand = random.Random(1)
+    postedTime = datetime.datetime(2013, 1, 1)
+    plurkTimes = []
+    for timeIndex in range(1000000):
+        postedTime -= datetime.timedelta(seconds = rand.randint(1, 600))
+        plurkTimes.append(postedTime.strftime("%a, %d %b %Y %H:%M:%S GMT"))
+    offsetDelta = datetime.timedelta(hours = 8)
+
+    baselineSeconds = _timeIt(lambda: [datetime.datetime.strptime(plurkTime, plurktime.PLURK_TIME_FORMAT) for plurkTime in plurkTimes])
+    _report("strptime", baselineSeconds)
+    _report("parsePlurkTime", _timeIt(lambda: [plurktime.parsePlurkTime(plurkTime) for plurkTime in plurkTimes]), baselineSeconds)
+
+    def shiftEach():
+        # what _HTMLFileFront used to do for every plurk and response
+        return [(datetime.datetime.strptime(plurkTime, plurktime.PLURK_TIME_FORMAT) + offsetDelta).strftime(plurktime.DISPLAY_TIME_FORMAT) for plurkTime in plurkTimes]
+
+    shiftedTexts = []
+    baselineSeconds = _timeIt(lambda: shiftedTexts.append(shiftEach()))
+    _report("strptime, shift, strftime", baselineSeconds)
+    timeFormatter = plurktime.ShiftedTimeFormatter(8 * 60)
+    _report("ShiftedTimeFormatter", _timeIt(lambda: shiftedTexts.append([timeFormatter.format(plurkTime) for plurkTime in plurkTimes])), baselineSeconds)
+    # a second writer going over the same, most recent, plurks
+    recentPlurkTimes = plurkTimes[-50000:] * 20
+    _report("ShiftedTimeFormatter, remembered", _timeIt(lambda: [timeFormatter.format(plurkTime) for plurkTime in recentPlurkTimes]), baselineSeconds)
+
+    if shiftedTexts[0] != shiftedTexts[1]:
+        raise AssertionError("ShiftedTimeFormatter displays times differently than strftime")
+
+
+def benchRender():
+    """ Writing 20k plurks with 200k responses into XML and HTML, in one and in several processes. """
+    plurks = syntheticPlurks(20000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+    processCount = multiprocessing.cpu_count()
+    print("  ({0} responses, {1} CPU cores)".format(sum(len(plurk.responses) for plurk in plurks), processCount))
+    if not plurackuplib._ShardedRenderer.isAvailable():
+        print("  (render processes need fork, which is not available here)")
+        return
+
+    def writeBoth(renderProcessCount, filename):
+        fileFronts = plurackuplib._MultipleFileFront(renderProcessCount)
+        fileFronts.attachFileFront(plurackuplib._XMLFileFront(filename))
+        fileFronts.attachFileFront(plurackuplib._HTMLFileFront(filename, "benchuser", "Bench <User>", 1, 8, 0, "style.css", lambda message: None))
+        fileFronts.prepare()
+        fileFronts.writePlurks(oldFirstPlurks, people)
+        fileFronts.postpare()
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        previousFilename = os.path.join(outDirectory, "previous")
+        currentFilename = os.path.join(outDirectory, "current")
+        baselineSeconds = _timeIt(lambda: writeBoth(1, previousFilename))
+        _report("one process (previous)", baselineSeconds)
+        _report("{0} render processes".format(max(processCount, 2)), _timeIt(lambda: writeBoth(max(processCount, 2), currentFilename)), baselineSeconds)
+
+        for extension in (".xml", ".html"):
+            if not filecmp.cmp(previousFilename + extension, currentFilename + extension, False):
+                raise AssertionError("render processes write " + extension + " differently than one process")
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchPagedHTML():
+    """ Writing 20k plurks with 200k responses as one HTML file and as monthly pages. """
+    plurks = syntheticPlurks(20000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+
+    def writePaged(filename):
+        fileFront = plurackuplib._PagedHTMLFileFront(filename, "benchuser", "Bench <User>", 1, 8, 0, "style.css", lambda message: None)
+        fileFront.prepare()
+        fileFront.writePlurks(oldFirstPlurks, people)
+        fileFront.postpare()
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        singleFilename = os.path.join(outDirectory, "single.html")
+        _report("one file", _timeIt(lambda: _writeToFile(plurackuplib._HTMLFileFront("bench", "benchuser", "Bench <User>", 1, 8, 0, "style.css", print), oldFirstPlurks, people, singleFilename)))
+        _report("monthly pages", _timeIt(lambda: writePaged(os.path.join(outDirectory, "paged"))))
+
+        pagesDirectory = os.path.join(outDirectory, "paged_html")
+        pageSizes = [os.path.getsize(os.path.join(pagesDirectory, pageFilename)) for pageFilename in os.listdir(pagesDirectory) if pageFilename != "style.css"]
+        print("  one file: {0:.1f} MB; {1} pages, the biggest {2:.0f} KB, index {3:.0f} KB".format(os.path.getsize(singleFilename) / 1048576.0, len(pageSizes) - 1, max(pageSizes) / 1024.0,
+                                                                                                os.path.getsize(os.path.join(pagesDirectory, "index.html")) / 1024.0))
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchCompression():
+    """ Writing 10k plurks with 100k responses into HTML, plain and through each compressor. """
+    plurks = syntheticPlurks(10000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        plainSize = None
+        for compression in ("", "gzip", "bz2", "lzma"):
+            if compression == "lzma" and plurackuplib.lzma is None:
+                continue
+            outputSink = plurackuplib._OutputSink(compression)
+            filename = os.path.join(outDirectory, compression or "plain")
+            fileFront = plurackuplib._HTMLFileFront(filename, "benchuser", "Bench <User>", 1, 8, 0, "style.css", lambda message: None, outputSink)
+
+            def write():
+                fileFront.prepare()
+                fileFront.writePlurks(oldFirstPlurks, people)
+                fileFront.postpare()
+
+            seconds = _timeIt(write)
+            size = os.path.getsize(filename + ".html" + outputSink.getExtension())
+            plainSize = size if plainSize is None else plainSize
+            print("  {0:<40} {1:9.3f} s  {2:5.1f} MB  {3:5.1f}x smaller  {4:5.1f} MB/s".format(compression or "plain", seconds, size / 1048576.0, plainSize / float(size), plainSize / 1048576.0 / seconds))
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchSQLite():
+    """ Writing 10k plurks with 100k responses into SQLite, and asking it for all responses by one person in a year. """
+    plurks = syntheticPlurks(10000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+
+    def writeOnePlurkAtATime(filename):
+        # what the simplest database writer would do: a transaction per plurk
+        fileFront = plurackuplib._SQLiteFileFront(filename)
+        fileFront.prepare()
+        for plurk in oldFirstPlurks:
+            fileFront.writePlurks([plurk], people)
+        fileFront.postpare()
+
+    def writeAll(filename):
+        fileFront = plurackuplib._SQLiteFileFront(filename)
+        fileFront.prepare()
+        fileFront.writePlurks(oldFirstPlurks, people)
+        fileFront.postpare()
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        baselineSeconds = _timeIt(lambda: writeOnePlurkAtATime(os.path.join(outDirectory, "one")))
+        _report("a transaction per plurk", baselineSeconds)
+        filename = os.path.join(outDirectory, "all")
+        _report("one batched transaction", _timeIt(lambda: writeAll(filename)), baselineSeconds)
+        _report("the same again, upserted", _timeIt(lambda: writeAll(filename)), baselineSeconds)
+
+        connection = sqlite3.connect(filename + ".sqlite")
+        query = "SELECT COUNT(*) FROM responses WHERE uid = 7 AND posted_time >= '2012-01-01' AND posted_time < '2013-01-01'"
+        responseCount = []
+        _report("responses by uid 7 in 2012", _timeIt(lambda: responseCount.append(connection.execute(query).fetchone()[0])))
+        print("  ({0} responses, {1} plurks in the database)".format(responseCount[0], connection.execute("SELECT COUNT(*) FROM plurks").fetchone()[0]))
+        connection.close()
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchJSONLines():
+    """ Archiving 10k plurks with 100k responses, and loading them back as an incremental run does: one JSON document (previous) against JSON Lines. """
+    try:
+        import tracemalloc
+    except ImportError:
+        print("  (needs python 3.4+)")
+        return
+
+    plurks = syntheticPlurks(10000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+
+    def measure(load):
+        # timed apart from the memory measurement, as tracing slows down allocating much more than parsing
+        startTime = time.time()
+        incrementalState = load()
+        seconds = time.time() - startTime
+        incrementalState = None
+        tracemalloc.start()
+        incrementalState = load()
+        peakSize = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return seconds, peakSize, incrementalState
+
+    outDirectory = tempfile.mkdtemp()
+    def load(basename):
+        # as an incremental run loads the previous backup; version 1 manifests come with the archive as one JSON document
+        incrementalState = plurackuplib._IncrementalState(os.path.join(outDirectory, basename), 30, True, True)
+        if not incrementalState.load("benchuser"):
+            raise AssertionError("no archive loaded from " + basename)
+        return incrementalState
+
+    try:
+        for basename, version in (("document", 1), ("lines", 2)):
+            outfile = codecs.open(os.path.join(outDirectory, basename + ".manifest.json"), "w", "utf-8")
+            json.dump({"version": version, "username": "benchuser", "newest_plurk_id": oldFirstPlurks[-1].plurk_id, "newest_posted_time": oldFirstPlurks[-1].posted_time, "plurks": {}}, outfile)
+            outfile.close()
+
+        def writeDocument():
+            outfile = codecs.open(os.path.join(outDirectory, "document.archive.json"), "w", "utf-8")
+            json.dump({"plurks": [plurk.toDict() for plurk in oldFirstPlurks], "people": dict((str(personId), person.toDict()) for personId, person in people.items())}, outfile)
+            outfile.close()
+        baselineSeconds = _timeIt(writeDocument)
+        _report("writing one document (previous)", baselineSeconds)
+
+        fileFront = plurackuplib._JSONLinesFileFront(os.path.join(outDirectory, "lines.archive"))
+        def writeLines():
+            fileFront.prepare()
+            fileFront.writePlurks(oldFirstPlurks, people)
+            fileFront.postpare()
+        _report("writing JSON Lines", _timeIt(writeLines), baselineSeconds)
+
+        results = []
+        for name, basename in (("loading one document (previous)", "document"), ("loading JSON Lines", "lines")):
+            seconds, peakSize, incrementalState = measure(lambda: load(basename))
+            results.append(incrementalState)
+            print("  {0:<40} {1:9.3f} s  peak {2:6.1f} MB".format(name, seconds, peakSize / 1048576.0))
+
+        if [plurk.toDict() for plurk in results[0]._archivedPlurks] != [plurk.toDict() for plurk in results[1]._archivedPlurks]:
+            raise AssertionError("JSON Lines load back different plurks")
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchRerender():
+    """ Re-rendering HTML from an XML backup of 20k plurks with 200k responses: the XML parsed whole (naive) against incrementally. """
+    try:
+        import tracemalloc
+    except ImportError:
+        print("  (needs python 3.4+)")
+        return
+
+    plurks = syntheticPlurks(20000, 19)
+    people = syntheticPeople()
+    oldFirstPlurks = list(reversed(plurks))
+
+    def measure(read):
+        # timed apart from the memory measurement, as tracing slows down allocating much more than parsing
+        seconds = _timeIt(read)
+        tracemalloc.start()
+        read()
+        peakSize = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return seconds, peakSize
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        archive = plurackuplib._XMLFileFront(os.path.join(outDirectory, "archive"))
+        archive.prepare()
+        archive.writePlurks(oldFirstPlurks, people)
+        archive.postpare()
+        archiveFilename = os.path.join(outDirectory, "archive.xml")
+
+        def readWhole():
+            reader = plurackuplib._XMLArchiveReader(archiveFilename)
+            readPeople = {}
+            return [reader._plurkOf(element, readPeople) for element in plurackuplib.ElementTree.parse(archiveFilename).getroot()]
+
+        def readIncrementally():
+            for plurk, plurkPeople in plurackuplib._XMLArchiveReader(archiveFilename):
+                pass
+
+        for name, read in (("parsing whole (naive)", readWhole), ("parsing incrementally", readIncrementally)):
+            seconds, peakSize = measure(read)
+            print("  {0:<40} {1:9.3f} s  peak {2:6.1f} MB".format(name, seconds, peakSize / 1048576.0))
+
+        agent = plurackuplib.BackupAgent("", lambda message: None, None, os.path.join(outDirectory, "rerendered"), False, True, 1, 8, 0, "style.css")
+        _report("re-rendering into HTML", _timeIt(lambda: agent.rerenderArchive(archiveFilename, "benchuser", "Bench <User>")))
+        
+        # the database re-rendered from a .jsonl backup has to be the very database backed up along with it
+        for fileFront in (plurackuplib._SQLiteFileFront(os.path.join(outDirectory, "archive")), plurackuplib._JSONLinesFileFront(os.path.join(outDirectory, "archive"))):
+            fileFront.prepare()
+            fileFront.writePlurks(oldFirstPlurks, people)
+            fileFront.postpare()
+        agent = plurackuplib.BackupAgent("", lambda message: None, None, os.path.join(outDirectory, "rerendered"), False, False, 1, 8, 0, "style.css", sqliteOut = True)
+        _report("re-rendering into SQLite", _timeIt(lambda: agent.rerenderArchive(os.path.join(outDirectory, "archive.jsonl"), "benchuser")))
+        dumps = []
+        for databaseName in ("archive.sqlite", "rerendered.sqlite"):
+            connection = sqlite3.connect(os.path.join(outDirectory, databaseName))
+            dumps.append(list(connection.iterdump()))
+            connection.close()
+        print("  re-rendered database is identical: " + str(dumps[0] == dumps[1]))
+        try:
+            agent.rerenderArchive(archiveFilename, "benchuser")
+            print("  ** re-rendering XML into SQLite was not refused")
+        except plurackuplib.PlurackupLibError:
+            print("  re-rendering XML into SQLite is refused: True")
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def _backUpInChild(engine, host, outFilename, results):
+    # runs in a process of its own, so that the peak RSS is the backup's alone
+    logTimes = {}
+    def outLog(message):
+        if message.startswith("Writing to file"):
+            logTimes["render"] = time.time()
+
+    agentClass = plurackuplib.BackupAgent
+    if engine == "asyncio":
+        import plurackupasynclib
+        agentClass = plurackupasynclib.AsyncBackupAgent
+    backupAgent = agentClass("benchkey", outLog, None, outFilename, True, True, 1, 8, 0, "style.css", responseFetcherCount = 16, timelineWindowCount = 8, apiHost = host, runReport = True)
+    startTime = time.time()
+    backupAgent.doBackup("benchuser", "benchpassword")
+    endTime = time.time()
+    try:
+        import resource
+        # ru_maxrss is in kilobytes, but in bytes on OS X
+        peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1048576.0 if sys.platform == "darwin" else 1024.0)
+    except ImportError:
+        peakRss = None
+    reportFile = open(outFilename + ".report.json")
+    latency = json.load(reportFile)["api"]["/API/Responses/get"]["seconds"]
+    reportFile.close()
+    results.put((endTime - startTime, endTime - logTimes["render"], peakRss, latency["p50"], latency["p99"]))
+
+def benchEndToEnd():
+    """ Backing up a synthetic account of 5k plurks and 40k responses end to end, from a local stand-in server with 2 ms of latency per call. """
+    account = plurkmock.SyntheticAccount(5000, 10.0, 0.2)
+    # a fresh interpreter for every backup where there are start methods to choose from, as a forked one would count this one's memory too
+    context = multiprocessing.get_context("spawn") if hasattr(multiprocessing, "get_context") else multiprocessing
+    runs = [("threads", "threads", 0.0), ("threads, 1% of calls failing", "threads", 0.01)]
+    if sys.version_info[0] >= 3:
+        runs.insert(1, ("asyncio", "asyncio", 0.0))
+
+    outDirectory = tempfile.mkdtemp()
+    try:
+        for name, engine, errorRate in runs:
+            server = plurkmock.MockPlurkServer(account, 0.002, errorRate, 30)
+            server.start()
+            try:
+                results = context.Queue()
+                process = context.Process(target = _backUpInChild, args = (engine, server.getHost(), os.path.join(outDirectory, engine), results))
+                process.start()
+                seconds, renderSeconds, peakRss, latencyP50, latencyP99 = results.get()
+                process.join()
+            finally:
+                server.stop()
+            print("  {0:<40} {1:9.3f} s  {2:6.0f} requests/s  p50/p99 {3:5.1f}/{4:5.1f} ms  render {5:6.3f} s  peak RSS {6}".format(name, seconds, server.requestCount / seconds,
+                                                                                                                                  latencyP50 * 1000, latencyP99 * 1000, renderSeconds,
+                                                                                                                                  "n/a" if peakRss is None else "{0:.1f} MB".format(peakRss)))
+    finally:
+        shutil.rmtree(outDirectory)
+
+def benchAdaptiveConcurrency():
+    """ Backing up 3k plurks with up to 64 response requests in flight from a local stand-in server which works on 12 calls at once, 20 ms each, and refuses calls beyond 24 with a 503: fixed vs adaptive concurrency. """
+    account = plurkmock.SyntheticAccount(3000, 10.0, 0.2)
+    runs = [("threads", False), ("threads", True)]
+    if sys.version_info[0] >= 3:
+        runs += [("asyncio", False), ("asyncio", True)]
+    
+    outDirectory = tempfile.mkdtemp()
+    try:
+        for engine, adaptive in runs:
+            server = plurkmock.MockPlurkServer(account, 0.02, 0.0, 30, capacity = 12)
+            server.start()
+            try:
+                if engine == "asyncio":
+                    import plurackupasynclib
+                    backupAgent = plurackupasynclib.AsyncBackupAgent("benchkey", lambda message: None, None, os.path.join(outDirectory, engine), True, False, timelineWindowCount = 4, maxAttempts = 8,
+                                                                     apiHost = server.getHost(), adaptiveConcurrency = adaptive, maxRequestsInFlight = 64)
+                else:
+                    backupAgent = plurackuplib.BackupAgent("benchkey", lambda message: None, None, os.path.join(outDirectory, engine), True, False, responseFetcherCount = 64, timelineWindowCount = 4, maxAttempts = 8,
+                                                           apiHost = server.getHost(), adaptiveConcurrency = adaptive)
+                startTime = time.time()
+                backupAgent.doBackup("benchuser", "benchpassword")
+                seconds = time.time() - startTime
+            finally:
+                server.stop()
+            limits = "" if not adaptive else "  limit {0}-{1}, {2} backoff(s)".format(backupAgent._concurrency.lowestLimit, backupAgent._concurrency.highestLimit, backupAgent._concurrency.backoffCount)
+            print("  {0:<30} {1:9.3f} s  {2:6d} requests  {3:5d} refused{4}".format(engine + (", adaptive" if adaptive else ", fixed"), seconds, server.requestCount, server.errorCount, limits))
+    finally:
+        shutil.rmtree(outDirectory)
+
+
+def benchIncremental():
+    """ Backing up 3k plurks again after their owner deleted two of the last 30 days', among them the oldest: in full against incrementally. """
+    account = plurkmock.SyntheticAccount(3000, 10.0, 0.2)
+    server = plurkmock.MockPlurkServer(account)
+    server.start()
+    outDirectory = tempfile.mkdtemp()
+    try:
+        def backUp(outFilename, incremental):
+            backupAgent = plurackuplib.BackupAgent("benchkey", lambda message: None, None, os.path.join(outDirectory, outFilename), True, True, 1, 8, 0, "style.css", incremental = incremental, incrementalLookbackDays = 30, apiHost = server.getHost())
+            return _timeIt(lambda: backupAgent.doBackup("benchuser", "benchpassword"))
+
+        backUp("incremental", True)
+        # the plurks an incremental run pages again are those posted since its horizon, 30 days before the newest plurk
+        horizon = account._postedTimes[-1] - datetime.timedelta(30)
+        recentPlurkIds = [plurk["plurk_id"] for plurk, postedDateTime in zip(account._plurks, account._postedTimes) if postedDateTime >= horizon]
+        for plurkId in (recentPlurkIds[0], recentPlurkIds[len(recentPlurkIds) // 2]):
+            account.deletePlurk(plurkId)
+
+        _report("backing up in full", backUp("full", False))
+        _report("backing up incrementally", backUp("incremental", True))
+        print("  incremental backup is identical: " + str(all(filecmp.cmp(os.path.join(outDirectory, "full" + extension), os.path.join(outDirectory, "incremental" + extension), False) for extension in (".xml", ".html"))))
+    finally:
+        server.stop()
+        shutil.rmtree(outDirectory)
+
+
+BENCHMARKS = [("storage", benchStorage), ("records", benchRecords), ("html", benchHTML), ("xml", benchXML), ("timestamps", benchTimestamps), ("render", benchRender), ("pages", benchPagedHTML), ("compression", benchCompression), ("sqlite", benchSQLite), ("jsonl", benchJSONLines), ("rerender", benchRerender), ("e2e", benchEndToEnd), ("aimd", benchAdaptiveConcurrency), ("incremental", benchIncremental)]
+
+if __name__ == "__main__":
+    selectedNames = sys.argv[1:]
+    for name, benchmark in BENCHMARKS:
+        if len(selectedNames) == 0 or name in selectedNames:
+            print(name + ": " + benchmark.__doc__.strip())
+            benchmark()
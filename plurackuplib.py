@@ -21,24 +21,150 @@
     THE SOFTWARE.
 """
 
-import cgi
-import copy
 import datetime
+import json
+import os
 import re
+import sqlite3
+import sys
+import tempfile
 import threading
+import time
+import bz2
 import codecs
+import collections
+import gzip
+import itertools
+import multiprocessing
+import zlib
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import lzma
+except ImportError:
+    # python 2 has no lzma; "lzma" compression is then not available
+    lzma = None
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    # python 3.9 dropped cElementTree; ElementTree uses the C parser by itself since 3.3
+    import xml.etree.ElementTree as ElementTree
+
+try:
+    import concurrent.futures
+except ImportError:
+    # python 2 has no concurrent.futures; plurks are then rendered in this process only
+    concurrent = None
 
 import plurklib
+import plurktime
+
+def _escapeHTML(text, quote = False):
+    # what cgi.escape did; python 3.8 dropped it
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace('"', "&quot;") if quote else text
 
 class PlurackupLibError(Exception):
     def __init__(self, value):
-        self._value = value
+        self.value = value
         
     def __str__(self):
         return repr(self.value)
-        
+
+
+class _Record(object):
+    """
+        Base of the records plurks, responses and people are kept in. Fields live in __slots__ instead of a per-record dict,
+        which is what most of the memory goes to when an account has hundreds of thousands of responses.
+        toDict()/fromDict() convert to and from the plain dicts stored in the journal and the incremental archive.
+    """
+    __slots__ = ()
+
+    def toDict(self):
+        return dict((field, getattr(self, field)) for field in self.__slots__)
+
+    @classmethod
+    def fromDict(cls, fields):
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, fields.get(field))
+        return record
+
+
+class _Person(_Record):
+    __slots__ = ("username", "displayname")
+
+    def __init__(self, username, displayname):
+        self.username = username
+        self.displayname = displayname
+
+
+class _Response(_Record):
+    # content_raw/content is None if the output format needing it was not selected
+    __slots__ = ("rid", "uid", "posted_time", "lang", "qualifier", "qualifier_translated", "content_raw", "content")
+
+    def __init__(self, rid, uid, posted_time, lang, qualifier, qualifier_translated, content_raw, content):
+        self.rid = rid
+        self.uid = uid
+        self.posted_time = posted_time
+        self.lang = lang
+        self.qualifier = qualifier
+        self.qualifier_translated = qualifier_translated
+        self.content_raw = content_raw
+        self.content = content
+
+
+class _Plurk(_Record):
+    # content_raw/content as in _Response; responses is None until they have been fetched
+    __slots__ = ("plurk_id", "posted_time", "lang", "qualifier", "qualifier_translated", "favorite_count", "favorers", "replurkers_count", "replurkers",
+                 "response_count", "limited_to", "content_raw", "content", "responses")
+
+    def __init__(self, plurk_id, posted_time, lang, qualifier, qualifier_translated, favorite_count, favorers, replurkers_count, replurkers,
+                 response_count, limited_to, content_raw, content, responses = None):
+        self.plurk_id = plurk_id
+        self.posted_time = posted_time
+        self.lang = lang
+        self.qualifier = qualifier
+        self.qualifier_translated = qualifier_translated
+        self.favorite_count = favorite_count
+        self.favorers = favorers
+        self.replurkers_count = replurkers_count
+        self.replurkers = replurkers
+        self.response_count = response_count
+        self.limited_to = limited_to
+        self.content_raw = content_raw
+        self.content = content
+        self.responses = responses
+
+    def toDict(self):
+        fields = _Record.toDict(self)
+        if self.responses is None:
+            del fields["responses"]
+        else:
+            fields["responses"] = [response.toDict() for response in self.responses]
+        return fields
+
+    @classmethod
+    def fromDict(cls, fields):
+        plurk = _Record.fromDict.__func__(cls, fields)
+        if plurk.responses is not None:
+            plurk.responses = [_Response.fromDict(response) for response in plurk.responses]
+        return plurk
+
 
 class _FileFrontInterface:
+    # whether renderPlurks and writeFragment can stand in for writePlurks
+    rendersFragments = False
+    # whether writePlurks takes plurks in any order, as often as they come, even before prepare()
+    writesInAnyOrder = False
+    # what the run report calls the output
+    formatName = ""
+    
     def __init__(self):
         raise NotImplementedError("_FileFrontInterface is an interface.")
         
@@ -50,14 +176,130 @@ class _FileFrontInterface:
         
     def writePlurks(self, plurks, people):
         raise NotImplementedError("_FileFrontInterface is an interface.")
+        
+    def renderPlurks(self, plurks, people):
+        """ Returns what writePlurks would write, as a string, for writeFragment to write later. """
+        raise NotImplementedError("_FileFrontInterface is an interface.")
+        
+    def writeFragment(self, fragment):
+        raise NotImplementedError("_FileFrontInterface is an interface.")
 
 
-class _MultipleFileFront(_FileFrontInterface):
+class _FragmentBuffer:
+    """ Stands in for an output file while rendering into a string. """
     def __init__(self):
+        self._parts = []
+        
+    def write(self, text):
+        self._parts.append(text)
+        
+    def getvalue(self):
+        return "".join(self._parts)
+
+
+class _CompressingFile:
+    """ A binary file which feeds everything written into it through a stdlib compressor object, on to fileobj. """
+    def __init__(self, fileobj, compressor, outputSink):
+        self._fileobj = fileobj
+        self._compressor = compressor
+        self._outputSink = outputSink
+        
+    def write(self, data):
+        compressed = self._compressor.compress(data)
+        self._fileobj.write(compressed)
+        self._outputSink.uncompressedByteCount += len(data)
+        self._outputSink.compressedByteCount += len(compressed)
+        
+    def flush(self):
+        self._fileobj.flush()
+        
+    def close(self):
+        compressed = self._compressor.flush()
+        self._fileobj.write(compressed)
+        self._outputSink.compressedByteCount += len(compressed)
+        self._fileobj.close()
+
+
+class _OutputSink:
+    """
+        Opens the files the text file fronts write into: plain utf-8 files, or ones written straight through
+        a streaming compressor - "gzip", "bz2" or "lzma" - with the compressor's extension appended to the filename.
+        compressionLevel is the compressor's level (its preset, for lzma); None takes the compressor's default.
+        Counts what goes in and what comes out of the compressors, over all the files it has opened.
+    """
+    EXTENSIONS = {"": "", "gzip": ".gz", "bz2": ".bz2", "lzma": ".xz"}
+    
+    def __init__(self, compression = "", compressionLevel = None):
+        if not compression in _OutputSink.EXTENSIONS:
+            raise PlurackupLibError("Unknown compression: " + compression)
+        if compression == "lzma" and lzma is None:
+            raise PlurackupLibError("lzma compression needs python 3")
+        self._compression = compression
+        self._compressionLevel = compressionLevel
+        self.uncompressedByteCount = 0
+        self.compressedByteCount = 0
+        
+    def isCompressing(self):
+        return self._compression != ""
+        
+    def getExtension(self):
+        return _OutputSink.EXTENSIONS[self._compression]
+        
+    def _createCompressor(self):
+        if self._compression == "gzip":
+            # wbits 16 + 15 makes zlib write a gzip header and trailer
+            return zlib.compressobj(self._compressionLevel if self._compressionLevel is not None else 6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if self._compression == "bz2":
+            return bz2.BZ2Compressor(self._compressionLevel if self._compressionLevel is not None else 9)
+        return lzma.LZMACompressor(preset = self._compressionLevel)
+        
+    def open(self, filename):
+        """ Returns a file to write text into; when compressing, the compressor's extension is appended to filename. """
+        if not self.isCompressing():
+            return codecs.open(filename, "w", "utf-8")
+        return codecs.getwriter("utf-8")(_CompressingFile(open(filename + self.getExtension(), "wb"), self._createCompressor(), self))
+        
+    @staticmethod
+    def openForReading(filename):
+        """ Opens filename for reading bytes; one ending in a compressor's extension is decompressed as it is read. """
+        if filename.endswith(".gz"):
+            return gzip.open(filename, "rb")
+        if filename.endswith(".bz2"):
+            return bz2.BZ2File(filename, "rb")
+        if filename.endswith(".xz"):
+            if lzma is None:
+                raise PlurackupLibError("lzma compression needs python 3")
+            return lzma.open(filename, "rb")
+        return open(filename, "rb")
+
+
+class _TextFileFront(_FileFrontInterface):
+    """ Base of the file fronts which write plain text into self._outfile. """
+    rendersFragments = True
+    
+    def renderPlurks(self, plurks, people):
+        outfile = self._outfile
+        self._outfile = _FragmentBuffer()
+        try:
+            self.writePlurks(plurks, people)
+            return self._outfile.getvalue()
+        finally:
+            self._outfile = outfile
+            
+    def writeFragment(self, fragment):
+        self._outfile.write(fragment)
+
+
+class _MultipleFileFront(_FileFrontInterface):
+    def __init__(self, renderProcessCount = 1):
         self._fileFronts = set()
+        self._renderer = _ShardedRenderer(renderProcessCount) if renderProcessCount > 1 and _ShardedRenderer.isAvailable() else None
         
     def attachFileFront(self, fileFront):
         self._fileFronts.add(fileFront)
+        
+    def getFileFronts(self):
+        return list(self._fileFronts)
     
     def prepare(self):
         for fileFront in self._fileFronts:
@@ -68,11 +310,102 @@ class _MultipleFileFront(_FileFrontInterface):
             fileFront.postpare()
         
     def writePlurks(self, plurks, people):
+        renderedFileFronts = [fileFront for fileFront in self._fileFronts if fileFront.rendersFragments] if self._renderer is not None else []
+        if len(renderedFileFronts) > 0:
+            self._renderer.writePlurks(renderedFileFronts, plurks, people)
         for fileFront in self._fileFronts:
-            fileFront.writePlurks(plurks, people)
+            if not fileFront in renderedFileFronts:
+                fileFront.writePlurks(plurks, people)
+
+
+
+class _TimedFileFront(_FileFrontInterface):
+    """ Stands in for fileFront and tells runReport how long each call into it took. """
+    def __init__(self, fileFront, runReport):
+        self._fileFront = fileFront
+        self._runReport = runReport
+        self.rendersFragments = fileFront.rendersFragments
+        self.writesInAnyOrder = fileFront.writesInAnyOrder
+        self.formatName = fileFront.formatName
+        
+    def _timed(self, func, *args):
+        startTime = time.time()
+        try:
+            return func(*args)
+        finally:
+            self._runReport.outputTimed(self.formatName, time.time() - startTime)
+        
+    def prepare(self):
+        self._timed(self._fileFront.prepare)
+        
+    def postpare(self):
+        self._timed(self._fileFront.postpare)
+        
+    def writePlurks(self, plurks, people):
+        self._timed(self._fileFront.writePlurks, plurks, people)
+        
+    def renderPlurks(self, plurks, people):
+        return self._timed(self._fileFront.renderPlurks, plurks, people)
+        
+    def writeFragment(self, fragment):
+        self._timed(self._fileFront.writeFragment, fragment)
+            
+            
+# what a render process was handed when it started: (fileFronts, plurks, people)
+_renderProcessState = None
+
+def _initRenderProcess(fileFronts, plurks, people):
+    global _renderProcessState
+    _renderProcessState = (fileFronts, plurks, people)
+    
+def _renderShard(start, end):
+    fileFronts, plurks, people = _renderProcessState
+    shard = plurks[start:end]
+    return [fileFront.renderPlurks(shard, people) for fileFront in fileFronts]
+    
+
+class _ShardedRenderer:
+    """
+        Renders plurks for several file fronts at once, in a pool of worker processes.
+        
+        The plurks are cut into shards of SHARD_SIZE, and a worker renders a shard for every file front.
+        The fragments are written out in shard order with writeFragment, so the files come out exactly
+        as if every file front had written all plurks itself.
+        Workers are forked once the plurks are in memory: they inherit the plurks, the people and the file fronts
+        instead of having them sent over, and only the shard bounds and the rendered fragments go through pipes.
+    """
+    SHARD_SIZE = 250
+    
+    def __init__(self, processCount):
+        self._processCount = processCount
+        
+    @staticmethod
+    def isAvailable():
+        # without fork, workers would start by running the main script again - plurackup.py asks questions there;
+        # ProcessPoolExecutor takes a start method context and an initializer only since python 3.7
+        return concurrent is not None and sys.version_info >= (3, 7) and "fork" in multiprocessing.get_all_start_methods()
+        
+    def writePlurks(self, fileFronts, plurks, people):
+        plurks = list(plurks)
+        executor = concurrent.futures.ProcessPoolExecutor(self._processCount, multiprocessing.get_context("fork"), _initRenderProcess, (fileFronts, plurks, people))
+        try:
+            # a few shards are rendered ahead of the one being written out; the rest wait, so fragments don't pile up in memory
+            renderings = collections.deque()
+            for start in range(0, len(plurks), _ShardedRenderer.SHARD_SIZE):
+                renderings.append(executor.submit(_renderShard, start, start + _ShardedRenderer.SHARD_SIZE))
+                if len(renderings) >= 2 * self._processCount:
+                    self._writeFragments(fileFronts, renderings.popleft().result())
+            while len(renderings) > 0:
+                self._writeFragments(fileFronts, renderings.popleft().result())
+        finally:
+            executor.shutdown()
+            
+    def _writeFragments(self, fileFronts, fragments):
+        for fileFront, fragment in zip(fileFronts, fragments):
+            fileFront.writeFragment(fragment)
             
         
-class _XMLFileFront(_FileFrontInterface):
+class _XMLFileFront(_TextFileFront):
     """
         <plurk id="" posted_time="" lang="">
             <qualifier>CDATA</qualifier>
@@ -98,74 +431,109 @@ class _XMLFileFront(_FileFrontInterface):
             </limited_tos>
         </plurk>
     """    
-    def __init__(self, filename):
+    formatName = "xml"
+    
+    def __init__(self, filename, outputSink = None):
         self._filename = filename
+        self._outputSink = outputSink if outputSink is not None else _OutputSink()
         self._outfile = None
+        self._personAttributeTexts = {}
+        self._escapedTexts = {}
         
     def prepare(self):
-        self._outfile = codecs.open(self._filename + ".xml", "w", "utf-8")
+        self._outfile = self._outputSink.open(self._filename + ".xml")
         self._outfile.write('<?xml version="1.0" encoding="utf-8"?>\n')
         self._outfile.write('<plurks>\n')
         
+    # the pieces a plurk element is made of; everything but the %s is written as it is
+    _PLURK_TEMPLATE = ('\t<plurk id="%s" posted_time="%s" lang="%s" favorite_count="%s" replurkers_count="%s">\n'
+                       '\t\t<qualifier>%s</qualifier>\n'
+                       '\t\t<qualifier_translated>%s</qualifier_translated>\n'
+                       '\t\t<content_raw><![CDATA[%s]]></content_raw>\n'
+                       '\t\t<responses>\n')
+    _RESPONSE_TEMPLATE = ('\t\t\t<response id="%s" posted_time="%s" lang="%s"%s>\n'
+                          '\t\t\t\t<qualifier>%s</qualifier>\n'
+                          '\t\t\t\t<qualifier_translated>%s</qualifier_translated>\n'
+                          '\t\t\t\t<content_raw><![CDATA[%s]]></content_raw>\n'
+                          '\t\t\t</response>\n')
+    _MISC_PERSON_TEMPLATE = '\t\t\t<%s%s />\n'
+    _UNKNOWN_USER_ATTRIBUTES = ' unknown_user="unknown_user"'
+    # the rendered text is written out whenever this many pieces have piled up
+    _WRITE_BATCH_SIZE = 4096
+    
+    def _personAttributes(self, uid, people):
+        """ The username and displayname attributes of a person, or the unknown_user one; people are escaped once and then cached by uid. """
+        attributes = self._personAttributeTexts.get(uid)
+        if attributes is None:
+            person = people.get(uid)
+            if person is None:
+                # not cached: streaming output may come to know the person later
+                return _XMLFileFront._UNKNOWN_USER_ATTRIBUTES
+            attributes = ' username="' + _escapeHTML(person.username, True) + '" displayname="' + _escapeHTML(person.displayname if person.displayname != "" else person.username, True) + '"'
+            self._personAttributeTexts[uid] = attributes
+        return attributes
+        
+    def _escapeText(self, text):
+        # qualifiers come from a small vocabulary, so they are escaped once each
+        escapedText = self._escapedTexts.get(text)
+        if escapedText is None:
+            escapedText = _escapeHTML(text)
+            self._escapedTexts[text] = escapedText
+        return escapedText
+        
+    def _renderMiscPeople(self, parts, peopleTypeSingular, uids, people):
+        parts.append('\t\t<' + peopleTypeSingular + 's>\n')
+        for uid in uids:
+            parts.append(_XMLFileFront._MISC_PERSON_TEMPLATE % (peopleTypeSingular, self._personAttributes(uid, people)))
+        parts.append('\t\t</' + peopleTypeSingular + 's>\n')
+        
+    def _renderPlurk(self, parts, plurk, people):
+        parts.append(_XMLFileFront._PLURK_TEMPLATE % (plurk.plurk_id, plurk.posted_time, plurk.lang, plurk.favorite_count, plurk.replurkers_count,
+                                                      self._escapeText(plurk.qualifier), self._escapeText(plurk.qualifier_translated), plurk.content_raw.replace("]]>", "]]]]><![CDATA[>")))
+        
+        responseTemplate = _XMLFileFront._RESPONSE_TEMPLATE
+        personAttributeTexts = self._personAttributeTexts
+        escapedTexts = self._escapedTexts
+        for response in plurk.responses:
+            # the caches are looked into right here, as this loop runs for every single response
+            parts.append(responseTemplate % (response.rid, response.posted_time, response.lang,
+                                             personAttributeTexts.get(response.uid) or self._personAttributes(response.uid, people),
+                                             escapedTexts.get(response.qualifier) or self._escapeText(response.qualifier),
+                                             escapedTexts.get(response.qualifier_translated) or self._escapeText(response.qualifier_translated),
+                                             response.content_raw.replace("]]>", "]]]]><![CDATA[>")))
+        parts.append('\t\t</responses>\n')
+        
+        self._renderMiscPeople(parts, "favorer", plurk.favorers, people)
+        self._renderMiscPeople(parts, "replurker", plurk.replurkers, people)
+        if len(plurk.limited_to) > 0 and plurk.limited_to[0] == 0:
+            parts.append('\t\t<limited_tos>\n')
+            parts.append('\t\t\t<friends />\n')
+            parts.append('\t\t</limited_tos>\n')
+        else:
+            self._renderMiscPeople(parts, "limited_to", plurk.limited_to, people)
+        parts.append('\t</plurk>\n')
+        
     def writePlurks(self, plurks, people):
         # since there is no xml manipulation, let's output the file plain-text-ly, and not using any dom modules
+        parts = []
         for plurk in plurks:
-            self._outfile.write('\t<plurk id="{0}" posted_time="{1}" lang="{2}" favorite_count="{3}" replurkers_count="{4}">\n'.format(str(plurk["plurk_id"]), plurk["posted_time"], plurk["lang"], plurk["favorite_count"], plurk["replurkers_count"]))
-            self._outfile.write((b'\t\t<qualifier>' + cgi.escape(plurk["qualifier"]).encode("utf-8") + b'</qualifier>\n').decode("utf-8"))
-            self._outfile.write((b'\t\t<qualifier_translated>' + cgi.escape(plurk["qualifier_translated"]).encode("utf-8") + b'</qualifier_translated>\n').decode("utf-8"))
-            self._outfile.write((b'\t\t<content_raw><![CDATA[' + plurk["content_raw"].replace("]]>","]]]]><![CDATA[>").encode("utf-8") + b']]></content_raw>\n').decode("utf-8"))
-            self._outfile.write('\t\t<responses>\n')
-            for response in plurk["responses"]:
-                if response["uid"] in people:
-                    username = people[response["uid"]]["username"]
-                    displayname = people[response["uid"]]["displayname"] if people[response["uid"]]["displayname"] != "" else username                    
-                    self._outfile.write('\t\t\t<response id="{0}" posted_time="{1}" lang="{2}" username="{3}"'.format(str(response["rid"]), response["posted_time"], response["lang"], username))
-                    self._outfile.write((b' displayname="' + cgi.escape(displayname, True).encode("utf-8") + b'">\n').decode("utf-8"))
-                else:
-                    self._outfile.write('\t\t\t<response id="{0}" posted_time="{1}" lang="{2}" unknown_user="unknown_user">\n'.format(str(response["rid"]), response["posted_time"], response["lang"]))                    
-                self._outfile.write((b'\t\t\t\t<qualifier>' + cgi.escape(response["qualifier"]).encode("utf-8") + b'</qualifier>\n').decode("utf-8"))
-                self._outfile.write((b'\t\t\t\t<qualifier_translated>' + cgi.escape(response["qualifier_translated"]).encode("utf-8") + b'</qualifier_translated>\n').decode("utf-8"))
-                self._outfile.write((b'\t\t\t\t<content_raw><![CDATA[' + response["content_raw"].replace("]]>","]]]]><![CDATA[>").encode("utf-8") + b']]></content_raw>\n').decode("utf-8"))
-                self._outfile.write('\t\t\t</response>\n')
-                              
-            self._outfile.write('\t\t</responses>\n')
-            
-            def outputMiscPeople(peopleTypeSingular, plurkKeyUsesPlural, breakCallback = None):
-                self._outfile.write('\t\t<' + peopleTypeSingular + 's>\n')
-                if not breakCallback is None:
-                    if breakCallback(plurk[peopleTypeSingular + ("s" if plurkKeyUsesPlural else "")]):
-                        return
-                    
-                for miscPerson in plurk[peopleTypeSingular + ("s" if plurkKeyUsesPlural else "")]:
-                    if not miscPerson in people:
-                        self._outfile.write('\t\t\t<' + peopleTypeSingular + ' unknown_user="unknown_user" />\n')
-                    else:
-                        username = people[miscPerson]["username"]
-                        displayname = people[miscPerson]["displayname"] if people[miscPerson]["displayname"] != "" else username
-                        self._outfile.write((b'\t\t\t<' + peopleTypeSingular.encode("ascii") + b' username="' + cgi.escape(username, True).encode("utf-8") + b'" displayname="' + cgi.escape(displayname, True).encode("utf-8") + b'" />\n').decode("utf-8"))
-    
-                self._outfile.write('\t\t</' + peopleTypeSingular + 's>\n')
-                
-            def checkAudienceListForFriend(audienceList):
-                if len(audienceList) > 0 and audienceList[0] == 0:
-                    self._outfile.write('\t\t\t<friends />\n')
-                    return True
-                return False
-
-            outputMiscPeople("favorer", True)
-            outputMiscPeople("replurker", True)
-            outputMiscPeople("limited_to", False, checkAudienceListForFriend)
-            
-            self._outfile.write('\t</plurk>\n')
+            self._renderPlurk(parts, plurk, people)
+            if len(parts) >= _XMLFileFront._WRITE_BATCH_SIZE:
+                self._outfile.write("".join(parts))
+                parts = []
+        self._outfile.write("".join(parts))
         
     def postpare(self):
         self._outfile.write('</plurks>')
         self._outfile.close()
         
         
-class _HTMLFileFront(_FileFrontInterface):
-    def __init__(self, filename, username, displayName, htmlTimeOffsetSign, htmlTimeOffsetHour, htmlTimeOffsetMinute, cssFilename, outLogFunc):
+class _HTMLFileFront(_TextFileFront):
+    formatName = "html"
+    
+    def __init__(self, filename, username, displayName, htmlTimeOffsetSign, htmlTimeOffsetHour, htmlTimeOffsetMinute, cssFilename, outLogFunc, outputSink = None):
         self._filename = filename
+        self._outputSink = outputSink if outputSink is not None else _OutputSink()
         self._outfile = None
         self._username = username
         self._displayName = displayName
@@ -175,134 +543,157 @@ class _HTMLFileFront(_FileFrontInterface):
         self._cssFilename = cssFilename
         self._outLogFunc = outLogFunc
         self._unknownUserDisplayName = "Unknown Plurker"
+        self._timeFormatter = plurktime.getShiftedTimeFormatter((htmlTimeOffsetHour * 60 + htmlTimeOffsetMinute) * (1 if htmlTimeOffsetSign == 1 else -1))
+        self._ownerFragment = _HTMLFileFront._PERSON_TEMPLATE % (_escapeHTML(username, True), _escapeHTML(displayName))
+        self._unknownUserFragment = '<span class="plurk_name">' + self._unknownUserDisplayName + '</span>'
+        self._personFragments = {}
+        self._qualifierFragments = {}
+        self._plurkId36s = {}
         
-    def prepare(self):
+    def _readStylesheet(self):
         try:
             cssFile = codecs.open(self._cssFilename, "r", "utf-8")
         except IOError:
             self._outLogFunc("** Warning: Could not open stylesheet file; the output HTML will be ugly.")
-            cssContent = ""
-        else:
-            cssContent = cssFile.read()
-            cssFile.close()
+            return None
+        cssContent = cssFile.read()
+        cssFile.close()
+        return cssContent
+        
+    def _headText(self, title, styleElement):
+        return ('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+                '\t<head>\n'
+                '\t\t<meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />\n'
+                '\t\t<title>' + title + '</title>\n' +
+                styleElement +
+                '\t</head>\n'
+                '\t<body>\n'
+                '\t\t<h1>' + title + '</h1>\n')
+        
+    def prepare(self):
+        cssContent = self._readStylesheet()
+        
+        self._outfile = self._outputSink.open(self._filename + ".html")
+        self._outfile.write(self._headText(self._displayName + "'s plurk Backup", '\t\t<style type="text/css">\n' + (cssContent if cssContent is not None else "") + '\t\t</style>\n'))
+        self._outfile.write(_HTMLFileFront._TIMESTAMP_NOTE)
+        
+    # the pieces a plurk block is made of; everything but the %s is written as it is
+    _PLURK_TEMPLATE = ('\n'
+                       '\t\t<div class="plurk_block">\n'
+                       '\t\t\t<table class="pb_plurk">\n'
+                       '\t\t\t\t<tr>\n'
+                       '\t\t\t\t\t<td class="pb_plurk_name_qualifier">%s%s</td>\n'
+                       '\t\t\t\t\t\t<td class="pb_plurk_content">%s<br />\n'
+                       '\t\t\t\t\t\t\t<p class="pb_plurk_timestamp_and_other_stats"><a href="http://www.plurk.com/p/%s">%s</a> - %s response(s) - %s favorite(s) - %s replurker(s)</p>\n'
+                       '\t\t\t\t\t\t</td>\n'
+                       '\t\t\t\t</tr>\n'
+                       '\t\t\t</table>\n'
+                       '\t\t\t\n'
+                       '\t\t\t<hr class="pb_hr" />\n'
+                       '\t\t\t\n'
+                       '\t\t\t<div class="pb_responseoffset">\n')
+    _RESPONSE_TEMPLATE = ('\t\t\t\t<table class="pb_response pb_response_bg%s%s">\n'
+                          '\t\t\t\t\t<tr>\n'
+                          '\t\t\t\t\t\t<td class="pb_response_name_qualifier">%s%s</td>\n'
+                          '\t\t\t\t\t\t<td class="pb_response_content">%s<br />\n'
+                          '\t\t\t\t\t\t\t<p class="pb_response_timestamp">%s</p>\n'
+                          '\t\t\t\t\t\t</td>\n'
+                          '\t\t\t\t\t</tr>\n'
+                          '\t\t\t\t</table>\n')
+    _RESPONSES_END = ('\t\t\t</div>\n'
+                      '\t\t\t<hr class="pb_hr" />\n'
+                      '\t\t\t<table class="pb_misc_people">\n')
+    _MISC_PEOPLE_TEMPLATE = ('\t\t\t\t<tr>\n'
+                             '\t\t\t\t\t<th>%s</th>\n'
+                             '\t\t\t\t\t<td>\n'
+                             '%s')
+    _MISC_PEOPLE_END = ('\t\t\t\t\t</td>\n'
+                        '\t\t\t\t</tr>\n')
+    _PLURK_END = ('\t\t\t</table>\n'
+                  '\t\t</div>\n')
+    _PERSON_TEMPLATE = '<a href="http://www.plurk.com/%s" class="plurk_name">%s</a>'
+    _TIMESTAMP_NOTE = ('\t\t<p class="smallnote">\n'
+                       '\t\t\tClick on a plurk\'s timestamp to go to its page on plurk.com .\n'
+                       '\t\t</p>\n')
+    _B36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+    # the rendered text is written out whenever this many pieces have piled up
+    _WRITE_BATCH_SIZE = 4096
+    
+    def _personFragment(self, uid, people):
+        """ The linked name of a person, or the unknown user's; people are rendered once and then cached by uid. """
+        fragment = self._personFragments.get(uid)
+        if fragment is None:
+            person = people.get(uid)
+            if person is None:
+                # not cached: streaming output may come to know the person later
+                return self._unknownUserFragment
+            fragment = _HTMLFileFront._PERSON_TEMPLATE % (_escapeHTML(person.username, True), _escapeHTML(person.displayname if person.displayname != "" else person.username))
+            self._personFragments[uid] = fragment
+        return fragment
+        
+    def _qualifierFragment(self, qualifier, qualifierTranslated):
+        fragment = self._qualifierFragments.get((qualifier, qualifierTranslated))
+        if fragment is None:
+            fragment = ' <span class="' + (("qualifier qualifier_" + _escapeHTML(qualifier, True)) if qualifier != "" and qualifier != ":" else "") + '">' + _escapeHTML(qualifierTranslated) + '</span>'
+            self._qualifierFragments[(qualifier, qualifierTranslated)] = fragment
+        return fragment
         
-        self._outfile = codecs.open(self._filename + ".html", "w", "utf-8")
-        self._outfile.write('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n')
-        self._outfile.write('<html xmlns="http://www.w3.org/1999/xhtml">\n')
-        self._outfile.write('\t<head>\n')
-        self._outfile.write('\t\t<meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />\n')
-        self._outfile.write((b'\t\t<title>' + self._displayName.encode("utf-8") + b'\'s plurk Backup</title>\n').decode("utf-8"))
-        self._outfile.write('\t\t<style type="text/css">\n')
-        self._outfile.write(cssContent)
-        self._outfile.write('\t\t</style>\n')
-        self._outfile.write('\t</head>\n')
-        self._outfile.write('\t<body>\n')
-        self._outfile.write((b'\t\t<h1>' + self._displayName.encode("utf-8") + b'\'s plurk Backup</h1>\n').decode("utf-8"))
-        self._outfile.write('\t\t<p class="smallnote">\n')
-        self._outfile.write('\t\t\tClick on a plurk\'s timestamp to go to its page on plurk.com .\n')
-        self._outfile.write('\t\t</p>\n')
+    def _plurkId36(self, plurkId):
+        plurkId36 = self._plurkId36s.get(plurkId)
+        if plurkId36 is None:
+            digits = []
+            remainder = plurkId
+            while remainder:
+                remainder, digit = divmod(remainder, 36)
+                digits.append(_HTMLFileFront._B36_DIGITS[digit])
+            plurkId36 = "".join(reversed(digits))
+            self._plurkId36s[plurkId] = plurkId36
+        return plurkId36
+        
+    def _renderMiscPeople(self, parts, typeText, uids, people):
+        if len(uids) == 0:
+            return
+        parts.append(_HTMLFileFront._MISC_PEOPLE_TEMPLATE % (typeText, "\t\t\t\t\t\t" + ", ".join([self._personFragment(uid, people) for uid in uids]) + "\n"))
+        parts.append(_HTMLFileFront._MISC_PEOPLE_END)
+        
+    def _renderPlurk(self, parts, plurk, people):
+        parts.append(_HTMLFileFront._PLURK_TEMPLATE % (self._ownerFragment, self._qualifierFragment(plurk.qualifier, plurk.qualifier_translated), plurk.content,
+                                                       self._plurkId36(plurk.plurk_id), self._timeFormatter.format(plurk.posted_time), len(plurk.responses), plurk.favorite_count, plurk.replurkers_count))
+        
+        responseTemplate = _HTMLFileFront._RESPONSE_TEMPLATE
+        unknownUserFragment = self._unknownUserFragment
+        personFragments = self._personFragments
+        qualifierFragments = self._qualifierFragments
+        formatTime = self._timeFormatter.format
+        rowAlternating = 0
+        for response in plurk.responses:
+            # the caches are looked into right here, as this loop runs for every single response
+            personFragment = personFragments.get(response.uid) or self._personFragment(response.uid, people)
+            qualifierFragment = qualifierFragments.get((response.qualifier, response.qualifier_translated)) or self._qualifierFragment(response.qualifier, response.qualifier_translated)
+            parts.append(responseTemplate % (rowAlternating, " pb_response_unknown_user" if personFragment is unknownUserFragment else "", personFragment,
+                                             qualifierFragment, response.content, formatTime(response.posted_time)))
+            rowAlternating ^= 1
+            
+        parts.append(_HTMLFileFront._RESPONSES_END)
+        self._renderMiscPeople(parts, "Favorers", plurk.favorers, people)
+        self._renderMiscPeople(parts, "Replurkers", plurk.replurkers, people)
+        if len(plurk.limited_to) > 0 and plurk.limited_to[0] == 0:
+            # this row has always been left unclosed; kept that way so that backups stay byte-identical
+            parts.append(_HTMLFileFront._MISC_PEOPLE_TEMPLATE % ("Audience", "\t\t\t\t\t\t(friends)\n"))
+        else:
+            self._renderMiscPeople(parts, "Audience", plurk.limited_to, people)
+        parts.append(_HTMLFileFront._PLURK_END)
         
     def writePlurks(self, plurks, people):
-        timeZoneDelta = datetime.timedelta(hours = self._htmlTimeOffsetHour, minutes = self._htmlTimeOffsetMinute)
-
         # since there is no html manipulation, let's output the file plain-text-ly, and not using any dom modules
+        parts = []
         for plurk in plurks:
-            plurkTime = datetime.datetime.strptime(plurk["posted_time"], "%a, %d %b %Y %H:%M:%S %Z")
-            if self._htmlTimeOffsetSign == 1:
-                plurkTime += timeZoneDelta
-            else:
-                plurkTime -= timeZoneDelta
-                
-            plurk_id = plurk["plurk_id"]
-            b36chars = '0123456789abcdefghijklmnopqrstuvwxyz'
-            plurkID36 = ""
-            while plurk_id:
-                plurk_id, mod = divmod(plurk_id, 36)
-                plurkID36 = b36chars[mod] + plurkID36
-
-            self._outfile.write('\n')
-            self._outfile.write('\t\t<div class="plurk_block">\n')
-            self._outfile.write('\t\t\t<table class="pb_plurk">\n')
-            self._outfile.write('\t\t\t\t<tr>\n')
-            self._outfile.write((b'\t\t\t\t\t<td class="pb_plurk_name_qualifier"><a href="http://www.plurk.com/' + cgi.escape(self._username, True).encode("ascii") + b'" class="plurk_name">' + cgi.escape(self._displayName).encode("utf-8") + b'</a> <span class="' + ((b"qualifier qualifier_" + cgi.escape(plurk["qualifier"], True).encode("utf-8")) if plurk["qualifier"] != "" and plurk["qualifier"] != ":" else b"" ) + b'">' + cgi.escape(plurk["qualifier_translated"]).encode("utf-8") + b'</span></td>\n').decode("utf-8"))
-            self._outfile.write((b'\t\t\t\t\t\t<td class="pb_plurk_content">' + plurk["content"].encode("utf-8") + b'<br />\n').decode("utf-8"))
-            self._outfile.write('\t\t\t\t\t\t\t<p class="pb_plurk_timestamp_and_other_stats"><a href="http://www.plurk.com/p/' + plurkID36 + '">' + plurkTime.strftime("%Y-%m-%d %H:%M:%S") + '</a> - ' + str(len(plurk["responses"])) + ' response(s) - ' + str(plurk["favorite_count"]) + ' favorite(s) - ' + str(plurk["replurkers_count"]) + ' replurker(s)</p>\n')
-            self._outfile.write('\t\t\t\t\t\t</td>\n')
-            self._outfile.write('\t\t\t\t</tr>\n')
-            self._outfile.write('\t\t\t</table>\n')
-            self._outfile.write('\t\t\t\n')
-            self._outfile.write('\t\t\t<hr class="pb_hr" />\n')
-            self._outfile.write('\t\t\t\n')
-            
-            self._outfile.write('\t\t\t<div class="pb_responseoffset">\n')
-            
-            rowAlternating = 0
-            for response in plurk["responses"]:
-                responseTime = datetime.datetime.strptime(response["posted_time"], "%a, %d %b %Y %H:%M:%S %Z")
-                if self._htmlTimeOffsetSign == 1:
-                    responseTime += timeZoneDelta
-                else:
-                    responseTime -= timeZoneDelta                
-                
-                if not response["uid"] in people:
-                    self._outfile.write('\t\t\t\t<table class="pb_response pb_response_bg' + str(rowAlternating) + ' pb_response_unknown_user">\n')
-                    self._outfile.write('\t\t\t\t\t<tr>\n')
-                    self._outfile.write('\t\t\t\t\t\t<td class="pb_response_name_qualifier"><span class="plurk_name">' + self._unknownUserDisplayName + '</span>')
-                else:
-                    username = people[response["uid"]]["username"]
-                    displayname = people[response["uid"]]["displayname"] if people[response["uid"]]["displayname"] != "" else username
-                    self._outfile.write('\t\t\t\t<table class="pb_response pb_response_bg' + str(rowAlternating) + '">\n')
-                    self._outfile.write('\t\t\t\t\t<tr>\n')
-                    self._outfile.write((b'\t\t\t\t\t\t<td class="pb_response_name_qualifier"><a href="http://www.plurk.com/' + cgi.escape(username, True).encode("utf-8") + b'" class="plurk_name">' + cgi.escape(displayname).encode("utf-8") + b'</a>').decode("utf-8"))
-
-                self._outfile.write((b' <span class="' + ((b"qualifier qualifier_" + cgi.escape(response["qualifier"], True).encode("utf-8")) if response["qualifier"] != "" and response["qualifier"] != ":" else b"" ) + b'">' + cgi.escape(response["qualifier_translated"]).encode("utf-8") + b'</span></td>\n').decode("utf-8"))
-                self._outfile.write((b'\t\t\t\t\t\t<td class="pb_response_content">' + response["content"].encode("utf-8") + b'<br />\n').decode("utf-8"))
-                self._outfile.write('\t\t\t\t\t\t\t<p class="pb_response_timestamp">' + responseTime.strftime("%Y-%m-%d %H:%M:%S") + '</p>\n')
-                self._outfile.write('\t\t\t\t\t\t</td>\n')
-                self._outfile.write('\t\t\t\t\t</tr>\n')
-                self._outfile.write('\t\t\t\t</table>\n')
-
-                rowAlternating = (rowAlternating + 1) % 2
-                              
-            self._outfile.write('\t\t\t</div>\n')
-            self._outfile.write('\t\t\t<hr class="pb_hr" />\n')
-            self._outfile.write('\t\t\t<table class="pb_misc_people">\n')
-            
-            def outputMiscPeople(plurkKey, typeText, breakCallback = None):
-                if len(plurk[plurkKey]) > 0:
-                    self._outfile.write('\t\t\t\t<tr>\n')
-                    self._outfile.write('\t\t\t\t\t<th>' + typeText + '</th>\n')
-                    self._outfile.write('\t\t\t\t\t<td>\n')
-                    
-                    if not breakCallback is None:
-                        if breakCallback(plurk[plurkKey]):
-                            return
-    
-                    buffer_to_write = '\t\t\t\t\t\t'
-                    for miscPerson in plurk[plurkKey]:
-                        if not miscPerson in people:
-                            buffer_to_write += '<span class="plurk_name">' + self._unknownUserDisplayName + '</span>, '
-                        else:
-                            username = people[miscPerson]["username"]
-                            displayname = people[miscPerson]["displayname"] if people[miscPerson]["displayname"] != "" else username
-                            buffer_to_write += (b'<a href="http://www.plurk.com/' + cgi.escape(username, True).encode("utf-8") + b'" class="plurk_name">' + cgi.escape(displayname).encode("utf-8") + b'</a>, ').decode("utf-8")
-                    buffer_to_write = buffer_to_write[:-2]    # get rid of trailing ", "...stupid but works
-                    self._outfile.write(buffer_to_write + '\n')
-                    self._outfile.write('\t\t\t\t\t</td>\n')
-                    self._outfile.write('\t\t\t\t</tr>\n')  
-                
-            def checkAudienceListForFriend(audienceList):
-                if audienceList[0] == 0:
-                    self._outfile.write('\t\t\t\t\t\t(friends)\n')
-                    return True
-                return False
-
-            outputMiscPeople("favorers", "Favorers")
-            outputMiscPeople("replurkers", "Replurkers")
-            outputMiscPeople("limited_to", "Audience", checkAudienceListForFriend)
-
-            self._outfile.write('\t\t\t</table>\n')
-            self._outfile.write('\t\t</div>\n')        
+            self._renderPlurk(parts, plurk, people)
+            if len(parts) >= _HTMLFileFront._WRITE_BATCH_SIZE:
+                self._outfile.write("".join(parts))
+                parts = []
+        self._outfile.write("".join(parts))
         
     def postpare(self):
         self._outfile.write('\t</body>\n')
@@ -310,155 +701,1764 @@ class _HTMLFileFront(_FileFrontInterface):
         self._outfile.close()        
 
 
+class _PagedHTMLFileFront(_HTMLFileFront):
+    """
+        Writes the HTML backup as a directory, filename + "_html", instead of one big file:
+            index.html     lists the pages, with the time span and the plurk and response counts of each
+            YYYY-MM.html   a page per month of plurks (in the displayed timezone), or, with plurksPerPage,
+            pageNNNN.html  a page per plurksPerPage plurks; either way with links to the previous and next page
+            style.css      the stylesheet, shared by all of them instead of inlined into each
+        A page is kept in memory until the next one begins, so that its link to the next page can be written.
+        Pages are not rendered into fragments, so this file front can't be used with streaming output.
+    """
+    rendersFragments = False
+    formatName = "html_paged"
+    
+    _PAGE_NAVIGATION_TEMPLATE = '\t\t<p class="page_navigation">%s</p>\n'
+    
+    def __init__(self, filename, username, displayName, htmlTimeOffsetSign, htmlTimeOffsetHour, htmlTimeOffsetMinute, cssFilename, outLogFunc, plurksPerPage = 0):
+        _HTMLFileFront.__init__(self, filename, username, displayName, htmlTimeOffsetSign, htmlTimeOffsetHour, htmlTimeOffsetMinute, cssFilename, outLogFunc)
+        self._directory = filename + "_html"
+        self._plurksPerPage = plurksPerPage
+        self._pages = []    # [[pageFilename, label, first displayed time, last displayed time, plurk count, response count]]
+        self._pageParts = []
+        
+    def getIndexFilename(self):
+        return os.path.join(self._directory, "index.html")
+        
+    def prepare(self):
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        cssContent = self._readStylesheet()
+        if cssContent is not None:
+            cssFile = codecs.open(os.path.join(self._directory, "style.css"), "w", "utf-8")
+            cssFile.write(cssContent)
+            cssFile.close()
+            
+    def renderPlurks(self, plurks, people):
+        raise PlurackupLibError("Paged HTML output can't be rendered into fragments")
+        
+    def writeFragment(self, fragment):
+        raise PlurackupLibError("Paged HTML output can't be rendered into fragments")
+        
+    def _pageOf(self, displayedTime):
+        """ Returns the [pageFilename, label] of the page a plurk displayed at displayedTime goes on, after the current one. """
+        if self._plurksPerPage > 0:
+            if len(self._pages) > 0 and self._pages[-1][4] < self._plurksPerPage:
+                return self._pages[-1][:2]
+            return ["page%04d.html" % (len(self._pages) + 1), "Page " + str(len(self._pages) + 1)]
+        return [displayedTime[:7] + ".html", displayedTime[:7]]
+        
+    def writePlurks(self, plurks, people):
+        for plurk in plurks:
+            displayedTime = self._timeFormatter.format(plurk.posted_time)
+            page = self._pageOf(displayedTime)
+            if len(self._pages) == 0 or page[0] != self._pages[-1][0]:
+                if len(self._pages) > 0:
+                    self._writePage(len(self._pages) - 1, page)
+                self._pages.append(page + [displayedTime, displayedTime, 0, 0])
+            self._pages[-1][3] = displayedTime
+            self._pages[-1][4] += 1
+            self._pages[-1][5] += len(plurk.responses)
+            self._renderPlurk(self._pageParts, plurk, people)
+            
+    def _pageNavigation(self, pageIndex, nextPage):
+        links = []
+        if pageIndex > 0:
+            links.append('<a href="' + self._pages[pageIndex - 1][0] + '">&laquo; ' + self._pages[pageIndex - 1][1] + '</a>')
+        links.append('<a href="index.html">Index</a>')
+        if nextPage is not None:
+            links.append('<a href="' + nextPage[0] + '">' + nextPage[1] + ' &raquo;</a>')
+        return _PagedHTMLFileFront._PAGE_NAVIGATION_TEMPLATE % " | ".join(links)
+        
+    def _writePage(self, pageIndex, nextPage):
+        pageFilename, label = self._pages[pageIndex][:2]
+        navigation = self._pageNavigation(pageIndex, nextPage)
+        pageFile = codecs.open(os.path.join(self._directory, pageFilename), "w", "utf-8")
+        pageFile.write(self._headText(self._displayName + "'s plurk Backup - " + label, '\t\t<link rel="stylesheet" type="text/css" href="style.css" />\n'))
+        pageFile.write(_HTMLFileFront._TIMESTAMP_NOTE)
+        pageFile.write(navigation)
+        pageFile.write("".join(self._pageParts))
+        pageFile.write(navigation)
+        pageFile.write('\t</body>\n')
+        pageFile.write('</html>')
+        pageFile.close()
+        self._pageParts = []
+        
+    def postpare(self):
+        if len(self._pages) > 0:
+            self._writePage(len(self._pages) - 1, None)
+            
+        indexFile = codecs.open(self.getIndexFilename(), "w", "utf-8")
+        indexFile.write(self._headText(self._displayName + "'s plurk Backup", '\t\t<link rel="stylesheet" type="text/css" href="style.css" />\n'))
+        indexFile.write('\t\t<p class="smallnote">\n')
+        indexFile.write('\t\t\t' + str(sum(page[4] for page in self._pages)) + ' plurk(s) and ' + str(sum(page[5] for page in self._pages)) + ' response(s) on ' + str(len(self._pages)) + ' page(s).\n')
+        indexFile.write('\t\t</p>\n')
+        indexFile.write('\t\t<table class="page_index">\n')
+        indexFile.write('\t\t\t<tr><th>Page</th><th>From</th><th>To</th><th>Plurks</th><th>Responses</th></tr>\n')
+        for pageFilename, label, firstTime, lastTime, plurkCount, responseCount in self._pages:
+            indexFile.write('\t\t\t<tr><td class="page_index_page"><a href="%s">%s</a></td><td>%s</td><td>%s</td><td>%d</td><td>%d</td></tr>\n' % (pageFilename, label, firstTime[:10], lastTime[:10], plurkCount, responseCount))
+        indexFile.write('\t\t</table>\n')
+        indexFile.write('\t</body>\n')
+        indexFile.write('</html>')
+        indexFile.close()
+        
+        
+class _SQLiteFileFront(_FileFrontInterface):
+    """
+        Writes the backup into a SQLite database, filename + ".sqlite":
+            plurks(plurk_id, posted_time, lang, qualifier, qualifier_translated, favorite_count, replurkers_count, response_count, content_raw, content)
+            responses(response_id, plurk_id, uid, posted_time, lang, qualifier, qualifier_translated, content_raw, content)
+            people(uid, username, displayname)  # displayname as given by plurk, i.e. may be ""
+            favorers(plurk_id, uid), replurkers(plurk_id, uid), limited_tos(plurk_id, uid)  # a limited_tos uid of 0 means friends only
+        posted_time is "YYYY-mm-dd HH:MM:SS" in UTC, so that it sorts and compares as times do.
+        posted_time, uid and plurk_id are indexed.
+        
+        An existing database is updated in place: plurks, responses and people are upserted by their ids, and the
+        favorers, replurkers and limited_tos of a written plurk replace its old ones. Nothing is ever deleted otherwise,
+        so responses which failed to be fetched in this run keep what earlier runs stored.
+        Every writePlurks call is one transaction. Since plurks are keyed by id, they can be written in any order,
+        even before prepare() - streamed pages are written into the database as soon as they complete.
+    """
+    rendersFragments = False
+    writesInAnyOrder = True
+    
+    _SCHEMA = ("CREATE TABLE IF NOT EXISTS plurks (plurk_id INTEGER PRIMARY KEY, posted_time TEXT NOT NULL, lang TEXT, qualifier TEXT, qualifier_translated TEXT, "
+               "favorite_count INTEGER, replurkers_count INTEGER, response_count INTEGER, content_raw TEXT, content TEXT)",
+               "CREATE TABLE IF NOT EXISTS responses (response_id INTEGER PRIMARY KEY, plurk_id INTEGER NOT NULL, uid INTEGER, posted_time TEXT NOT NULL, lang TEXT, "
+               "qualifier TEXT, qualifier_translated TEXT, content_raw TEXT, content TEXT)",
+               "CREATE TABLE IF NOT EXISTS people (uid INTEGER PRIMARY KEY, username TEXT, displayname TEXT)",
+               "CREATE TABLE IF NOT EXISTS favorers (plurk_id INTEGER NOT NULL, uid INTEGER NOT NULL, PRIMARY KEY (plurk_id, uid))",
+               "CREATE TABLE IF NOT EXISTS replurkers (plurk_id INTEGER NOT NULL, uid INTEGER NOT NULL, PRIMARY KEY (plurk_id, uid))",
+               "CREATE TABLE IF NOT EXISTS limited_tos (plurk_id INTEGER NOT NULL, uid INTEGER NOT NULL, PRIMARY KEY (plurk_id, uid))",
+               "CREATE INDEX IF NOT EXISTS plurks_posted_time ON plurks (posted_time)",
+               "CREATE INDEX IF NOT EXISTS responses_plurk_id ON responses (plurk_id)",
+               "CREATE INDEX IF NOT EXISTS responses_uid ON responses (uid)",
+               "CREATE INDEX IF NOT EXISTS responses_posted_time ON responses (posted_time)",
+               "CREATE INDEX IF NOT EXISTS favorers_uid ON favorers (uid)",
+               "CREATE INDEX IF NOT EXISTS replurkers_uid ON replurkers (uid)",
+               "CREATE INDEX IF NOT EXISTS limited_tos_uid ON limited_tos (uid)")
+    _PEOPLE_TABLES = (("favorers", "favorers"), ("replurkers", "replurkers"), ("limited_tos", "limited_to"))
+    formatName = "sqlite"
+    
+    def __init__(self, filename):
+        self._filename = filename
+        self._connection = None
+        self._writtenUids = set()
+        self._timeFormatter = plurktime.getShiftedTimeFormatter(0)
+        
+    def _connect(self):
+        if self._connection is None:
+            # streamed pages are written by whichever fetching thread completes them, one at a time
+            self._connection = sqlite3.connect(self._filename + ".sqlite", check_same_thread = False)
+            with self._connection:
+                for statement in _SQLiteFileFront._SCHEMA:
+                    self._connection.execute(statement)
+        return self._connection
+        
+    def prepare(self):
+        self._connect()
+        
+    def postpare(self):
+        self._connect().close()
+        self._connection = None
+        
+    def renderPlurks(self, plurks, people):
+        raise PlurackupLibError("The SQLite database can't be rendered into fragments")
+        
+    def writeFragment(self, fragment):
+        raise PlurackupLibError("The SQLite database can't be rendered into fragments")
+        
+    def writePlurks(self, plurks, people):
+        connection = self._connect()
+        formatTime = self._timeFormatter.format
+        plurks = list(plurks)
+        newUids = [uid for uid in people if not uid in self._writtenUids]
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO people VALUES (?, ?, ?)", ((uid, people[uid].username, people[uid].displayname) for uid in newUids))
+            connection.executemany("INSERT OR REPLACE INTO plurks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   ((plurk.plurk_id, formatTime(plurk.posted_time), plurk.lang, plurk.qualifier, plurk.qualifier_translated,
+                                     plurk.favorite_count, plurk.replurkers_count, plurk.response_count, plurk.content_raw, plurk.content) for plurk in plurks))
+            connection.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   ((response.rid, plurk.plurk_id, response.uid, formatTime(response.posted_time), response.lang, response.qualifier, response.qualifier_translated,
+                                     response.content_raw, response.content) for plurk in plurks for response in plurk.responses))
+            for table, plurkKey in _SQLiteFileFront._PEOPLE_TABLES:
+                connection.executemany("DELETE FROM " + table + " WHERE plurk_id = ?", ((plurk.plurk_id,) for plurk in plurks))
+                connection.executemany("INSERT OR IGNORE INTO " + table + " VALUES (?, ?)", ((plurk.plurk_id, uid) for plurk in plurks for uid in getattr(plurk, plurkKey)))
+        self._writtenUids.update(newUids)
+        
+        
+class _JSONLinesFileFront(_TextFileFront):
+    """
+        Writes filename + ".jsonl", one plurk per line, old-entry-first:
+            {"plurk": PLURK, "people": {"uid": PERSON}}
+        PLURK is _Plurk.toDict(), responses included, and PERSON is _Person.toDict(). people are the ones the plurk's responses,
+        favorers, replurkers and limited_tos refer to, as far as they are known, so that every line can be read on its own.
+        JSON never has a raw newline inside a value, so _JSONLinesReader can read the file back one plurk at a time.
+    """
+    formatName = "jsonl"
+    # the rendered lines are written out whenever this many have piled up
+    _WRITE_BATCH_SIZE = 1024
+    
+    def __init__(self, filename, outputSink = None):
+        self._filename = filename
+        self._outputSink = outputSink if outputSink is not None else _OutputSink()
+        self._outfile = None
+        self._encoder = json.JSONEncoder(ensure_ascii = False, separators = (",", ":"))
+        self._personTexts = {}
+        
+    def prepare(self):
+        self._outfile = self._outputSink.open(self._filename + ".jsonl")
+        
+    def _personText(self, uid, people):
+        """ The '"uid":PERSON' member of a person, or None if the person is not known; people are encoded once and then cached by uid. """
+        personText = self._personTexts.get(uid)
+        if personText is None:
+            person = people.get(uid)
+            if person is None:
+                # not cached: streaming output may come to know the person later
+                return None
+            personText = '"' + str(uid) + '":' + self._encoder.encode(person.toDict())
+            self._personTexts[uid] = personText
+        return personText
+        
+    def _renderPlurk(self, plurk, people):
+        personTexts = []
+        seenUids = set()
+        for uid in itertools.chain((response.uid for response in plurk.responses), plurk.favorers, plurk.replurkers, plurk.limited_to):
+            if not uid in seenUids:
+                seenUids.add(uid)
+                personText = self._personText(uid, people)
+                if personText is not None:
+                    personTexts.append(personText)
+        return '{"plurk":' + self._encoder.encode(plurk.toDict()) + ',"people":{' + ",".join(personTexts) + '}}\n'
+        
+    def writePlurks(self, plurks, people):
+        lines = []
+        for plurk in plurks:
+            lines.append(self._renderPlurk(plurk, people))
+            if len(lines) >= _JSONLinesFileFront._WRITE_BATCH_SIZE:
+                self._outfile.write("".join(lines))
+                lines = []
+        self._outfile.write("".join(lines))
+        
+    def postpare(self):
+        self._outfile.close()
+        
+        
+class _JSONLinesReader:
+    """
+        Reads a file written by _JSONLinesFileFront back one line at a time, so that only the records made of it are held
+        in memory, never the whole parsed file besides them. A .gz, .bz2 or .xz file is decompressed as it is read.
+        A line which isn't valid JSON raises ValueError.
+    """
+    def __init__(self, filename):
+        self._filename = filename
+        
+    def __iter__(self):
+        """ Yields (plurk, people) for each line, old-entry-first. """
+        infile = _OutputSink.openForReading(self._filename)
+        # every line repeats the people it refers to; each of them is made into a record only once
+        knownPeople = {}
+        try:
+            # the file is split into lines as bytes: decoded text would also break at the unicode line separators
+            for line in infile:
+                if line.strip() == b"":
+                    continue
+                record = json.loads(line.decode("utf-8"))
+                people = {}
+                for uid, person in record["people"].items():
+                    knownPerson = knownPeople.get(uid)
+                    if knownPerson is None:
+                        knownPerson = knownPeople[uid] = (int(uid), _Person.fromDict(person))
+                    people[knownPerson[0]] = knownPerson[1]
+                yield _Plurk.fromDict(record["plurk"]), people
+        finally:
+            infile.close()
+        
+        
+class _UnclosedLimitedTosFixingFile:
+    """
+        Reads an XML backup as bytes, closing the <limited_tos> of friends-only plurks, which earlier versions left open
+        (<friends /> was followed right by </plurk>), so that backups written by them can be parsed too.
+    """
+    _FRIENDS_LINE = b"\t\t\t<friends />\n"
+    _PLURK_END_LINE = b"\t</plurk>\n"
+    _LIMITED_TOS_END_LINE = b"\t\t</limited_tos>\n"
+    
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._previousLine = b""
+        self._buffer = b""
+        
+    def read(self, size = -1):
+        parts = [self._buffer]
+        bufferedSize = len(self._buffer)
+        while size < 0 or bufferedSize < size:
+            line = self._fileobj.readline()
+            if line == b"":
+                break
+            if line == _UnclosedLimitedTosFixingFile._PLURK_END_LINE and self._previousLine == _UnclosedLimitedTosFixingFile._FRIENDS_LINE:
+                parts.append(_UnclosedLimitedTosFixingFile._LIMITED_TOS_END_LINE)
+                bufferedSize += len(_UnclosedLimitedTosFixingFile._LIMITED_TOS_END_LINE)
+            self._previousLine = line
+            parts.append(line)
+            bufferedSize += len(line)
+        data = b"".join(parts)
+        if size < 0 or len(data) <= size:
+            self._buffer = b""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+        
+    def close(self):
+        self._fileobj.close()
+        
+        
+class _XMLArchiveReader:
+    """
+        Reads an XML backup written by _XMLFileFront back with an incremental parser, one <plurk> at a time,
+        throwing each element away once it has been made into records. A .gz, .bz2 or .xz file is decompressed as it is read.
+        
+        XML backups keep people by username only, and no content: people are given uids in the order they turn up
+        (an unknown_user gets _UNKNOWN_UID), and content is content_raw, escaped.
+        A backup which isn't well-formed XML raises SyntaxError (ParseError).
+    """
+    def __init__(self, filename):
+        self._filename = filename
+        self._uidsByUsername = {}
+        
+    # the uid of unknown_user people; never in people, and never taken by anyone else
+    _UNKNOWN_UID = -1
+    
+    def _uidOf(self, element, people):
+        username = element.get("username")
+        if username is None:
+            return _XMLArchiveReader._UNKNOWN_UID
+        uid = self._uidsByUsername.get(username)
+        if uid is None:
+            uid = self._uidsByUsername[username] = len(self._uidsByUsername) + 1
+            people[uid] = _Person(username, element.get("displayname"))
+        return uid
+        
+    def _plurkOf(self, element, people):
+        responses = []
+        for responseElement in element.find("responses"):
+            contentRaw = responseElement.findtext("content_raw")
+            responses.append(_Response(int(responseElement.get("id")), self._uidOf(responseElement, people), responseElement.get("posted_time"), responseElement.get("lang"),
+                                       responseElement.findtext("qualifier"), responseElement.findtext("qualifier_translated"), contentRaw, _escapeHTML(contentRaw)))
+        favorers = [self._uidOf(personElement, people) for personElement in element.find("favorers")]
+        replurkers = [self._uidOf(personElement, people) for personElement in element.find("replurkers")]
+        limitedTosElement = element.find("limited_tos")
+        limitedTo = [0] if limitedTosElement.find("friends") is not None else [self._uidOf(personElement, people) for personElement in limitedTosElement]
+        contentRaw = element.findtext("content_raw")
+        return _Plurk(int(element.get("id")), element.get("posted_time"), element.get("lang"), element.findtext("qualifier"), element.findtext("qualifier_translated"),
+                      int(element.get("favorite_count")), favorers, int(element.get("replurkers_count")), replurkers, len(responses), limitedTo,
+                      contentRaw, _escapeHTML(contentRaw), responses)
+        
+    def __iter__(self):
+        """ Yields (plurk, people) for each plurk, old-entry-first; people are the ones first met in that plurk. """
+        infile = _UnclosedLimitedTosFixingFile(_OutputSink.openForReading(self._filename))
+        try:
+            rootElement = None
+            for event, element in ElementTree.iterparse(infile, ("start", "end")):
+                if rootElement is None:
+                    rootElement = element
+                elif event == "end" and element.tag == "plurk":
+                    people = {}
+                    plurk = self._plurkOf(element, people)
+                    # the parsed plurks would pile up under <plurks> otherwise
+                    rootElement.clear()
+                    yield plurk, people
+        finally:
+            infile.close()
+            
+            
 class _DataStorage:
     """
         content is used for the pretty-output HTML file output.
         content_raw is used for raw XML file output.
+        # either is None when its output is not selected.
         
-        plurks: [{plurk_id, posted_time, lang, qualifier, qualifier_translated, content, content_raw, responses: RESPONSES_LIST}, {}]
-        RESPONSES_LIST: [{rid, uid, posted_time, lang, qualifier, qualifier_translated, content, content_raw}, {}]
-        people: {id: {username, displayname}}   # displayname = username if displayname == ""
+        plurks: [_Plurk(plurk_id, posted_time, lang, qualifier, qualifier_translated, ..., content_raw, content, responses: RESPONSES_LIST), ...]
+        # file fronts get plurks as an iterable which can be iterated many times, not necessarily as a list.
+        RESPONSES_LIST: [_Response(rid, uid, posted_time, lang, qualifier, qualifier_translated, content_raw, content), ...]
+        people: {id: _Person(username, displayname)}   # displayname = username if displayname == ""
         # id's are integers, not strings.
         # people who have responded may have had their plurk accounts deleted - check for key not found.
     """
     def __init__(self):
-        self._plurks = []   # old-entry-first
+        self._pages = []    # as added, i.e. new-entry-first pages of new-entry-first plurks
         self._people = {}
         
     def addPlurks(self, plurks):
-        # the passed-in plurks are new-entry-first order, so we do some reversal
-        plurksCopy = copy.copy(plurks)
-        plurksCopy.reverse()
-        plurksCopy.extend(self._plurks)
-        self._plurks = plurksCopy
+        # the passed-in plurks are new-entry-first order; they are kept as one chunk, and reversed only when read
+        self._pages.append(plurks)
         
     def addPeople(self, people):
         self._people.update(people)
         
+    def plurkCompleted(self, plurk):
+        pass
+        
+    def getPlurks(self):
+        """ Returns a list of all plurks, old-entry-first. """
+        return list(_OldFirstPlurks(self._pages))
+        
+    def getPeople(self):
+        return self._people
+        
     def flushToFileFront(self, fileFront):
-        fileFront.writePlurks(self._plurks, self._people)
-        self._plurks = []
+        fileFront.writePlurks(_OldFirstPlurks(self._pages), self._people)
+        self._pages = []
         self._people = {}
 
 
+class _OldFirstPlurks:
+    """ Iterable, old-entry-first view of the new-entry-first pages kept by _DataStorage, which can be iterated many times. """
+    def __init__(self, pages):
+        self._pages = pages
+        
+    def __len__(self):
+        return sum(len(plurks) for plurks in self._pages)
+        
+    def __iter__(self):
+        for plurks in reversed(self._pages):
+            for plurk in reversed(plurks):
+                yield plurk
+
+
+class _StreamingDataStorage:
+    """
+        Same interface as _DataStorage, but without keeping the whole account in memory.
+        Whoever fills in a plurk's responses has to call plurkCompleted() afterwards.
+        
+        Timeline pages arrive new-entry-first while the output is old-entry-first, so a plurk can't go into the
+        output files at the moment its responses arrive. Instead, as soon as every plurk of a page has its
+        responses, every file front renders the page into its own temporary spool file, and the page leaves memory.
+        flushToFileFront() then copies the spooled pages into the output files in reverse order.
+        Only the pages still waiting for responses (the reorder buffer) and the people directory stay in memory.
+        
+        fileFronts is the _MultipleFileFront that flushToFileFront() will be called with.
+        With compressSpools, every spooled page is deflated, so that compressed output leaves no uncompressed copy on disk.
+    """
+    def __init__(self, fileFronts, compressSpools = False):
+        self._fileFronts = [fileFront for fileFront in fileFronts.getFileFronts() if fileFront.rendersFragments]
+        # file fronts which take plurks in any order get the completed pages right away instead
+        self._directFileFronts = [fileFront for fileFront in fileFronts.getFileFronts() if not fileFront.rendersFragments]
+        for fileFront in self._directFileFronts:
+            if not fileFront.writesInAnyOrder:
+                raise PlurackupLibError("The " + fileFront.formatName + " output can't be streamed")
+        self._compressSpools = compressSpools
+        self._spools = dict((fileFront, tempfile.TemporaryFile()) for fileFront in self._fileFronts)
+        self._segments = dict((fileFront, []) for fileFront in self._fileFronts)   # [(pageIndex, offset, length)]
+        self._pendingPages = {}     # {pageIndex: [plurks, number of plurks without responses]}
+        self._pageIndexOfPlurk = {}
+        self._nextPageIndex = 0
+        self._people = {}
+        self._lock = threading.RLock()
+        
+    def addPlurks(self, plurks):
+        # the passed-in plurks are new-entry-first order, just like with _DataStorage
+        with self._lock:
+            pageIndex = self._nextPageIndex
+            self._nextPageIndex += 1
+            outstandingPlurks = [plurk for plurk in plurks if plurk.responses is None]
+            if len(outstandingPlurks) == 0:
+                self._spoolPage(pageIndex, plurks)
+                return
+            self._pendingPages[pageIndex] = [plurks, len(outstandingPlurks)]
+            for plurk in outstandingPlurks:
+                self._pageIndexOfPlurk[plurk.plurk_id] = pageIndex
+                
+    def addPeople(self, people):
+        with self._lock:
+            self._people.update(people)
+            
+    def plurkCompleted(self, plurk):
+        with self._lock:
+            pageIndex = self._pageIndexOfPlurk.pop(plurk.plurk_id, None)
+            if pageIndex is None:
+                return
+            self._pendingPages[pageIndex][1] -= 1
+            if self._pendingPages[pageIndex][1] == 0:
+                self._spoolPage(pageIndex, self._pendingPages.pop(pageIndex)[0])
+                
+    def _spoolPage(self, pageIndex, plurks):
+        oldFirstPlurks = list(reversed(plurks))
+        for fileFront in self._directFileFronts:
+            fileFront.writePlurks(oldFirstPlurks, self._people)
+        for fileFront in self._fileFronts:
+            fragment = fileFront.renderPlurks(oldFirstPlurks, self._people).encode("utf-8")
+            if self._compressSpools:
+                fragment = zlib.compress(fragment, 1)
+            spool = self._spools[fileFront]
+            spool.seek(0, os.SEEK_END)
+            self._segments[fileFront].append((pageIndex, spool.tell(), len(fragment)))
+            spool.write(fragment)
+            
+    def getPlurks(self):
+        raise PlurackupLibError("Plurks are not kept in memory in streaming mode")
+        
+    def getPeople(self):
+        return self._people
+        
+    def flushToFileFront(self, fileFront):
+        with self._lock:
+            # a page that still misses responses by now goes out without them
+            for pageIndex in sorted(self._pendingPages.keys()):
+                for plurk in self._pendingPages[pageIndex][0]:
+                    if plurk.responses is None:
+                        plurk.responses = []
+                self._spoolPage(pageIndex, self._pendingPages.pop(pageIndex)[0])
+            self._pageIndexOfPlurk = {}
+            
+            for leafFileFront in self._directFileFronts:
+                # people may have become known after the pages they appear on went out
+                leafFileFront.writePlurks([], self._people)
+            for leafFileFront in self._fileFronts:
+                spool = self._spools[leafFileFront]
+                for pageIndex, offset, length in sorted(self._segments[leafFileFront], reverse = True):
+                    spool.seek(offset)
+                    fragment = spool.read(length)
+                    leafFileFront.writeFragment((zlib.decompress(fragment) if self._compressSpools else fragment).decode("utf-8"))
+                spool.close()
+            self._people = {}
+
+
+class _ResponseFetchPlanner:
+    """
+        Decides which plurks need a /API/Responses/get call, from what getPlurks already told about them:
+        plurks whose responses an incremental run can reuse and plurks with a response_count of 0 get no call at all.
+        The rest go biggest thread first (see priorityOf), so the longest fetches start early instead of forming a tail at the end.
+    """
+    def __init__(self, incrementalState):
+        self._incrementalState = incrementalState
+        self.plannedCount = 0
+        self.skippedCount = 0
+        self.reusedCount = 0
+        
+    @staticmethod
+    def priorityOf(plurk):
+        # lower goes first; plurks of unknown response_count go after all the known big ones
+        return -plurk.response_count if plurk.response_count is not None else 0
+        
+    def plan(self, plurks):
+        """ Fills in the responses of the plurks which need no call, and returns the others in the order to fetch them. """
+        plurksToFetch = []
+        for plurk in plurks:
+            if self._incrementalState is not None and self._incrementalState.reuseResponses(plurk):
+                self.reusedCount += 1
+            elif plurk.response_count == 0:
+                plurk.responses = []
+                self.skippedCount += 1
+            else:
+                plurksToFetch.append(plurk)
+        plurksToFetch.sort(key = _ResponseFetchPlanner.priorityOf)
+        self.plannedCount += len(plurksToFetch)
+        return plurksToFetch
+
+
+class _ResponsePages:
+    """
+        The responses of a plurk whose thread is longer than the first page getResponses returned.
+        Once the first page tells the page size, the further pages are fetched concurrently, each from its from_response offset,
+        and merged by rid when they are all in.
+    """
+    def __init__(self, plurk, responses, people, pageCount):
+        self.plurk = plurk
+        self._responses = list(responses)
+        self._people = dict(people)
+        self._outstandingCount = pageCount
+        self._error = None
+        self._lock = threading.Lock()
+        
+    @staticmethod
+    def remainingOffsets(firstResponses, responseCount):
+        """ from_response offsets of the pages after the first one; empty if the first one has all the responses. """
+        if responseCount is None or len(firstResponses) == 0 or len(firstResponses) >= responseCount:
+            return []
+        return list(range(len(firstResponses), responseCount, len(firstResponses)))
+        
+    def addPage(self, responses, people):
+        """ Returns True if this was the last page outstanding. """
+        with self._lock:
+            self._responses.extend(responses)
+            self._people.update(people)
+            self._outstandingCount -= 1
+            return self._outstandingCount == 0
+            
+    def addError(self, error):
+        """ Records a page which could not be fetched. Returns True if this was the last page outstanding. """
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            self._outstandingCount -= 1
+            return self._outstandingCount == 0
+            
+    def getError(self):
+        return self._error
+        
+    def getResponses(self):
+        # pages fetched while the thread grew may overlap
+        responsesByRid = dict((response.rid, response) for response in self._responses)
+        return [responsesByRid[rid] for rid in sorted(responsesByRid.keys())]
+        
+    def getPeople(self):
+        return self._people
+
+
+class _PeopleDirectory:
+    """
+        The people met in this run, in front of the data storage. The same friends respond in thread after thread,
+        so the fetch workers look people up without locking (see BackupAgent._extractPeopleFromGetResponsesRes),
+        and only take the lock to add the ones met for the first time. How long they waited for it is kept for the report.
+    """
+    def __init__(self, addPeopleFunc):
+        self._addPeopleFunc = addPeopleFunc
+        self._knownUids = set()
+        self._lock = threading.Lock()
+        self.lockAcquisitionCount = 0
+        self.lockWaitSeconds = 0.0
+        
+    def __contains__(self, uid):
+        return uid in self._knownUids
+        
+    def addPeople(self, people):
+        if len(people) == 0:
+            return
+        waitStartTime = time.time()
+        with self._lock:
+            self.lockWaitSeconds += time.time() - waitStartTime
+            self.lockAcquisitionCount += 1
+            self._addPeopleFunc(people)
+            # known only once stored, so whoever skips them can count on finding them there
+            self._knownUids.update(people.keys())
+
+
+class _ResponseFetchScheduler:
+    """
+        Runs a fixed number of worker threads which take work from a priority queue: plurks, whose first page of responses
+        is to be fetched, and (_ResponsePages, fromResponse) pages of long threads.
+        submit() blocks while queueSize plurks are waiting, so the timeline pager can never run too far ahead of the workers;
+        submitPage() never blocks, as the workers call it themselves.
+        Pages go before plurks, so a long thread is finished early, and of the plurks the one with the lowest
+        _ResponseFetchPlanner.priorityOf goes first.
+        workerFactory is called with the scheduler and must return a not-yet-started thread which take()s work
+        and calls workDone() after each piece, until take() returns None.
+        runReport, if given, is told whenever work is queued, taken and done.
+        concurrency, an _AdaptiveConcurrency, lets only as many workers take work at once as its limit says; the others wait.
+    """
+    def __init__(self, workerCount, queueSize, workerFactory, runReport = None, concurrency = None):
+        self._runReport = runReport
+        self._concurrency = concurrency
+        self._workQueue = queue.PriorityQueue()
+        self._plurkSlots = threading.Semaphore(max(queueSize, 1))
+        self._sequence = itertools.count()   # keeps work of the same priority in submission order
+        self._workers = [workerFactory(self) for i in range(workerCount)]
+        
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+            
+    def submit(self, plurk):
+        self._plurkSlots.acquire()
+        if self._runReport is not None:
+            self._runReport.workQueued()
+        self._workQueue.put((_ResponseFetchPlanner.priorityOf(plurk), next(self._sequence), plurk))
+        
+    def submitPage(self, responsePages, fromResponse):
+        if self._runReport is not None:
+            self._runReport.workQueued()
+        self._workQueue.put((float("-inf"), next(self._sequence), (responsePages, fromResponse)))
+        
+    def take(self):
+        if self._concurrency is not None:
+            self._concurrency.acquire()
+        priority, sequence, work = self._workQueue.get()
+        if work is None and self._concurrency is not None:
+            self._concurrency.release()
+        if isinstance(work, _Plurk):
+            self._plurkSlots.release()
+        if work is not None and self._runReport is not None:
+            self._runReport.workTaken()
+        return work
+        
+    def workDone(self):
+        if self._concurrency is not None:
+            self._concurrency.release()
+        if self._runReport is not None:
+            self._runReport.workFinished()
+        self._workQueue.task_done()
+        
+    def join(self):
+        # workers may still add pages while working, so no worker is told to quit before all the work is done
+        self._workQueue.join()
+        for worker in self._workers:
+            self._workQueue.put((float("inf"), next(self._sequence), None))
+        for worker in self._workers:
+            worker.join()
+
+
+class _AdaptiveConcurrency(plurklib.CallObserver):
+    """
+        AIMD controller of how many response requests may be in flight at once, between minimum and maximum, and the gate
+        which holds the fetcher threads to it: acquire() before a request, release() after it.
+        
+        It watches the attempts at GATED_REQUEST. The limit starts at minimum and grows by one with every successful attempt,
+        which doubles it every round trip, until the server first shows strain; from then on it grows by one every round trip
+        (by 1/limit with every success). The server shows strain when the share of attempts refused with a STRAINED_STATUSES
+        status or a broken connection rises above ERROR_RATE_TOLERANCE, or when the recent latency rises above LATENCY_TOLERANCE
+        times the usual latency; the limit is then cut by BACKOFF_FACTOR, at most once a round trip, as the attempts that were
+        already in flight would only tell about the old limit.
+        The recent error share and latency are moving averages over about the last 10 attempts, the usual latency over about the last 100.
+    """
+    GATED_REQUEST = "/API/Responses/get"
+    STRAINED_STATUSES = (429, 500, 502, 503, 504)
+    ERROR_RATE_TOLERANCE = 0.05
+    LATENCY_TOLERANCE = 2.0
+    BACKOFF_FACTOR = 0.5
+    _RECENT_SMOOTHING = 0.1
+    _USUAL_SMOOTHING = 0.01
+    
+    def __init__(self, minimum, maximum):
+        self._minimum = max(minimum, 1)
+        self._maximum = max(maximum, self._minimum)
+        self._limit = float(self._minimum)
+        self._slowStart = True
+        self._recentErrorRate = 0.0
+        self._recentLatency = None
+        self._usualLatency = None
+        self._attemptsUntilBackoff = 0
+        self._inFlight = 0
+        self._condition = threading.Condition()
+        self.lowestLimit = self._minimum
+        self.highestLimit = self._minimum
+        self.backoffCount = 0
+        
+    def getLimit(self):
+        return int(self._limit)
+        
+    def acquire(self):
+        with self._condition:
+            while self._inFlight >= int(self._limit):
+                self._condition.wait()
+            self._inFlight += 1
+            
+    def release(self):
+        with self._condition:
+            self._inFlight -= 1
+            self._condition.notify_all()
+            
+    def attempted(self, apirequest, attempt, seconds, exchange, error):
+        if apirequest != _AdaptiveConcurrency.GATED_REQUEST:
+            return
+        strained = exchange["status"] in _AdaptiveConcurrency.STRAINED_STATUSES or (error is not None and exchange["status"] is None)
+        with self._condition:
+            self._recentErrorRate += _AdaptiveConcurrency._RECENT_SMOOTHING * ((1.0 if strained else 0.0) - self._recentErrorRate)
+            if not strained:
+                # refusals come back fast, so only the latency of the calls served counts
+                self._recentLatency = seconds if self._recentLatency is None else self._recentLatency + _AdaptiveConcurrency._RECENT_SMOOTHING * (seconds - self._recentLatency)
+                self._usualLatency = seconds if self._usualLatency is None else self._usualLatency + _AdaptiveConcurrency._USUAL_SMOOTHING * (seconds - self._usualLatency)
+            self._attemptsUntilBackoff -= 1
+            
+            if self._recentErrorRate > _AdaptiveConcurrency.ERROR_RATE_TOLERANCE or (self._recentLatency is not None and self._recentLatency > self._usualLatency * _AdaptiveConcurrency.LATENCY_TOLERANCE):
+                if self._attemptsUntilBackoff <= 0:
+                    self._attemptsUntilBackoff = int(self._limit)
+                    self._limit = max(self._limit * _AdaptiveConcurrency.BACKOFF_FACTOR, self._minimum)
+                    self._slowStart = False
+                    self.backoffCount += 1
+                    # the strain has been answered; it has to show again to cut the limit further
+                    self._recentErrorRate = 0.0
+                    self._recentLatency = self._usualLatency
+            elif not strained:
+                self._limit = min(self._limit + (1.0 if self._slowStart else 1.0 / self._limit), self._maximum)
+            self.lowestLimit = min(self.lowestLimit, int(self._limit))
+            self.highestLimit = max(self.highestLimit, int(self._limit))
+            self._condition.notify_all()
+
+
+class _CallObserverGroup(plurklib.CallObserver):
+    """ Hands every attempt on to each of observers. """
+    def __init__(self, observers):
+        self._observers = observers
+        
+    def attempted(self, apirequest, attempt, seconds, exchange, error):
+        for observer in self._observers:
+            observer.attempted(apirequest, attempt, seconds, exchange, error)
+
+
+class _IncrementalState:
+    """
+        What a previous run backed up, kept next to the output files so the next run can be incremental.
+        
+        FILENAME.manifest.json:
+            {"version": 2, "username": "", "newest_plurk_id": 0, "newest_posted_time": "", "content_raw": true, "content": true,
+             "plurks": {"plurk_id": [response_count, favorite_count, replurkers_count]}}
+            # counts are as reported by getPlurks; null if the responses could not be fetched.
+            # content_raw/content tell whether the archive has those fields; a run needing one the archive lacks does a full backup.
+        FILENAME.archive.jsonl:
+            the plurks and people of _DataStorage, as written by _JSONLinesFileFront, so that it is loaded one plurk at a time.
+            # version 1 manifests came with FILENAME.archive.json instead: {"plurks": PLURKS_OLD_ENTRY_FIRST, "people": PEOPLE}, as dicts
+        
+        The Plurk API can't tell which plurks changed since a date, so an incremental run pages the timeline
+        only back to lookbackDays before the newest plurk of the previous run: responses of paged plurks are
+        fetched again only if their counts changed, and older plurks are taken from the archive as they are.
+    """
+    def __init__(self, filename, lookbackDays, keepContentRaw, keepContent):
+        self._manifestFilename = filename + ".manifest.json"
+        self._archiveBasename = filename + ".archive"
+        self._lookbackDays = lookbackDays
+        self._keepContentRaw = keepContentRaw
+        self._keepContent = keepContent
+        self._counts = {}
+        self._archivedPlurks = []
+        self._archivedPlurksById = {}
+        self._archivedPeople = {}
+        self._horizon = None
+        
+    @staticmethod
+    def _countsOfPlurk(plurk):
+        return [plurk.response_count, plurk.favorite_count, plurk.replurkers_count]
+        
+    def load(self, username):
+        """ Returns False if there is no usable previous run, in which case everything is to be fetched. """
+        try:
+            manifestFile = codecs.open(self._manifestFilename, "r", "utf-8")
+            manifest = json.load(manifestFile)
+            manifestFile.close()
+        except (IOError, ValueError):
+            return False
+        
+        if not manifest["version"] in (1, 2) or manifest["username"] != username:
+            return False
+        if (self._keepContentRaw and not manifest.get("content_raw", True)) or (self._keepContent and not manifest.get("content", True)):
+            return False
+        
+        archivedPlurks = []
+        archivedPeople = {}
+        try:
+            if manifest["version"] == 1:
+                archiveFile = codecs.open(self._archiveBasename + ".json", "r", "utf-8")
+                archive = json.load(archiveFile)
+                archiveFile.close()
+                archivedPlurks = [_Plurk.fromDict(plurk) for plurk in archive["plurks"]]
+                archivedPeople = dict((int(personId), _Person.fromDict(person)) for personId, person in archive["people"].items())
+            else:
+                for plurk, people in _JSONLinesReader(self._archiveBasename + ".jsonl"):
+                    archivedPlurks.append(plurk)
+                    archivedPeople.update(people)
+        except (IOError, ValueError):
+            return False
+        if len(archivedPlurks) == 0:
+            return False
+        
+        self._counts = dict((int(plurkId), counts) for plurkId, counts in manifest["plurks"].items())
+        self._archivedPlurks = archivedPlurks
+        self._archivedPlurksById = dict((plurk.plurk_id, plurk) for plurk in self._archivedPlurks)
+        self._archivedPeople = archivedPeople
+        self._horizon = plurktime.parsePlurkTime(manifest["newest_posted_time"]) - datetime.timedelta(self._lookbackDays)
+        return True
+        
+    def getArchivedPeople(self):
+        return self._archivedPeople
+        
+    def reuseResponses(self, plurk):
+        """ Fills in the archived responses and returns True if the plurk's counts did not change since the previous run. """
+        if not plurk.plurk_id in self._archivedPlurksById or self._counts.get(plurk.plurk_id) != _IncrementalState._countsOfPlurk(plurk):
+            return False
+        plurk.responses = self._archivedPlurksById[plurk.plurk_id].responses
+        return True
+        
+    def restoreResponses(self, plurk):
+        """ Fills in the archived responses of a plurk whose fetch failed; returns False if the archive has none of it. """
+        if not plurk.plurk_id in self._archivedPlurksById:
+            return False
+        plurk.responses = self._archivedPlurksById[plurk.plurk_id].responses
+        return True
+        
+    def getHorizon(self):
+        """ The oldest posted time paging has to go back to; None if there is no previous run. """
+        return self._horizon
+        
+    def isPastHorizon(self, postedTime):
+        return self._horizon is not None and plurktime.parsePlurkTime(postedTime) < self._horizon
+        
+    def getArchivedPlurksOlderThan(self, postedDateTime, excludedPlurkIds):
+        """ Archived plurks posted before postedDateTime (and not in excludedPlurkIds), new-entry-first as addPlurks wants them. """
+        olderPlurks = [plurk for plurk in self._archivedPlurks if not plurk.plurk_id in excludedPlurkIds and plurktime.parsePlurkTime(plurk.posted_time) <= postedDateTime]
+        olderPlurks.reverse()
+        return olderPlurks
+        
+    def save(self, username, plurks, people, failedPlurkIds):
+        """ plurks are old-entry-first. """
+        if len(plurks) == 0:
+            return
+        manifest = {"version": 2, "username": username, "newest_plurk_id": plurks[-1].plurk_id, "newest_posted_time": plurks[-1].posted_time,
+                    "content_raw": self._keepContentRaw, "content": self._keepContent,
+                    "plurks": dict((str(plurk.plurk_id), None if plurk.plurk_id in failedPlurkIds else _IncrementalState._countsOfPlurk(plurk)) for plurk in plurks)}
+        # write aside and then replace, so a crash never leaves half a file behind
+        archive = _JSONLinesFileFront(self._archiveBasename + ".tmp")
+        archive.prepare()
+        archive.writePlurks(plurks, people)
+        archive.postpare()
+        outfile = codecs.open(self._manifestFilename + ".tmp", "w", "utf-8")
+        json.dump(manifest, outfile)
+        outfile.close()
+        for filename, tmpFilename in ((self._archiveBasename + ".jsonl", self._archiveBasename + ".tmp.jsonl"), (self._manifestFilename, self._manifestFilename + ".tmp")):
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmpFilename, filename)
+        if os.path.exists(self._archiveBasename + ".json"):
+            os.remove(self._archiveBasename + ".json")
+
+
+class _FetchJournal:
+    """
+        Append-only journal of what the current run has fetched, written as the results arrive,
+        so that a run which dies halfway can be resumed instead of restarted.
+        
+        FILENAME.journal, one JSON object per line:
+            {"username": "", "content_raw": true, "content": true}   # always the first line; which content fields the records have
+            {"page": PLURKS_NEW_ENTRY_FIRST, "people": PEOPLE}       # a timeline page, without responses
+            {"plurk_id": 0, "responses": RESPONSES_LIST, "people": PEOPLE}
+            {"end": true}                                           # the timeline has been paged through
+        A torn last line, left by a crash in the middle of a write, is ignored when replaying.
+    """
+    def __init__(self, filename, keepContentRaw, keepContent):
+        self._filename = filename + ".journal"
+        self._keepContentRaw = keepContentRaw
+        self._keepContent = keepContent
+        self._outfile = None
+        self._lock = threading.Lock()
+        
+    def replay(self, username):
+        """ Returns (pages, {plurk_id: responses}, people, ended), or None if there is no journal of username's backup
+            (or one lacking a content field this run needs).
+        """
+        pages = []
+        responses = {}
+        people = {}
+        ended = False
+        try:
+            journalFile = codecs.open(self._filename, "r", "utf-8")
+        except IOError:
+            return None
+        try:
+            for line in journalFile:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "username" in record:
+                    if record["username"] != username:
+                        return None
+                    if (self._keepContentRaw and not record.get("content_raw", True)) or (self._keepContent and not record.get("content", True)):
+                        return None
+                elif "page" in record:
+                    pages.append([_Plurk.fromDict(plurk) for plurk in record["page"]])
+                elif "responses" in record:
+                    responses[record["plurk_id"]] = [_Response.fromDict(response) for response in record["responses"]]
+                elif "end" in record:
+                    ended = True
+                if "people" in record:
+                    people.update((int(personId), _Person.fromDict(person)) for personId, person in record["people"].items())
+        finally:
+            journalFile.close()
+        return pages, responses, people, ended
+        
+    def open(self, username, append):
+        self._outfile = codecs.open(self._filename, "a" if append else "w", "utf-8")
+        if append:
+            # terminate a possibly torn last line
+            self._outfile.write("\n")
+        else:
+            self._record({"username": username, "content_raw": self._keepContentRaw, "content": self._keepContent})
+        
+    def _record(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._outfile.write(line)
+            self._outfile.flush()
+            
+    def recordPage(self, plurks, people):
+        self._record({"page": [plurk.toDict() for plurk in plurks], "people": dict((str(personId), person.toDict()) for personId, person in people.items())})
+        
+    def recordResponses(self, plurkId, responses, people):
+        self._record({"plurk_id": plurkId, "responses": [response.toDict() for response in responses], "people": dict((str(personId), person.toDict()) for personId, person in people.items())})
+        
+    def recordEnd(self):
+        self._record({"end": True})
+        
+    def close(self):
+        self._outfile.close()
+        
+    def remove(self):
+        os.remove(self._filename)
+
+
+class _RunReport(plurklib.CallObserver):
+    """
+        Measures a backup run as it goes, for the progress line and for the run report, FILENAME.report.json:
+            {"version": 1, "started": "2013-01-01T12:00:00", "seconds": 0.0, "settings": {"engine": "threads", ...},
+             "api": {"/API/Responses/get": {"calls": 0, "attempts": 0, "retries": 0, "errors": 0, "statuses": {"200": 0},
+                                            "bytes_sent": 0, "bytes_received": 0, "seconds": {"mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}}},
+             "fetching": {"plurks_paged": 0, "plurks_to_fetch": 0, "plurks_fetched": 0, "work_done": 0,
+                          "queue_depth": {"mean": 0.0, "max": 0}, "busy_workers": {"mean": 0.0, "max": 0}},
+             "output": {"xml": {"seconds": 0.0, "bytes": 0}}}
+            # plus whatever addSection() added.
+            # seconds of calls are per attempt; errors are attempts which raised, retries are attempts after the first.
+            # work is a page of responses to fetch; queue depth and busy workers are sampled whenever work is taken up.
+            # seconds of an output are summed over all threads which wrote or rendered it; render processes are not counted.
+        All methods are thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.begin({})
+        
+    def begin(self, settings):
+        with self._lock:
+            self._settings = settings
+            self._startTime = time.time()
+            self._endpoints = {}
+            self._outputSeconds = {}
+            self._sections = {}
+            self._plurksPaged = 0
+            self._plurksToFetch = 0
+            self._plurksFetched = 0
+            self._timelineSpan = None   # (newest, oldest) datetime of the timeline to be paged
+            self._pagedDateTime = None
+            self._pagingEnded = False
+            self._queueDepth = 0
+            self._busyWorkers = 0
+            self._workDone = 0
+            self._sampleCount = 0
+            self._queueDepthSum = 0
+            self._queueDepthMax = 0
+            self._busyWorkersSum = 0
+            self._busyWorkersMax = 0
+            
+    def attempted(self, apirequest, attempt, seconds, exchange, error):
+        with self._lock:
+            endpoint = self._endpoints.get(apirequest)
+            if endpoint is None:
+                endpoint = self._endpoints[apirequest] = {"calls": 0, "attempts": 0, "retries": 0, "errors": 0, "statuses": {}, "bytes_sent": 0, "bytes_received": 0, "seconds": []}
+            endpoint["attempts"] += 1
+            if attempt == 1:
+                endpoint["calls"] += 1
+            else:
+                endpoint["retries"] += 1
+            if error is not None:
+                endpoint["errors"] += 1
+            status = str(exchange["status"]) if exchange["status"] is not None else "none"
+            endpoint["statuses"][status] = endpoint["statuses"].get(status, 0) + 1
+            endpoint["bytes_sent"] += exchange["sent"]
+            endpoint["bytes_received"] += exchange["received"]
+            endpoint["seconds"].append(seconds)
+            
+    def pagingStarted(self, newestDateTime, oldestDateTime):
+        """ oldestDateTime is where paging will end, or None if that isn't known; then there's no ETA until it ends. """
+        with self._lock:
+            self._timelineSpan = (newestDateTime, oldestDateTime) if oldestDateTime is not None and oldestDateTime < newestDateTime else None
+            
+    def pageTaken(self, plurkCount, fetchCount, oldestPostedTime):
+        with self._lock:
+            self._plurksPaged += plurkCount
+            self._plurksToFetch += fetchCount
+            if oldestPostedTime is not None:
+                self._pagedDateTime = plurktime.parsePlurkTime(oldestPostedTime)
+                
+    def pagingEnded(self):
+        with self._lock:
+            self._pagingEnded = True
+            
+    def plurkFetched(self):
+        with self._lock:
+            self._plurksFetched += 1
+            
+    def workQueued(self):
+        with self._lock:
+            self._queueDepth += 1
+            
+    def workTaken(self):
+        with self._lock:
+            self._queueDepth -= 1
+            self._busyWorkers += 1
+            self._sampleCount += 1
+            self._queueDepthSum += self._queueDepth
+            self._queueDepthMax = max(self._queueDepthMax, self._queueDepth)
+            self._busyWorkersSum += self._busyWorkers
+            self._busyWorkersMax = max(self._busyWorkersMax, self._busyWorkers)
+            
+    def workFinished(self):
+        with self._lock:
+            self._busyWorkers -= 1
+            self._workDone += 1
+            
+    def outputTimed(self, formatName, seconds):
+        with self._lock:
+            self._outputSeconds[formatName] = self._outputSeconds.get(formatName, 0.0) + seconds
+            
+    def addSection(self, name, values):
+        with self._lock:
+            self._sections[name] = values
+            
+    def _expectedFetchCount(self):
+        """ How many plurks will have had their responses fetched by the end, extrapolated from how much of the timeline is paged; None if unknown yet. """
+        if self._pagingEnded:
+            return self._plurksToFetch
+        if self._timelineSpan is None or self._pagedDateTime is None:
+            return None
+        newestDateTime, oldestDateTime = self._timelineSpan
+        pagedShare = (newestDateTime - self._pagedDateTime).total_seconds() / (newestDateTime - oldestDateTime).total_seconds()
+        if pagedShare < 0.01:
+            return None
+        return max(int(self._plurksToFetch / min(pagedShare, 1.0)), self._plurksToFetch)
+        
+    def progressText(self):
+        """ Returns a line like "[ 42%] 2100/5000 plurk(s) fetched; 35.0 plurks/s, 40.2 requests/s, 1.21 MB/s; ETA 0:01:22" """
+        with self._lock:
+            seconds = max(time.time() - self._startTime, 0.001)
+            plurksFetched = self._plurksFetched
+            expectedCount = self._expectedFetchCount()
+            attemptCount = sum(endpoint["attempts"] for endpoint in self._endpoints.values())
+            receivedByteCount = sum(endpoint["bytes_received"] for endpoint in self._endpoints.values())
+        
+        if expectedCount is not None and expectedCount > 0:
+            text = "[{0:3.0f}%] {1}/{2}".format(100.0 * min(plurksFetched, expectedCount) / expectedCount, plurksFetched, expectedCount)
+        else:
+            text = "[ ...] {0}/?".format(plurksFetched)
+        text += " plurk(s) fetched; {0:.1f} plurks/s, {1:.1f} requests/s, {2:.2f} MB/s; ETA ".format(plurksFetched / seconds, attemptCount / seconds, receivedByteCount / 1048576.0 / seconds)
+        if expectedCount is None or plurksFetched == 0:
+            return text + "?"
+        remainingSeconds = int(max(expectedCount - plurksFetched, 0) * seconds / plurksFetched)
+        return text + "{0}:{1:02d}:{2:02d}".format(remainingSeconds // 3600, remainingSeconds // 60 % 60, remainingSeconds % 60)
+        
+    @staticmethod
+    def _percentile(sortedValues, share):
+        return sortedValues[min(int(share * len(sortedValues)), len(sortedValues) - 1)] if len(sortedValues) > 0 else 0.0
+        
+    @staticmethod
+    def _sizeOf(path):
+        if not os.path.isdir(path):
+            return os.path.getsize(path) if os.path.exists(path) else 0
+        return sum(os.path.getsize(os.path.join(directory, name)) for directory, subdirectories, names in os.walk(path) for name in names)
+        
+    def write(self, reportFilename, outputFiles):
+        """ outputFiles are the (formatName, filename) of the outputs, whose sizes go into the report too. """
+        with self._lock:
+            api = {}
+            for apirequest, endpoint in self._endpoints.items():
+                seconds = sorted(endpoint["seconds"])
+                api[apirequest] = dict(endpoint, seconds = {"mean": sum(seconds) / max(len(seconds), 1), "p50": _RunReport._percentile(seconds, 0.5), "p90": _RunReport._percentile(seconds, 0.9),
+                                                            "p99": _RunReport._percentile(seconds, 0.99), "max": seconds[-1] if len(seconds) > 0 else 0.0})
+            sampleCount = max(self._sampleCount, 1)
+            report = {"version": 1, "started": datetime.datetime.fromtimestamp(self._startTime).strftime("%Y-%m-%dT%H:%M:%S"), "seconds": time.time() - self._startTime,
+                      "settings": self._settings, "api": api,
+                      "fetching": {"plurks_paged": self._plurksPaged, "plurks_to_fetch": self._plurksToFetch, "plurks_fetched": self._plurksFetched, "work_done": self._workDone,
+                                   "queue_depth": {"mean": self._queueDepthSum / float(sampleCount), "max": self._queueDepthMax},
+                                   "busy_workers": {"mean": self._busyWorkersSum / float(sampleCount), "max": self._busyWorkersMax}},
+                      "output": {}}
+            report.update(self._sections)
+            for formatName, filename in outputFiles:
+                # paged HTML is a whole directory of pages
+                report["output"][formatName] = {"seconds": self._outputSeconds.get(formatName, 0.0),
+                                                "bytes": _RunReport._sizeOf(os.path.dirname(filename) if formatName == _PagedHTMLFileFront.formatName else filename)}
+        outfile = codecs.open(reportFilename, "w", "utf-8")
+        json.dump(report, outfile, indent = 1, sort_keys = True)
+        outfile.close()
+
+
+class _ProgressLine(threading.Thread):
+    """ Hands progressFunc runReport's progress text every interval seconds, and once more when stopped. """
+    def __init__(self, runReport, progressFunc, interval = 1.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._runReport = runReport
+        self._progressFunc = progressFunc
+        self._interval = interval
+        self._stopped = threading.Event()
+        
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self._progressFunc(self._runReport.progressText())
+            
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self._progressFunc(self._runReport.progressText())
+
+
 class BackupAgent:
     class _ResponseFetcher(threading.Thread):
-        def __init__(self, associatedPlurk, backupAgent, addPeopleLock, addPeopleFunc):
+        def __init__(self, scheduler, backupAgent, peopleDirectory, plurkCompletedFunc, failedPlurks, journal, incrementalState):
             threading.Thread.__init__(self)
-            self._associatedPlurk = associatedPlurk
+            self.daemon = True
+            self._scheduler = scheduler
             self._backupAgent = backupAgent
-            self._addPeopleLock = addPeopleLock
-            self._addPeopleFunc = addPeopleFunc
+            self._peopleDirectory = peopleDirectory
+            self._plurkCompletedFunc = plurkCompletedFunc
+            self._failedPlurks = failedPlurks
+            self._journal = journal
+            self._incrementalState = incrementalState
+            # each worker keeps its own session for all the plurks it fetches; sessions share the login cookies and keep-alive connections
+            self._plurkObj = backupAgent._plurkObj.spawnSession()
             
         def run(self):
-            # sometimes we receive 500 Internal Server Error so we have to retry
-            grRes = {}
-            while not "responses" in grRes:
-                grRes = self._backupAgent._plurkObj.getResponses(self._associatedPlurk["plurk_id"], 0)
-            
-            responses = BackupAgent._extractResponsesFromGetResponsesRes(grRes)
-            self._addPeopleLock.acquire()
-            self._addPeopleFunc(BackupAgent._extractPeopleFromGetResponsesRes(grRes))
-            self._addPeopleLock.release()
-            self._associatedPlurk["responses"] = responses
-            self._backupAgent._outLogFunc("Consumed plurk posted at: " + self._associatedPlurk["posted_time"])
+            while True:
+                work = self._scheduler.take()
+                if work is None:
+                    break
+                
+                completedPlurk = self._fetchFirstPage(work) if isinstance(work, _Plurk) else self._fetchPage(*work)
+                if completedPlurk is not None:
+                    self._backupAgent._runReport.plurkFetched()
+                    self._plurkCompletedFunc(completedPlurk)
+                self._scheduler.workDone()
+                
+        def _fetchFirstPage(self, associatedPlurk):
+            """ Returns the plurk if it is complete, or None if pages of it have been submitted. """
+            try:
+                grRes = self._backupAgent._getResponsesWithRetry(self._plurkObj, associatedPlurk, 0)
+                responses = BackupAgent._extractResponsesFromGetResponsesRes(grRes, self._backupAgent._keepContentRaw, self._backupAgent._keepContent)
+                people = BackupAgent._extractPeopleFromGetResponsesRes(grRes, self._peopleDirectory)
+                fromResponses = _ResponsePages.remainingOffsets(responses, grRes["response_count"] if "response_count" in grRes else associatedPlurk.response_count)
+                if len(fromResponses) > 0:
+                    responsePages = _ResponsePages(associatedPlurk, responses, people, len(fromResponses))
+                    for fromResponse in fromResponses:
+                        self._scheduler.submitPage(responsePages, fromResponse)
+                    return None
+                self._consume(associatedPlurk, responses, people)
+            except Exception as e:
+                self._fail(associatedPlurk, e)
+            return associatedPlurk
+                
+        def _fetchPage(self, responsePages, fromResponse):
+            """ Returns the plurk if this was its last page outstanding, or None. """
+            try:
+                grRes = self._backupAgent._getResponsesWithRetry(self._plurkObj, responsePages.plurk, fromResponse)
+                lastPage = responsePages.addPage(BackupAgent._extractResponsesFromGetResponsesRes(grRes, self._backupAgent._keepContentRaw, self._backupAgent._keepContent), BackupAgent._extractPeopleFromGetResponsesRes(grRes, self._peopleDirectory))
+            except Exception as e:
+                lastPage = responsePages.addError(e)
+            if not lastPage:
+                return None
+            
+            if responsePages.getError() is not None:
+                # a thread with any page missing goes without responses, just like one whose first page failed
+                self._fail(responsePages.plurk, responsePages.getError())
+                return responsePages.plurk
+            try:
+                self._consume(responsePages.plurk, responsePages.getResponses(), responsePages.getPeople())
+            except Exception as e:
+                self._fail(responsePages.plurk, e)
+            return responsePages.plurk
+                
+        def _consume(self, associatedPlurk, responses, people):
+            self._journal.recordResponses(associatedPlurk.plurk_id, responses, people)
+            self._peopleDirectory.addPeople(people)
+            associatedPlurk.responses = responses
+            self._backupAgent._outLogFunc("Consumed plurk posted at: " + associatedPlurk.posted_time)
+            
+        def _fail(self, associatedPlurk, error):
+            BackupAgent._failPlurk(associatedPlurk, error, self._failedPlurks, self._incrementalState)
 
     
-    def __init__(self, apiKey, outLogFunc, quesAskFunc, outFilename = "", xmlOut = False, htmlOut = True, htmlTimeOffsetSign = 1, htmlTimeOffsetHour = 0, htmlTimeOffsetMinute = 0, cssFilename = "style.css", plurksPerRequest = 50):
-        self._plurkObj = plurklib.PlurkAPI(apiKey)
+    class _TimelinePager(threading.Thread):
+        """
+            Pages one window of the timeline, from upperDateTime back to lowerDateTime (or to the very first plurk if None),
+            into pageQueue: (plurks, people) for each page, then None; or the exception which stopped it.
+            Plurks older than lowerDateTime are left to the next window.
+        """
+        def __init__(self, backupAgent, upperDateTime, lowerDateTime, pageQueueSize):
+            threading.Thread.__init__(self)
+            self.daemon = True
+            self._backupAgent = backupAgent
+            self._upperDateTime = upperDateTime
+            self._lowerDateTime = lowerDateTime
+            self.pageQueue = queue.Queue(pageQueueSize)
+            self._plurkObj = backupAgent._plurkObj.spawnSession()
+            
+        def run(self):
+            try:
+                currentOffsetDateTime = self._upperDateTime
+                while currentOffsetDateTime is not None:
+                    gpRes = self._plurkObj.getOwnPlurks(currentOffsetDateTime.strftime("%Y-%m-%dT%H:%M:%S"), self._backupAgent._plurksPerRequest)
+                    plurks, people, currentOffsetDateTime = self._backupAgent._takeTimelinePage(gpRes, self._lowerDateTime)
+                    if len(plurks) > 0:
+                        self.pageQueue.put((plurks, people))
+                self.pageQueue.put(None)
+            except Exception as e:
+                self.pageQueue.put(e)
+                
+    # how many plurks rerenderArchive() reads before writing them out
+    RERENDER_BATCH_SIZE = 5000
+    
+    def __init__(self, apiKey, outLogFunc, quesAskFunc, outFilename = "", xmlOut = False, htmlOut = True, htmlTimeOffsetSign = 1, htmlTimeOffsetHour = 0, htmlTimeOffsetMinute = 0, cssFilename = "style.css", plurksPerRequest = 50, responseFetcherCount = 16, fetchQueueSize = 200, connectionPoolSize = 0, maxAttempts = 5, requestsPerSecond = 0, incremental = False, incrementalLookbackDays = 30, streamingOutput = False, timelineWindowCount = 1, renderProcessCount = 1, htmlPaged = False, htmlPlurksPerPage = 0, outputCompression = "", outputCompressionLevel = None, sqliteOut = False, jsonlOut = False, apiHost = "", runReport = False, progressFunc = None, adaptiveConcurrency = False):
+        self._apiKey = apiKey
+        # another host than plurk.com's is a stand-in server, like plurkmock's, and is spoken to in plain HTTP
+        self._apiHost = apiHost if apiHost != "" else "www.plurk.com"
+        self._apiSecure = apiHost == ""
+        self._retryPolicy = plurklib.RetryPolicy(maxAttempts)
+        # one bucket for all sessions, so the limit holds across all fetcher threads
+        self._rateLimiter = plurklib.TokenBucket(requestsPerSecond) if requestsPerSecond > 0 else None
+        self._requestsPerSecond = requestsPerSecond
+        # every run is measured; runReport writes the measurements into FILENAME.report.json, and progressFunc is handed a progress line every second
+        self._runReport = _RunReport()
+        self._writesRunReport = runReport
+        self._progressFunc = progressFunc
+        # with adaptiveConcurrency, the fetcher threads are only the most requests that may be in flight; how many are is found as the run goes
+        self._concurrency = _AdaptiveConcurrency(1, max(responseFetcherCount, 1)) if adaptiveConcurrency else None
+        # by default keep a connection for every fetcher thread plus every timeline pager
+        self._plurkObj = plurklib.PlurkAPI(apiKey, connectionPoolSize if connectionPoolSize > 0 else max(responseFetcherCount, 1) + max(timelineWindowCount, 1), self._retryPolicy, self._rateLimiter, self._apiHost, self._apiSecure, self._callObserver())
         self._outLogFunc = outLogFunc
         self._quesAskFunc = quesAskFunc
         self._outFilename = outFilename
-        if (not xmlOut) and (not htmlOut):
-            raise PlurackupLibError("Both xmlOut and htmlOut are False - Dunno what to output")
+        if (not xmlOut) and (not htmlOut) and (not sqliteOut) and (not jsonlOut):
+            raise PlurackupLibError("xmlOut, htmlOut, sqliteOut and jsonlOut are all False - Dunno what to output")
             
         self._xmlOut = xmlOut
         self._htmlOut = htmlOut
+        self._sqliteOut = sqliteOut
+        self._jsonlOut = jsonlOut
+        # content_raw is written into XML and content into HTML; the database and JSON Lines keep both
+        self._keepContentRaw = xmlOut or sqliteOut or jsonlOut
+        self._keepContent = htmlOut or sqliteOut or jsonlOut
         self._htmlTimeOffsetSign = 1 if htmlTimeOffsetSign >= 0 else -1
         self._htmlTimeOffsetHour = htmlTimeOffsetHour
         self._htmlTimeOffsetMinute = htmlTimeOffsetMinute
         self._cssFilename = "style.css" if cssFilename == "" else cssFilename
         self._plurksPerRequest = plurksPerRequest
+        self._responseFetcherCount = max(responseFetcherCount, 1)
+        self._incremental = incremental
+        self._incrementalLookbackDays = incrementalLookbackDays
+        if incremental and streamingOutput:
+            raise PlurackupLibError("Incremental backups need the whole account in memory, so they can't be streamed")
+        if htmlPaged and streamingOutput:
+            raise PlurackupLibError("Paged HTML output is written page by page at the end, so it can't be streamed")
+        self._streamingOutput = streamingOutput
+        self._htmlPaged = htmlPaged
+        self._htmlPlurksPerPage = max(htmlPlurksPerPage, 0)
+        # paged HTML is never compressed, so that its pages stay browsable
+        self._outputSink = _OutputSink(outputCompression, outputCompressionLevel)
+        self._fetchQueueSize = max(fetchQueueSize, 1)
+        self._timelineWindowCount = max(timelineWindowCount, 1)
+        # 0 renders in a process per CPU core
+        self._renderProcessCount = renderProcessCount if renderProcessCount > 0 else multiprocessing.cpu_count()
     
     @staticmethod
     def _arrayizeAudienceFromPlurkLimitedTo(limitedToString):
         return [] if limitedToString == None or limitedToString == "" else [int(audience) for audience in re.findall("\d+", limitedToString)]
 
     @staticmethod    
-    def _extractPlurksFromGetPlurksRes(gpRes):
-        return [{"plurk_id": plurk["plurk_id"], "posted_time": plurk["posted"], "lang": plurk["lang"], "qualifier": plurk["qualifier"], "qualifier_translated": plurk["qualifier_translated"] if "qualifier_translated" in plurk else plurk["qualifier"], "favorite_count": plurk["favorite_count"], "favorers": plurk["favorers"], "replurkers_count": plurk["replurkers_count"], "replurkers": plurk["replurkers"], "limited_to": BackupAgent._arrayizeAudienceFromPlurkLimitedTo(plurk["limited_to"]) if "limited_to" in plurk else [], "content_raw": plurk["content_raw"], "content": plurk["content"]} for plurk in gpRes["plurks"]]
+    def _extractPlurksFromGetPlurksRes(gpRes, keepContentRaw = True, keepContent = True):
+        # content_raw is only written by the XML file front and content only by the HTML one, so the unused one isn't kept
+        return [_Plurk(plurk["plurk_id"], plurk["posted"], plurk["lang"], plurk["qualifier"], plurk["qualifier_translated"] if "qualifier_translated" in plurk else plurk["qualifier"], plurk["favorite_count"], plurk["favorers"], plurk["replurkers_count"], plurk["replurkers"], plurk["response_count"] if "response_count" in plurk else None, BackupAgent._arrayizeAudienceFromPlurkLimitedTo(plurk["limited_to"]) if "limited_to" in plurk else [], plurk["content_raw"] if keepContentRaw else None, plurk["content"] if keepContent else None) for plurk in gpRes["plurks"]]
 
     @staticmethod
-    def _extractResponsesFromGetResponsesRes(grRes):
-        return [{"rid": response["id"], "uid": response["user_id"], "posted_time": response["posted"], "lang": response["lang"], "qualifier": response["qualifier"], "qualifier_translated": response["qualifier_translated"] if "qualifier_translated" in response else response["qualifier"], "content_raw": response["content_raw"], "content": response["content"]} for response in grRes["responses"]]
+    def _extractResponsesFromGetResponsesRes(grRes, keepContentRaw = True, keepContent = True):
+        return [_Response(response["id"], response["user_id"], response["posted"], response["lang"], response["qualifier"], response["qualifier_translated"] if "qualifier_translated" in response else response["qualifier"], response["content_raw"] if keepContentRaw else None, response["content"] if keepContent else None) for response in grRes["responses"]]
 
     @staticmethod
-    def _extractPeopleFromGetResponsesRes(grRes):
-        return {} if isinstance(grRes["friends"], list) else {person["uid"]: {"username": person["nick_name"], "displayname": person["display_name"] if "display_name" in person else person["nick_name"]} for person in grRes["friends"].values()}
+    def _extractPeopleFromGetResponsesRes(grRes, knownPeople = ()):
+        # people in knownPeople have been stored already, so they aren't converted again
+        return {} if isinstance(grRes["friends"], list) else {person["uid"]: _Person(person["nick_name"], person["display_name"] if "display_name" in person else person["nick_name"]) for person in grRes["friends"].values() if not person["uid"] in knownPeople}
     
     @staticmethod
     def _extractPeopleFromGetPlurksRes(gpRes):
-        return {} if isinstance(gpRes["plurk_users"], list) else {person["id"]: {"username": person["nick_name"], "displayname": person["display_name"] if "display_name" in person else person["nick_name"]} for person in gpRes["plurk_users"].values()}
+        return {} if isinstance(gpRes["plurk_users"], list) else {person["id"]: _Person(person["nick_name"], person["display_name"] if "display_name" in person else person["nick_name"]) for person in gpRes["plurk_users"].values()}
+
+    @staticmethod
+    def _failPlurk(plurk, error, failedPlurks, incrementalState):
+        # keep the plurk in the backup with the responses of the previous run if there was one, or without responses,
+        # and tell about it at the end; it is left out of the manifest's counts, so the next run fetches it again
+        if incrementalState is None or not incrementalState.restoreResponses(plurk):
+            plurk.responses = []
+        failedPlurks.append((plurk, str(error)))
+
+    def _isUsableGetResponsesRes(self, grRes, attempt):
+        """
+            Whether the attempt-th answer of /API/Responses/get is to be used (True) or asked for again (False).
+            Failed calls have been retried by plurklib already; what is left to retry here are answers without any responses,
+            which plurk.com sometimes gives and then answers properly. An error_text is a definite answer and raises at once.
+        """
+        if "responses" in grRes:
+            return True
+        if "error_text" in grRes:
+            raise PlurackupLibError(grRes["error_text"])
+        if attempt >= self._retryPolicy.max_attempts:
+            raise PlurackupLibError("No responses returned")
+        return False
+
+    def _getResponsesWithRetry(self, plurkObj, plurk, fromResponse):
+        attempt = 1
+        while True:
+            grRes = plurkObj.getResponses(plurk.plurk_id, fromResponse)
+            if self._isUsableGetResponsesRes(grRes, attempt):
+                return grRes
+            time.sleep(self._retryPolicy.delay(attempt))
+            attempt += 1
+
+    def _reportPeopleDirectory(self, peopleDirectory):
+        self._outLogFunc("Added people " + str(peopleDirectory.lockAcquisitionCount) + " time(s), waiting " + "%.3f" % peopleDirectory.lockWaitSeconds + " s in total for the lock.")
+        self._runReport.addSection("people_directory", {"lock_acquisitions": peopleDirectory.lockAcquisitionCount, "lock_wait_seconds": peopleDirectory.lockWaitSeconds})
+
+    def _reportFailedPlurks(self, failedPlurks):
+        if len(failedPlurks) == 0:
+            return
+        self._outLogFunc("** Warning: Responses of " + str(len(failedPlurks)) + " plurk(s) could not be fetched; they are backed up without responses, or with those of the previous backup:")
+        for plurk, reason in failedPlurks:
+            self._outLogFunc("**   plurk " + str(plurk.plurk_id) + " posted at: " + plurk.posted_time + " (" + reason + ")")
+
+    def _loadIncrementalState(self, filename, username):
+        if not self._incremental:
+            return None
+        incrementalState = _IncrementalState(filename, self._incrementalLookbackDays, self._keepContentRaw, self._keepContent)
+        if not incrementalState.load(username):
+            self._outLogFunc("No previous backup to build on; doing a full backup.")
+            return incrementalState
+        self._outLogFunc("Doing an incremental backup on top of the previous one.")
+        return incrementalState
+
+    def _reportFetchPlan(self, fetchPlanner):
+        self._outLogFunc("Fetched responses of " + str(fetchPlanner.plannedCount) + " plurk(s); saved " + str(fetchPlanner.skippedCount + fetchPlanner.reusedCount) + " request(s) for plurks without responses (" + str(fetchPlanner.skippedCount) + ") or with unchanged ones (" + str(fetchPlanner.reusedCount) + ").")
 
-    def doBackup(self, username, password):
+    def _finishIncrementalPaging(self, dataStorage, incrementalState, seenPlurkIds):
+        # the plurks beyond the paged range are taken from the previous backup as they are
+        if incrementalState is None or incrementalState.getHorizon() is None:
+            return
+        # paging covers everything posted at or after the horizon, so an archived plurk from then which wasn't paged has been deleted;
+        # the cut is at the horizon rather than at the oldest paged plurk, which may be well after it. Posted times are in whole seconds
+        olderPlurks = incrementalState.getArchivedPlurksOlderThan(incrementalState.getHorizon() - datetime.timedelta(seconds = 1), seenPlurkIds)
+        dataStorage.addPlurks(olderPlurks)
+        self._outLogFunc("Took " + str(len(olderPlurks)) + " older plurk(s) from the previous backup.")
+
+    def _saveIncrementalState(self, incrementalState, username, dataStorage, failedPlurks):
+        if incrementalState is None:
+            return
+        incrementalState.save(username, dataStorage.getPlurks(), dataStorage.getPeople(), set(plurk.plurk_id for plurk, reason in failedPlurks))
+
+    def _openJournal(self, filename, username, resume):
+        journal = _FetchJournal(filename, self._keepContentRaw, self._keepContent)
+        replayed = journal.replay(username) if resume else None
+        if resume and replayed is None:
+            self._outLogFunc("** Warning: There is no interrupted backup of " + username + " to resume; starting over.")
+        journal.open(username, replayed is not None)
+        return journal, replayed
+
+    def _replayJournal(self, replayed, dataStorage, incrementalState, fetchPlanner, seenPlurkIds):
+        """ Puts what the interrupted run had fetched back into dataStorage.
+            Returns (plurks whose responses are still to be fetched, oldest posted_time paged so far, whether paging had ended).
+        """
+        pages, responses, people, ended = replayed
+        dataStorage.addPeople(people)
+        plurksToFetch = []
+        oldestPostedTime = None
+        for plurks in pages:
+            for plurk in plurks:
+                if plurk.plurk_id in responses:
+                    plurk.responses = responses[plurk.plurk_id]
+            plurksToFetch.extend(fetchPlanner.plan([plurk for plurk in plurks if plurk.responses is None]))
+            dataStorage.addPlurks(plurks)
+            seenPlurkIds.update(plurk.plurk_id for plurk in plurks)
+            oldestPostedTime = plurks[len(plurks) - 1].posted_time
+        plurksToFetch.sort(key = _ResponseFetchPlanner.priorityOf)
+        self._runReport.pageTaken(len(seenPlurkIds), len(plurksToFetch), oldestPostedTime)
+        
+        self._outLogFunc("Resuming after " + str(len(seenPlurkIds)) + " plurk(s) and " + str(len(responses)) + " response thread(s) fetched before.")
+        if incrementalState is not None and oldestPostedTime is not None and incrementalState.isPastHorizon(oldestPostedTime):
+            ended = True
+        return plurksToFetch, oldestPostedTime, ended
+
+    @staticmethod
+    def _extractJoinDateFromLoginRes(loginRes):
+        try:
+            return plurktime.parsePlurkTime(loginRes["user_info"]["join_date"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _trimPageToWindow(plurks, lowerDateTime):
+        """ Returns (the plurks of the new-entry-first page posted at or after lowerDateTime, whether the page reached past it). """
+        if lowerDateTime is None:
+            return plurks, False
+        plurksInWindow = [plurk for plurk in plurks if plurktime.parsePlurkTime(plurk.posted_time) >= lowerDateTime]
+        return plurksInWindow, len(plurksInWindow) < len(plurks)
+
+    def _takeTimelinePage(self, gpRes, lowerDateTime):
+        """ Returns (plurks, people, offsetDateTime) of a getPlurks answer for a window down to lowerDateTime: the plurks in the window,
+            their people, and the offset to page on from, which is None once the window is done. """
+        if len(gpRes["plurks"]) == 0:
+            return [], {}, None
+        plurks, windowEnded = BackupAgent._trimPageToWindow(BackupAgent._extractPlurksFromGetPlurksRes(gpRes, self._keepContentRaw, self._keepContent), lowerDateTime)
+        return plurks, BackupAgent._extractPeopleFromGetPlurksRes(gpRes), None if windowEnded else plurktime.parsePlurkTime(plurks[len(plurks) - 1].posted_time)
+
+    def _splitTimeline(self, newestDateTime, joinDateTime, incrementalState):
+        """
+            Splits the timeline older than newestDateTime into timelineWindowCount windows of equal length, to be paged concurrently.
+            Returns their (upperDateTime, lowerDateTime) newest first; the oldest window's lowerDateTime is None
+            (page until the very first plurk) unless an incremental run has a horizon, which the paging never goes beyond.
+        """
+        floorDateTime = incrementalState.getHorizon() if incrementalState is not None else None
+        # the join date is a day early, as the pagers' offsets are, to get around any timezone issues
+        startDateTime = floorDateTime if floorDateTime is not None else (joinDateTime - datetime.timedelta(1) if joinDateTime is not None else None)
+        if startDateTime is None or self._timelineWindowCount == 1 or startDateTime >= newestDateTime:
+            return [(newestDateTime, floorDateTime)]
+        
+        windowLength = (newestDateTime - startDateTime) // self._timelineWindowCount
+        windows = []
+        upperDateTime = newestDateTime
+        for windowIndex in range(1, self._timelineWindowCount):
+            windows.append((upperDateTime, newestDateTime - windowLength * windowIndex))
+            upperDateTime = newestDateTime - windowLength * windowIndex
+        windows.append((upperDateTime, floorDateTime))
+        return windows
+
+    def _takePage(self, plurks, people, journal, addPeopleFunc, dataStorage, fetchPlanner, seenPlurkIds):
+        """ Hands a timeline page over to dataStorage, in timeline order. Returns the plurks whose responses are to be fetched. """
+        # neighbouring windows may both have got plurks posted right at their boundary
+        plurks = [plurk for plurk in plurks if not plurk.plurk_id in seenPlurkIds]
+        if len(plurks) == 0:
+            return []
+        journal.recordPage(plurks, people)
+        addPeopleFunc(people)
+        
+        # plan the fetches before handing the page over to dataStorage: plurks needing no fetch are complete already
+        plurksToFetch = fetchPlanner.plan(plurks)
+        dataStorage.addPlurks(plurks)
+        seenPlurkIds.update(plurk.plurk_id for plurk in plurks)
+        self._runReport.pageTaken(len(plurks), len(plurksToFetch), plurks[len(plurks) - 1].posted_time)
+        return plurksToFetch
+
+    @staticmethod
+    def _extractDisplayNameFromLoginRes(loginRes, username):
+        return loginRes["user_info"]["display_name"] if "display_name" in loginRes["user_info"] and loginRes["user_info"]["display_name"] != "" else username
+
+    def _callObserver(self):
+        """ Returns what the API objects are to tell about their calls. """
+        return self._runReport if self._concurrency is None else _CallObserverGroup([self._runReport, self._concurrency])
+
+    def _reportConcurrency(self):
+        if self._concurrency is None:
+            return
+        self._outLogFunc("Kept " + str(self._concurrency.lowestLimit) + " to " + str(self._concurrency.highestLimit) + " response request(s) in flight, backing off " + str(self._concurrency.backoffCount) + " time(s); ended at " + str(self._concurrency.getLimit()) + ".")
+        self._runReport.addSection("adaptive_concurrency", {"lowest_limit": self._concurrency.lowestLimit, "highest_limit": self._concurrency.highestLimit,
+                                                            "final_limit": self._concurrency.getLimit(), "backoffs": self._concurrency.backoffCount})
+
+    def _runSettings(self):
+        """ What the run report tells about how the run was set up. """
+        return {"engine": "threads", "response_fetcher_count": self._responseFetcherCount, "fetch_queue_size": self._fetchQueueSize, "plurks_per_request": self._plurksPerRequest,
+                "max_attempts": self._retryPolicy.max_attempts, "requests_per_second": self._requestsPerSecond, "timeline_window_count": self._timelineWindowCount,
+                "render_process_count": self._renderProcessCount, "streaming_output": self._streamingOutput, "incremental": self._incremental,
+                "adaptive_concurrency": self._concurrency is not None}
+
+    def _startProgressLine(self, windows, newestDateTime, joinDateTime):
+        """ Tells the run report what is to be paged and starts the progress line, if any; returns it, for _stopProgressLine(). """
+        if len(windows) > 0:
+            # the oldest window ends at the incremental horizon, or pages until the very first plurk
+            self._runReport.pagingStarted(newestDateTime, windows[len(windows) - 1][1] if windows[len(windows) - 1][1] is not None else joinDateTime)
+        else:
+            self._runReport.pagingEnded()
+        if self._progressFunc is None:
+            return None
+        progressLine = _ProgressLine(self._runReport, self._progressFunc)
+        progressLine.start()
+        return progressLine
+
+    def _stopProgressLine(self, progressLine):
+        if progressLine is not None:
+            progressLine.stop()
+
+    def _writeRunReport(self, filename, fetchPlanner, failedPlurks):
+        if not self._writesRunReport:
+            return
+        reportFilename = filename + ".report.json"
+        self._runReport.addSection("fetch_plan", {"planned": fetchPlanner.plannedCount, "skipped": fetchPlanner.skippedCount, "reused": fetchPlanner.reusedCount, "failed": len(failedPlurks)})
+        self._runReport.write(reportFilename, self._outputFiles(filename))
+        self._outLogFunc("Wrote a report of this run into " + reportFilename + " .")
+
+    def doBackup(self, username, password, resume = False):
+        """ With resume, picks up what an interrupted run with the same output filename had fetched so far. """
+        self._runReport.begin(self._runSettings())
         self._outLogFunc("Logging in...")
         loginRes = self._plurkObj.login(username, password)
         if "error_text" in loginRes:
             self._outLogFunc("Login failed.")
             return
         
-        displayName = loginRes["user_info"]["display_name"] if "display_name" in loginRes["user_info"] and loginRes["user_info"]["display_name"] != "" else username
+        displayName = BackupAgent._extractDisplayNameFromLoginRes(loginRes, username)
+        joinDateTime = BackupAgent._extractJoinDateFromLoginRes(loginRes)
         
         self._outLogFunc((b"Login was successful; Display name: " + displayName.encode("utf-8")).decode("utf-8"))
         
         filename = self._outFilename if self._outFilename != "" else username
         
-        dataStorage = _DataStorage()
-        addPeopleLock = threading.RLock()
+        fileFronts = self._createFileFronts(filename, username, displayName)
+        dataStorage = _StreamingDataStorage(fileFronts, self._outputSink.isCompressing()) if self._streamingOutput else _DataStorage()
+        peopleDirectory = _PeopleDirectory(dataStorage.addPeople)
+        failedPlurks = []
+        
+        incrementalState = self._loadIncrementalState(filename, username)
+        if incrementalState is not None:
+            dataStorage.addPeople(incrementalState.getArchivedPeople())
+        fetchPlanner = _ResponseFetchPlanner(incrementalState)
+        seenPlurkIds = set()
+        oldestPostedTime = None
+        pagingEnded = False
         
-        responseFetchers = []
+        journal, replayed = self._openJournal(filename, username, resume)
+        
+        scheduler = _ResponseFetchScheduler(self._responseFetcherCount, self._fetchQueueSize, lambda scheduler: BackupAgent._ResponseFetcher(scheduler, self, peopleDirectory, dataStorage.plurkCompleted, failedPlurks, journal, incrementalState), self._runReport, self._concurrency)
+        scheduler.start()
+        
+        if replayed is not None:
+            plurksToFetch, oldestPostedTime, pagingEnded = self._replayJournal(replayed, dataStorage, incrementalState, fetchPlanner, seenPlurkIds)
+            for plurk in plurksToFetch:
+                scheduler.submit(plurk)
         
         self._outLogFunc("Begin to fetch plurks and responses...")
        
         # add one day to get around any timezone issues (yeah, though we have UTC-12 through UTC+14 = 26 hours, though.)
-        currentOffsetDateTime = (datetime.datetime.now() + datetime.timedelta(1))
-        while True: # break when gpRes has zero content
-            gpRes = self._plurkObj.getOwnPlurks(currentOffsetDateTime.strftime("%Y-%m-%dT%H:%M:%S"), self._plurksPerRequest)
-            if len(gpRes["plurks"]) == 0:
-                break
-            
-            plurks = BackupAgent._extractPlurksFromGetPlurksRes(gpRes)
-            
-            addPeopleLock.acquire()
-            dataStorage.addPeople(BackupAgent._extractPeopleFromGetPlurksRes(gpRes))
-            addPeopleLock.release()
-            
-            for plurk in plurks:
-                responseFetcher = BackupAgent._ResponseFetcher(plurk, self, addPeopleLock, lambda people: dataStorage.addPeople(people))
-                responseFetcher.start()
-                responseFetchers.append(responseFetcher)
-                
-            dataStorage.addPlurks(plurks)
+        newestDateTime = (datetime.datetime.now() + datetime.timedelta(1)) if oldestPostedTime is None else plurktime.parsePlurkTime(oldestPostedTime)
+        windows = [] if pagingEnded else self._splitTimeline(newestDateTime, joinDateTime, incrementalState)
+        # the older windows' pages wait until the newer windows are through, which is only bounded when streaming:
+        # then each window may page ahead by as many plurks as may wait in the fetch queue
+        pageQueueSize = max(self._fetchQueueSize // max(self._plurksPerRequest, 1), 1) if self._streamingOutput else 0
+        pagers = [BackupAgent._TimelinePager(self, upperDateTime, lowerDateTime, pageQueueSize) for upperDateTime, lowerDateTime in windows]
+        if len(pagers) > 1:
+            self._outLogFunc("Paging the timeline in " + str(len(pagers)) + " windows at once...")
+        progressLine = self._startProgressLine(windows, newestDateTime, joinDateTime)
+        for pager in pagers:
+            pager.start()
         
-            currentOffsetDateTime = datetime.datetime.strptime(plurks[len(plurks) - 1]["posted_time"], "%a, %d %b %Y %H:%M:%S %Z")
+        # the windows are paged concurrently, but their pages are taken in timeline order
+        for pager in pagers:
+            while True:
+                page = pager.pageQueue.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                
+                plurks, people = page
+                plurksToFetch = self._takePage(plurks, people, journal, peopleDirectory.addPeople, dataStorage, fetchPlanner, seenPlurkIds)
+                for plurk in plurksToFetch:
+                    scheduler.submit(plurk)
+                oldestPostedTime = plurks[len(plurks) - 1].posted_time
             
+        journal.recordEnd()
+        self._runReport.pagingEnded()
+        self._finishIncrementalPaging(dataStorage, incrementalState, seenPlurkIds)
 
         self._outLogFunc("Waiting for outstanding response fetcher threads to join...")
-        for responseFetcher in responseFetchers:
-            responseFetcher.join()
+        scheduler.join()
+        journal.close()
+        self._stopProgressLine(progressLine)
         
         self._outLogFunc("Fetching is done. Logging out.")
         self._plurkObj.logout()
+        connectionStats = self._plurkObj.getConnectionStats()
+        self._plurkObj.close()
+        self._outLogFunc("Opened " + str(connectionStats["created"]) + " connection(s), reused them " + str(connectionStats["reused"]) + " time(s).")
+        self._runReport.addSection("connections", connectionStats)
+        self._reportConcurrency()
+        self._reportFetchPlan(fetchPlanner)
+        self._reportPeopleDirectory(peopleDirectory)
+        self._reportFailedPlurks(failedPlurks)
         
-        fileFronts = _MultipleFileFront()
+        self._saveIncrementalState(incrementalState, username, dataStorage, failedPlurks)
+        self._writeOutput(dataStorage, fileFronts, filename)
+        self._writeRunReport(filename, fetchPlanner, failedPlurks)
+        journal.remove()
+
+    def _createFileFronts(self, filename, username, displayName):
+        # streamed pages are rendered as they complete, by the fetching threads, so only the final writing goes through render processes
+        fileFronts = _MultipleFileFront(1 if self._streamingOutput else self._renderProcessCount)
+        leafFileFronts = []
         if self._xmlOut:
-            fileFronts.attachFileFront(_XMLFileFront(filename))
-        if self._htmlOut:
-            fileFronts.attachFileFront(_HTMLFileFront(filename, username, displayName, self._htmlTimeOffsetSign, self._htmlTimeOffsetHour, self._htmlTimeOffsetMinute, self._cssFilename, self._outLogFunc))
-        
+            leafFileFronts.append(_XMLFileFront(filename, self._outputSink))
+        if self._htmlOut and self._htmlPaged:
+            leafFileFronts.append(_PagedHTMLFileFront(filename, username, displayName, self._htmlTimeOffsetSign, self._htmlTimeOffsetHour, self._htmlTimeOffsetMinute, self._cssFilename, self._outLogFunc, self._htmlPlurksPerPage))
+        elif self._htmlOut:
+            leafFileFronts.append(_HTMLFileFront(filename, username, displayName, self._htmlTimeOffsetSign, self._htmlTimeOffsetHour, self._htmlTimeOffsetMinute, self._cssFilename, self._outLogFunc, self._outputSink))
+        if self._sqliteOut:
+            leafFileFronts.append(_SQLiteFileFront(filename))
+        if self._jsonlOut:
+            leafFileFronts.append(_JSONLinesFileFront(filename, self._outputSink))
+        for fileFront in leafFileFronts:
+            fileFronts.attachFileFront(_TimedFileFront(fileFront, self._runReport))
+        return fileFronts
+
+    def _outputFiles(self, filename):
+        """ Returns the (formatName, filename) of the outputs; paged HTML's is its index. """
+        outputFiles = []
+        if self._xmlOut:
+            outputFiles.append((_XMLFileFront.formatName, filename + ".xml" + self._outputSink.getExtension()))
+        if self._htmlOut and self._htmlPaged:
+            outputFiles.append((_PagedHTMLFileFront.formatName, os.path.join(filename + "_html", "index.html")))
+        elif self._htmlOut:
+            outputFiles.append((_HTMLFileFront.formatName, filename + ".html" + self._outputSink.getExtension()))
+        if self._sqliteOut:
+            outputFiles.append((_SQLiteFileFront.formatName, filename + ".sqlite"))
+        if self._jsonlOut:
+            outputFiles.append((_JSONLinesFileFront.formatName, filename + ".jsonl" + self._outputSink.getExtension()))
+        return outputFiles
+
+    def _writeOutput(self, dataStorage, fileFronts, filename):
         self._outLogFunc("Writing to file...")
+        self._writeFileFronts(fileFronts, filename, lambda: dataStorage.flushToFileFront(fileFronts))
+        
+    def _writeFileFronts(self, fileFronts, filename, writeFunc):
+        """ Prepares fileFronts, has writeFunc write into them and postpares them, then tells where the backup went. """
+        startTime = time.time()
+        uncompressedByteCount = self._outputSink.uncompressedByteCount
+        compressedByteCount = self._outputSink.compressedByteCount
         fileFronts.prepare()
-        dataStorage.flushToFileFront(fileFronts)
+        writeFunc()
         fileFronts.postpare()
-
-        self._outLogFunc("Your plurks are now backed up in " + filename + ".xml and/or " + filename + ".html .")
+        
+        if self._outputSink.isCompressing():
+            seconds = time.time() - startTime
+            uncompressedByteCount = self._outputSink.uncompressedByteCount - uncompressedByteCount
+            compressedByteCount = self._outputSink.compressedByteCount - compressedByteCount
+            self._outLogFunc("Compressed {0:.1f} MB of output into {1:.1f} MB ({2:.1f}x), at {3:.1f} MB/s.".format(uncompressedByteCount / 1048576.0, compressedByteCount / 1048576.0,
+                                                                                                               uncompressedByteCount / float(max(compressedByteCount, 1)), uncompressedByteCount / 1048576.0 / max(seconds, 0.001)))
+        
+        self._outLogFunc("Your plurks are now backed up in " + " and ".join(outputFilename for formatName, outputFilename in self._outputFiles(filename)) + " .")
+        
+    def rerenderArchive(self, archiveFilename, username, displayName = ""):
+        """ Writes the selected outputs again from a backup on disk instead of from plurk.com - to apply another timezone offset
+            or stylesheet, say - without logging in. archiveFilename is an .xml or .jsonl backup, possibly compressed; it is read
+            RERENDER_BATCH_SIZE plurks at a time, so memory doesn't grow with the size of the account.
+            XML backups have no HTML content, so HTML rendered from them shows content_raw instead; .jsonl backups have everything.
+            XML backups don't have the uids of people either, which _XMLArchiveReader makes up, so they can't be re-rendered
+            into the SQLite database or JSON Lines, which keep uids: those would get mixed up with the real ones.
+            username and displayName are the owner's, for the titles.
+        """
+        filename = self._outFilename if self._outFilename != "" else username
+        for formatName, outputFilename in self._outputFiles(filename):
+            if os.path.abspath(outputFilename) == os.path.abspath(archiveFilename):
+                raise PlurackupLibError("Re-rendering " + archiveFilename + " would overwrite it; choose another output filename")
+        isJSONLines = re.sub(r"\.(gz|bz2|xz)$", "", archiveFilename).endswith(".jsonl")
+        if not isJSONLines and (self._sqliteOut or self._jsonlOut):
+            raise PlurackupLibError("XML backups don't keep the uids of people, so " + archiveFilename + " can't be re-rendered into SQLite or JSON Lines; re-render a .jsonl backup instead")
+        reader = _JSONLinesReader(archiveFilename) if isJSONLines else _XMLArchiveReader(archiveFilename)
+        fileFronts = self._createFileFronts(filename, username, displayName if displayName != "" else username)
+        plurkCounts = [0]
+        
+        def writeArchive():
+            plurks = []
+            people = {}
+            for plurk, plurkPeople in reader:
+                people.update(plurkPeople)
+                plurks.append(plurk)
+                if len(plurks) >= BackupAgent.RERENDER_BATCH_SIZE:
+                    fileFronts.writePlurks(plurks, people)
+                    plurkCounts[0] += len(plurks)
+                    plurks = []
+            if len(plurks) > 0:
+                fileFronts.writePlurks(plurks, people)
+                plurkCounts[0] += len(plurks)
+        
+        self._outLogFunc("Re-rendering " + archiveFilename + "...")
+        self._writeFileFronts(fileFronts, filename, writeArchive)
+        self._outLogFunc("Re-rendered " + str(plurkCounts[0]) + " plurk(s).")
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+    Copyright (c) 2011-2013 Mnjul/purincess (Min-Zhong Lu)
+    Based on plurklib from Kurt Karakurt (http://code.google.com/p/plurklib/)
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+"""
+"""
+    asyncio flavor of plurklib's PlurkAPI. python 3 only.
+
+    Every API call is a coroutine. HTTP/1.1 is spoken directly over asyncio streams,
+    so idle connections are kept alive and reused by later calls.
+"""
+import asyncio
+import email.parser
+import http.client
+import http.cookiejar
+import json
+import ssl
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from plurklib import RetryPolicy
+
+
+class _AsyncResponse:
+    """ The bits of a response which http.cookiejar and urllib.error.HTTPError need. """
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def info(self):
+        return self.headers
+
+
+class AsyncPlurkAPI:
+
+    def __init__(self, key, retry_policy=None, rate_limiter=None, host='www.plurk.com', secure=True, observer=None):
+        """ Required parameters:
+                key: Your Plurk API key.
+            Optional parameters:
+                retry_policy: A plurklib.RetryPolicy for failed calls. By default a call is attempted only once.
+                rate_limiter: A plurklib.TokenBucket every call has to go through.
+                host, secure, observer: As for plurklib.PlurkAPI.
+        """
+        self._api_key = key
+        self._username = None
+        self._password = None
+        self._host = host
+        self._secure = secure
+        self._cookies = http.cookiejar.CookieJar()
+        self._idle_connections = {}   # {https: [(reader, writer)]}
+        self._ssl_context = ssl.create_default_context()
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy(1)
+        self._rate_limiter = rate_limiter
+        self._observer = observer
+
+    async def close(self):
+        """ Close all idle keep-alive connections. """
+        for connections in self._idle_connections.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle_connections = {}
+
+    async def _open_connection(self, https):
+        connections = self._idle_connections.setdefault(https, [])
+        while connections:
+            reader, writer = connections.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        host, _, port = self._host.partition(":")
+        if https:
+            reader, writer = await asyncio.open_connection(host, int(port) if port else 443, ssl=self._ssl_context)
+        else:
+            reader, writer = await asyncio.open_connection(host, int(port) if port else 80)
+        return reader, writer, False
+
+    async def _read_response(self, reader):
+        statusLine = await reader.readline()
+        if not statusLine:
+            raise ConnectionResetError("Connection closed before response")
+        version, status, reason = (statusLine.decode("iso-8859-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        headerBlock = await reader.readuntil(b"\r\n\r\n")
+        headers = email.parser.Parser(_class=http.client.HTTPMessage).parsestr(headerBlock.decode("iso-8859-1"))
+
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                chunkSize = int((await reader.readline()).split(b";")[0], 16)
+                if chunkSize == 0:
+                    await reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await reader.readexactly(chunkSize))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif headers.get("Content-Length") is not None:
+            body = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            # the body extends to the end of the connection, which can thus not be reused
+            body = await reader.read()
+            return _AsyncResponse(int(status), reason, headers, body), False
+
+        keepAlive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+        return _AsyncResponse(int(status), reason, headers, body), keepAlive
+
+    async def _call_api(self, apirequest, parameters, https=False):
+        """ Send a request to Plurk API and decode response.
+            Same as PlurkAPI._call_api, but as a coroutine.
+        """
+        https = https and self._secure
+        attempt = 1
+        while True:
+            if self._rate_limiter is not None:
+                wait = self._rate_limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            exchange = {'status': None, 'sent': 0, 'received': 0}
+            started = time.time()
+            try:
+                response = await self._call_api_once(apirequest, dict(parameters), https, exchange)
+            except Exception as error:
+                if self._observer is not None:
+                    self._observer.attempted(apirequest, attempt, time.time() - started, exchange, error)
+                if attempt >= self._retry_policy.max_attempts or not self._retry_policy.is_retryable(error):
+                    raise
+            else:
+                if self._observer is not None:
+                    self._observer.attempted(apirequest, attempt, time.time() - started, exchange, None)
+                return response
+            await asyncio.sleep(self._retry_policy.delay(attempt))
+            attempt += 1
+
+    async def _call_api_once(self, apirequest, parameters, https, exchange=None):
+        parameters['api_key'] = self._api_key
+        post = urllib.parse.urlencode(parameters).encode("utf-8")
+        url = ('https://' if https else 'http://') + self._host + apirequest
+        request = urllib.request.Request(url = url, data = post)
+        self._cookies.add_cookie_header(request)
+
+        head = "POST " + apirequest + " HTTP/1.1\r\n"
+        head += "Host: " + self._host + "\r\n"
+        head += "Content-Type: application/x-www-form-urlencoded\r\n"
+        head += "Content-Length: " + str(len(post)) + "\r\n"
+        if request.has_header("Cookie"):
+            head += "Cookie: " + request.get_header("Cookie") + "\r\n"
+        head += "\r\n"
+
+        while True:
+            reader, writer, reused = await self._open_connection(https)
+            try:
+                writer.write(head.encode("iso-8859-1") + post)
+                await writer.drain()
+                response, keepAlive = await self._read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # the server may have dropped an idle connection; retry once on a fresh one
+                if reused:
+                    continue
+                raise
+            break
+
+        if keepAlive:
+            self._idle_connections.setdefault(https, []).append((reader, writer))
+        else:
+            writer.close()
+
+        self._cookies.extract_cookies(response, request)
+        if exchange is not None:
+            exchange['status'] = response.status
+            exchange['sent'] = len(post)
+            exchange['received'] = len(response.body)
+
+        if response.status == 400:
+            return json.loads(response.body.decode("utf-8"))
+        if response.status != 200:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        return json.loads(response.body.decode("utf-8"))
+
+#=================================== Users ===================================
+
+    async def login(self, username, password, no_data=None):
+        """ Log in to Plurk. See PlurkAPI.login. """
+        self._username = username
+        self._password = password
+        parameters = {'username': username,
+                      'password': password}
+        if no_data != None:
+            parameters['no_data'] = no_data
+        request = '/API/Users/login'
+        response = await self._call_api(request, parameters, True)
+        return response
+
+    async def logout(self):
+        """ Logout from Plurk. See PlurkAPI.logout. """
+        parameters = {}
+        request = '/API/Users/logout'
+        response = await self._call_api(request, parameters)
+        return response
+
+#=================================== Timeline ===================================
+
+    async def getOwnPlurks(self, offset = None, limit = 20):
+        parameters = {'offset': offset,
+                  'limit': limit,
+                  'only_user': "yes",
+                  'favorers_detail': "true",
+                  'limited_detail': "true",
+                  'replurkers_detail': "true"}
+        request = '/API/Timeline/getPlurks'
+        response = await self._call_api(request, parameters)
+        return response
+
+#=================================== Responses ===================================
+
+    async def getResponses(self, plurk_id, from_response):
+        """ Fetches responses for plurk with plurk_id. See PlurkAPI.getResponses. """
+        parameters = {'plurk_id': plurk_id,
+                      'from_response': from_response}
+        request = '/API/Responses/get'
+        response = await self._call_api(request, parameters)
+        return response
@@ -21,13 +21,25 @@
     THE SOFTWARE.
 """
 import sys
+import copy
+import random
+import socket
+import threading
+import time
 import urllib
 import json
 if sys.version[:1] == '3':
-    import http.cookiejar
+    import http.client as httplib
+    import http.cookiejar as cookielib
+    import urllib.error
+    import urllib.parse
+    import urllib.request
+    _HTTPError = urllib.error.HTTPError
 elif sys.version[:1] == '2':
+    import httplib
     import urllib2
     import cookielib
+    _HTTPError = urllib2.HTTPError
 else:
     raise PlurklibError("Your python interpreter is too old. Please consider upgrading.")
 
@@ -39,19 +51,172 @@ class PlurklibError(Exception):
     def __str__(self):
         return repr(self.value)
 
+class RetryPolicy:
+    """ Decides which failed API calls are retried, and how long to wait before the next attempt.
+        Waits grow exponentially with "full jitter", so that many clients failing at the same moment
+        don't all come back at the same moment either.
+    """
+    
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, retry_statuses=(429, 500, 502, 503, 504)):
+        """ Optional parameters:
+                max_attempts: How many times a call is attempted in total before giving up.
+                base_delay: Upper bound (seconds) of the wait after the first failed attempt; doubled after every further one.
+                max_delay: Upper bound (seconds) of any single wait.
+                retry_statuses: HTTP status codes that are worth retrying.
+        """
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        
+    def is_retryable(self, error):
+        if isinstance(error, _HTTPError):
+            return error.code in self.retry_statuses
+        return isinstance(error, (httplib.HTTPException, socket.error, EOFError))
+    
+    def delay(self, attempt):
+        """ Returns the number of seconds to wait after the attempt-th (1-based) failed attempt. """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+class TokenBucket:
+    """ Thread-safe client-side rate limiter: allows rate calls per second on average, and bursts of up to burst calls.
+        Share one instance among all the PlurkAPI objects which should be limited together.
+    """
+    
+    def __init__(self, rate, burst=None):
+        self._rate = float(rate)
+        self._burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self._burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+        
+    def reserve(self):
+        """ Takes a token and returns the number of seconds the caller has to wait before using it. """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0 if self._tokens >= 0 else -self._tokens / self._rate
+        
+    def acquire(self):
+        """ Blocks until a call is allowed. """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+class CallObserver:
+    """ Is told about every attempt at every API call; pass one as observer to PlurkAPI to collect timings and counts.
+        attempted() is called from whichever thread made the call, so it has to be thread-safe.
+    """
+    
+    def attempted(self, apirequest, attempt, seconds, exchange, error):
+        """ An attempt at a call has ended.
+                apirequest: The path to API's function, like: '/API/Responses/get'
+                attempt: 1 for the first attempt at a call, 2 for its first retry, and so on.
+                seconds: How long the attempt took, without the rate limiter's wait.
+                exchange: {'status': 200, 'sent': 512, 'received': 2048}; status is None if no response came back,
+                          sent and received count the bytes of the request and response bodies.
+                error: The exception the attempt raised, or None.
+        """
+        pass
+
+class _ResponseInfo:
+    """ Lets cookielib read the headers of an httplib response, which it expects to come from urlopen. """
+    def __init__(self, response):
+        self._response = response
+        
+    def info(self):
+        return self._response.msg
+
+class _ConnectionPool:
+    """ Thread-safe pool of persistent (keep-alive) HTTP and HTTPS connections to a single host.
+        Connections are created on demand; at most size idle connections per scheme are kept for reuse
+        and the surplus ones are closed when released.
+    """
+    
+    def __init__(self, host, size):
+        self._host = host
+        self._size = max(size, 1)
+        self._idle = {True: [], False: []}
+        self._lock = threading.Lock()
+        self.connectionsCreated = 0
+        self.connectionsReused = 0
+        
+    def acquire(self, https):
+        """ Returns (connection, reused) """
+        with self._lock:
+            if self._idle[https]:
+                self.connectionsReused += 1
+                return self._idle[https].pop(), True
+            self.connectionsCreated += 1
+        if https:
+            connection = httplib.HTTPSConnection(self._host)
+        else:
+            connection = httplib.HTTPConnection(self._host)
+        connection.connect()
+        # headers and body go out in separate segments; don't let Nagle hold the body back on a kept-alive connection
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection, False
+        
+    def release(self, https, connection):
+        with self._lock:
+            if len(self._idle[https]) < self._size:
+                self._idle[https].append(connection)
+                return
+        connection.close()
+        
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {True: [], False: []}
+
 class PlurkAPI:
 
-    def __init__(self, key):
+    def __init__(self, key, pool_size=4, retry_policy=None, rate_limiter=None, host='www.plurk.com', secure=True, observer=None):
         """ Required parameters:
                 key: Your Plurk API key.
+            Optional parameters:
+                pool_size: How many idle keep-alive connections to keep for reuse, per scheme (HTTP/HTTPS).
+                retry_policy: A RetryPolicy for failed calls. By default a call is attempted only once.
+                rate_limiter: A TokenBucket every call has to go through.
+                host: The host (and port) to send calls to; another one than plurk.com's is for stand-in servers, like plurkmock's.
+                secure: If it's set to False, calls which would use HTTPS use plain HTTP instead.
+                observer: A CallObserver told about every attempt at every call.
         """
         self._api_key = key
         self._username = None
         self._password = None
+        self._host = host
+        self._secure = secure
+        self._cookies = cookielib.CookieJar()
+        self._pool = _ConnectionPool(self._host, pool_size)
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy(1)
+        self._rate_limiter = rate_limiter
+        self._observer = observer
         #self._logged_in = False
         #self._uid = -1
         # self._friends = {}
 
+    def spawnSession(self):
+        """ Returns another PlurkAPI object which shares the login cookies and connection pool of this one.
+            Meant for worker threads which each want their own API object.
+        """
+        # a shallow copy; python 2's old-style classes have no __new__ to make a blank one with
+        return copy.copy(self)
+
+    def getConnectionStats(self):
+        """ Returns how many connections have been opened and how many times an idle one has been reused, e.g.
+                {'created': 3, 'reused': 120}
+        """
+        return {'created': self._pool.connectionsCreated, 'reused': self._pool.connectionsReused}
+
+    def close(self):
+        """ Closes all idle connections. """
+        self._pool.close()
+
     def _call_api(self, apirequest, parameters, https=False):
         """ Send a request to Plurk API and decode response.
             Required parameters:
@@ -61,61 +226,96 @@ class PlurkAPI:
                 https: If it's set to True, then HTTPS and SSL are used for the API call.
             Successful return:
                 The parsed dict object is returned for further processing.
+            Failures which the retry policy deems retryable are retried after a backoff;
+            the error of the last attempt is raised once all attempts have failed.
         """
-        if sys.version[:1] == '3':
-            return self._python3_call_api(apirequest, parameters, https)
-        elif sys.version[:1] == '2': 
-            return self._python2_call_api(apirequest, parameters, https)
-        else:
-            raise PlurklibError("Your python interpreter is too old. Please consider upgrading.")
+        https = https and self._secure
+        attempt = 1
+        while True:
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            exchange = {'status': None, 'sent': 0, 'received': 0}
+            started = time.time()
+            try:
+                if sys.version[:1] == '3':
+                    response = self._python3_call_api(apirequest, dict(parameters), https, exchange)
+                elif sys.version[:1] == '2': 
+                    response = self._python2_call_api(apirequest, dict(parameters), https, exchange)
+                else:
+                    raise PlurklibError("Your python interpreter is too old. Please consider upgrading.")
+            except Exception as error:
+                if self._observer is not None:
+                    self._observer.attempted(apirequest, attempt, time.time() - started, exchange, error)
+                if attempt >= self._retry_policy.max_attempts or not self._retry_policy.is_retryable(error):
+                    raise
+            else:
+                if self._observer is not None:
+                    self._observer.attempted(apirequest, attempt, time.time() - started, exchange, None)
+                return response
+            time.sleep(self._retry_policy.delay(attempt))
+            attempt += 1
         
-    def _python2_call_api(self, apirequest, parameters, https=False):
+    def _python2_call_api(self, apirequest, parameters, https=False, exchange=None):
         parameters['api_key'] = self._api_key
         post = urllib.urlencode(parameters)
         if https:
-            request = urllib2.Request(url = 'https://www.plurk.com' + apirequest, data = post)
+            request = urllib2.Request(url = 'https://' + self._host + apirequest, data = post)
         else:
-            request = urllib2.Request(url = 'http://www.plurk.com' + apirequest, data = post)
-        try:
-            response = urllib2.urlopen(request)
-        except urllib2.HTTPError as message:
-            if message.code == 400:
-                response = json.loads(message.fp.read().decode("utf-8"))
-                return response
-            else:
-                raise message
-
-        if apirequest == '/API/Users/login':
-            cookies = cookielib.CookieJar()
-            opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cookies))
-            urllib2.install_opener(opener)
-            cookies.extract_cookies(response, request)
-        result = json.loads(response.read().decode("utf-8"))
-        return result
+            request = urllib2.Request(url = 'http://' + self._host + apirequest, data = post)
+        status, reason, headers, body = self._pooled_post(request, apirequest, post, https, exchange)
+        if status == 400:
+            return json.loads(body.decode("utf-8"))
+        elif status != 200:
+            raise urllib2.HTTPError(request.get_full_url(), status, reason, headers, None)
+        return json.loads(body.decode("utf-8"))
         
-    def _python3_call_api(self, apirequest, parameters, https=False):
+    def _python3_call_api(self, apirequest, parameters, https=False, exchange=None):
         parameters['api_key'] = self._api_key
         post = urllib.parse.urlencode(parameters).encode("utf-8")
         if https:
-            request = urllib.request.Request(url = 'https://www.plurk.com' + apirequest, data = post)
+            request = urllib.request.Request(url = 'https://' + self._host + apirequest, data = post)
         else:
-            request = urllib.request.Request(url = 'http://www.plurk.com' + apirequest, data = post)
-        try:
-            response = urllib.request.urlopen(request)
-        except urllib.error.HTTPError as message:
-            if message.code == 400:
-                response = json.loads(message.fp.read().decode("utf-8"))
-                return response
-            else:
-                raise message
-            
-        if apirequest == '/API/Users/login':
-            cookies = http.cookiejar.CookieJar()
-            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
-            urllib.request.install_opener(opener)
-            cookies.extract_cookies(response, request)
-        result = json.loads(response.read().decode("utf-8"))
-        return result
+            request = urllib.request.Request(url = 'http://' + self._host + apirequest, data = post)
+        status, reason, headers, body = self._pooled_post(request, apirequest, post, https, exchange)
+        if status == 400:
+            return json.loads(body.decode("utf-8"))
+        elif status != 200:
+            raise urllib.error.HTTPError(request.get_full_url(), status, reason, headers, None)
+        return json.loads(body.decode("utf-8"))
+
+    def _pooled_post(self, request, apirequest, post, https, exchange=None):
+        """ POST request over a pooled keep-alive connection, with cookies from and to this session's cookie jar.
+            Returns (status, reason, headers, body), and fills them in exchange for the CallObserver.
+        """
+        self._cookies.add_cookie_header(request)
+        headers = dict(request.header_items())
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        
+        while True:
+            connection, reused = self._pool.acquire(https)
+            try:
+                connection.request('POST', apirequest, post, headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                # the server may have dropped an idle connection; retry once on a fresh one
+                if reused:
+                    continue
+                raise
+            break
+        
+        if response.will_close:
+            connection.close()
+        else:
+            self._pool.release(https, connection)
+        
+        self._cookies.extract_cookies(_ResponseInfo(response), request)
+        if exchange is not None:
+            exchange['status'] = response.status
+            exchange['sent'] = len(post)
+            exchange['received'] = len(body)
+        return response.status, response.reason, response.msg, body
 
 #=================================== Users ===================================
 
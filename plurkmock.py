@@ -0,0 +1,274 @@
+"""
+    Copyright (c) 2011-2013 Mnjul/purincess (Min-Zhong Lu)
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+"""
+"""
+    A local stand-in for the part of the Plurk API plurackup uses, serving a synthetic account over plain HTTP,
+    so that backups can be run, timed and compared without plurk.com or real credentials:
+        /API/Users/login, /API/Users/logout, /API/Timeline/getPlurks, /API/Responses/get
+    Any username and password log in. BackupAgent is pointed at it with apiHost = server.getHost().
+
+    python plurkmock.py [plurkCount [port]] serves an account until interrupted.
+"""
+import bisect
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+
+# plurktime.PLURK_TIME_FORMAT ends in %Z, which strftime leaves empty for the naive datetimes used here
+_PLURK_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+class SyntheticAccount:
+    """
+        A made-up account of plurkCount plurks, posted a minute to a day apart since joinDateTime.
+        A plurk has no responses with probability noResponseShare; otherwise how many it has is drawn from an exponential
+        distribution with mean meanResponses, capped at maxResponses. Responses are by peopleCount people, and by a few
+        more who have left plurk since, whom the API doesn't tell about.
+        Everything follows from seed, so an account comes out the same every time. Responses are made up whenever
+        they are asked for, instead of being kept.
+    """
+    def __init__(self, plurkCount = 1000, meanResponses = 10.0, noResponseShare = 0.3, maxResponses = 500, peopleCount = 200, seed = 1):
+        randomness = random.Random(seed)
+        self._seed = seed
+        self._maxUid = peopleCount + peopleCount // 10 + 1
+        self.joinDateTime = datetime.datetime(2009, 1, 1)
+        self._people = dict((uid, {"id": uid, "uid": uid, "nick_name": "plurker" + str(uid), "display_name": (u"Plurker \u5c0f%d <%d>" % (uid, uid)) if uid % 4 else ""})
+                            for uid in range(1, peopleCount + 1))
+        self._plurks = []        # old-entry-first, as getPlurks returns them
+        self._postedTimes = []   # the plurks' posted times as datetimes, ascending
+        self._plurkIndexes = {}
+        postedDateTime = self.joinDateTime
+        for index in range(plurkCount):
+            postedDateTime += datetime.timedelta(seconds = randomness.randint(60, 86400))
+            plurkId = 100000000 + index * 7
+            responseCount = 0 if randomness.random() < noResponseShare else min(maxResponses, 1 + int(randomness.expovariate(1.0 / max(meanResponses - 1, 0.001))))
+            favorers = randomness.sample(range(1, self._maxUid), randomness.choice((0, 0, 0, 1, 2, 5)))
+            replurkers = randomness.sample(range(1, self._maxUid), randomness.choice((0, 0, 0, 0, 1, 3)))
+            plurk = {"plurk_id": plurkId, "owner_id": 1, "posted": postedDateTime.strftime(_PLURK_TIME_FORMAT), "lang": "tr_ch",
+                     "qualifier": randomness.choice((":", "says", "feels", "loves", "thinks")), "qualifier_translated": randomness.choice((u"\u8aaa", u"\u89ba\u5f97", "says")),
+                     "favorite_count": len(favorers), "favorers": favorers, "replurkers_count": len(replurkers), "replurkers": replurkers,
+                     "response_count": responseCount, "content_raw": SyntheticAccount._text(randomness, plurkId), "content": SyntheticAccount._html(randomness, plurkId)}
+            limitedTo = randomness.choice((None, None, None, "", "|0|", "|2||3||" + str(self._maxUid - 1) + "|"))
+            if limitedTo is not None:
+                plurk["limited_to"] = limitedTo
+            self._plurkIndexes[plurkId] = len(self._plurks)
+            self._plurks.append(plurk)
+            self._postedTimes.append(postedDateTime)
+
+    @staticmethod
+    def _text(randomness, recordId):
+        # what needs escaping in XML and HTML turns up now and then
+        return u"#%d %s" % (recordId, randomness.choice((u"\u4eca\u5929\u5929\u6c23\u5f88\u597d", u"lunch at 1 < 2 & 3 > 2", u"(LOL) see ]]> here", u"\u54c8\u54c8\u54c8 http://example.com/?a=1&b=2")) * randomness.randint(1, 4))
+
+    @staticmethod
+    def _html(randomness, recordId):
+        return u"#%d %s" % (recordId, randomness.choice((u"\u4eca\u5929\u5929\u6c23\u5f88\u597d", u"lunch at 1 &lt; 2 &amp; 3 &gt; 2", u"<img src=\"http://example.com/lol.gif\" class=\"emoticon\" />", u"<a href=\"http://example.com/?a=1&amp;b=2\" class=\"ex_link\">example.com</a>")) * randomness.randint(1, 4))
+
+    def deletePlurk(self, plurkId):
+        """ Takes a plurk off the account, as its owner would delete it. """
+        index = self._plurkIndexes.pop(plurkId)
+        del self._plurks[index]
+        del self._postedTimes[index]
+        for plurk in self._plurks[index:]:
+            self._plurkIndexes[plurk["plurk_id"]] -= 1
+
+    def getPerson(self, uid):
+        return self._people.get(uid)
+
+    def getPlurks(self, offset, limit):
+        """ What /API/Timeline/getPlurks returns for offset ("%Y-%m-%dT%H:%M:%S") and limit. """
+        # sliced rather than strptime'd: python 2's strptime can't be first called from several threads at once
+        offsetDateTime = datetime.datetime(int(offset[0:4]), int(offset[5:7]), int(offset[8:10]), int(offset[11:13]), int(offset[14:16]), int(offset[17:19]))
+        end = bisect.bisect_left(self._postedTimes, offsetDateTime)
+        plurks = self._plurks[max(end - limit, 0):end]
+        plurks.reverse()
+        plurkUsers = {}
+        for plurk in plurks:
+            for uid in plurk["favorers"] + plurk["replurkers"] + [1]:
+                if uid in self._people:
+                    plurkUsers[str(uid)] = self._people[uid]
+        return {"plurks": plurks, "plurk_users": plurkUsers}
+
+    def getResponses(self, plurkId, fromResponse, responsesPerPage = 0):
+        """ What /API/Responses/get returns for plurkId and fromResponse; at most responsesPerPage responses unless it is 0. None if there is no such plurk. """
+        index = self._plurkIndexes.get(plurkId)
+        if index is None:
+            return None
+        plurk = self._plurks[index]
+        randomness = random.Random(self._seed * 1000003 + plurkId)
+        postedDateTime = self._postedTimes[index]
+        responses = []
+        for responseIndex in range(plurk["response_count"]):
+            postedDateTime += datetime.timedelta(seconds = randomness.randint(1, 3600))
+            responseId = plurkId * 1000 + responseIndex
+            responses.append({"id": responseId, "user_id": randomness.randint(1, self._maxUid), "plurk_id": plurkId, "posted": postedDateTime.strftime(_PLURK_TIME_FORMAT), "lang": "tr_ch",
+                              "qualifier": randomness.choice((":", ":", "says", "likes", "asks")), "qualifier_translated": randomness.choice(("", u"\u8aaa", u"\u559c\u6b61")),
+                              "content_raw": SyntheticAccount._text(randomness, responseId), "content": SyntheticAccount._html(randomness, responseId)})
+        responses = responses[fromResponse:fromResponse + responsesPerPage] if responsesPerPage > 0 else responses[fromResponse:]
+        friends = {}
+        for response in responses:
+            if response["user_id"] in self._people:
+                friends[str(response["user_id"])] = self._people[response["user_id"]]
+        return {"responses": responses, "friends": friends, "responses_seen": 0, "response_count": plurk["response_count"]}
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # plurklib sends the headers and the body of a call separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body, headers = ()):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        mockServer = self.server.mockServer
+        parameters = dict(parse_qsl(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")))
+        path = self.path.split("?")[0]
+        status = mockServer._takeCall(path)
+        if status == 503:
+            self._respond(503, b'{"error_text": "Service Unavailable"}')
+            return
+        if status != 200:
+            self._respond(500, b'{"error_text": "Internal Server Error"}')
+            return
+
+        account = mockServer.account
+        headers = ()
+        if path == "/API/Users/login":
+            result = {"user_info": {"id": 1, "nick_name": parameters.get("username", ""), "display_name": u"Mock \u5c0f\u660e", "join_date": account.joinDateTime.strftime(_PLURK_TIME_FORMAT)}}
+            headers = (("Set-Cookie", "plurkcookiea=mock; Path=/"),)
+        elif path == "/API/Users/logout":
+            result = {"success_text": "ok"}
+        elif path == "/API/Timeline/getPlurks":
+            result = account.getPlurks(parameters["offset"], int(parameters.get("limit", 20)))
+        elif path == "/API/Responses/get":
+            result = account.getResponses(int(parameters["plurk_id"]), int(parameters.get("from_response", 0)), mockServer.responsesPerPage)
+            if result is None:
+                self._respond(400, b'{"error_text": "Plurk not found"}')
+                return
+        else:
+            self._respond(404, b'{"error_text": "Not found"}')
+            return
+        self._respond(200, json.dumps(result).encode("utf-8"), headers)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # a backup opens a few dozen keep-alive connections at once
+    request_queue_size = 128
+
+
+class MockPlurkServer:
+    """
+        Serves account on 127.0.0.1:port - port 0 picks a free one - with a thread per keep-alive connection.
+        Every call waits latency seconds first; then any call but login fails with a 500 with probability errorRate.
+        responsesPerPage caps how many responses /API/Responses/get returns at once, as plurk.com does; 0 returns all of them.
+        capacity, unless 0, is how many calls are worked on at once, like an overloaded server: the calls beyond it wait for their turn,
+        and once as many are waiting as are worked on, any further call is refused with a 503 right away.
+        requestCount and errorCount count the calls served, and the 500s and 503s among them.
+    """
+    def __init__(self, account, latency = 0.0, errorRate = 0.0, responsesPerPage = 0, port = 0, seed = 1, capacity = 0):
+        self.account = account
+        self.latency = latency
+        self.errorRate = errorRate
+        self.responsesPerPage = responsesPerPage
+        self.capacity = capacity
+        self.requestCount = 0
+        self.errorCount = 0
+        self._callsInProgress = 0
+        self._workSlots = threading.Semaphore(capacity) if capacity > 0 else None
+        self._randomness = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpServer = _ThreadingHTTPServer(("127.0.0.1", port), _MockRequestHandler)
+        self._httpServer.mockServer = self
+        self._thread = None
+
+    def _takeCall(self, path):
+        """ Counts a call and waits out its turn and the latency; returns the status it is to be answered with, 200 if it is to succeed. """
+        with self._lock:
+            self.requestCount += 1
+            if self._workSlots is not None and self._callsInProgress >= 2 * self.capacity:
+                self.errorCount += 1
+                return 503
+            self._callsInProgress += 1
+        try:
+            if self._workSlots is not None:
+                self._workSlots.acquire()
+            try:
+                if self.latency > 0:
+                    time.sleep(self.latency)
+            finally:
+                if self._workSlots is not None:
+                    self._workSlots.release()
+        finally:
+            with self._lock:
+                self._callsInProgress -= 1
+        with self._lock:
+            if path != "/API/Users/login" and self._randomness.random() < self.errorRate:
+                self.errorCount += 1
+                return 500
+        return 200
+
+    def getHost(self):
+        return "127.0.0.1:" + str(self._httpServer.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target = self._httpServer.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._httpServer.shutdown()
+        self._httpServer.server_close()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    server = MockPlurkServer(SyntheticAccount(int(sys.argv[1]) if len(sys.argv) > 1 else 1000), port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080)
+    print("Serving a synthetic plurk account on " + server.getHost() + "; set apiHost to that in plurackup.py. Ctrl-C stops.")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
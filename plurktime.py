@@ -0,0 +1,101 @@
+"""
+    Copyright (c) 2011-2013 Mnjul/purincess (Min-Zhong Lu)
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+    THE SOFTWARE.
+"""
+"""
+    Plurk timestamps.
+
+    Plurk API gives times as RFC 1123 dates in GMT, like "Sun, 01 Jan 2012 04:54:31 GMT". They are read
+    by slicing the fixed-width fields rather than through strptime, which is many times slower; anything
+    that doesn't look like that still goes through strptime.
+"""
+import datetime
+import threading
+
+PLURK_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S %Z"
+DISPLAY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6, "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+
+def parsePlurkTime(plurkTime):
+    """ Returns the time of a plurk time string, as a naive datetime in GMT. """
+    if len(plurkTime) == 29 and plurkTime[19] == ":" and plurkTime[22] == ":" and plurkTime[25:] == " GMT":
+        try:
+            return datetime.datetime(int(plurkTime[12:16]), _MONTHS[plurkTime[8:11]], int(plurkTime[5:7]), int(plurkTime[17:19]), int(plurkTime[20:22]), int(plurkTime[23:25]))
+        except (KeyError, ValueError):
+            pass
+    return datetime.datetime.strptime(plurkTime, PLURK_TIME_FORMAT)
+
+
+class ShiftedTimeFormatter(object):
+    """ Turns plurk time strings into DISPLAY_TIME_FORMAT strings in a timezone offsetMinutes away from GMT.
+
+        Every distinct plurk time is shifted once and remembered, until more than cacheSize of them have piled up.
+        The shift itself is done by hand on the time of day; only the three dates a plurk time can end up on are
+        rendered through datetime, once per date.
+    """
+    def __init__(self, offsetMinutes, cacheSize = 65536):
+        # plurackup.py works the local offset out by division, which makes it a float in python 3
+        offsetMinutes = int(round(offsetMinutes))
+        self._offsetMinutes = offsetMinutes
+        self._offsetDelta = datetime.timedelta(minutes = offsetMinutes)
+        self._cacheSize = cacheSize
+        self._shiftedTexts = {}
+        self._dateTexts = {}
+
+    def format(self, plurkTime):
+        shiftedText = self._shiftedTexts.get(plurkTime)
+        if shiftedText is not None:
+            return shiftedText
+
+        shiftedText = None
+        if len(plurkTime) == 29 and plurkTime[19] == ":" and plurkTime[22] == ":" and plurkTime[25:] == " GMT":
+            try:
+                dayShift, minuteOfDay = divmod(int(plurkTime[17:19]) * 60 + int(plurkTime[20:22]) + self._offsetMinutes, 1440)
+                dateTexts = self._dateTexts.get(plurkTime[5:16])
+                if dateTexts is None:
+                    postedDate = datetime.date(int(plurkTime[12:16]), _MONTHS[plurkTime[8:11]], int(plurkTime[5:7]))
+                    dateTexts = tuple((postedDate + datetime.timedelta(days)).strftime("%Y-%m-%d ") for days in (-1, 0, 1))
+                    self._dateTexts[plurkTime[5:16]] = dateTexts
+                if -1 <= dayShift <= 1:
+                    shiftedText = "%s%02d:%02d:%s" % (dateTexts[dayShift + 1], minuteOfDay // 60, minuteOfDay % 60, plurkTime[23:25])
+            except (KeyError, ValueError):
+                pass
+        if shiftedText is None:
+            shiftedText = (parsePlurkTime(plurkTime) + self._offsetDelta).strftime(DISPLAY_TIME_FORMAT)
+
+        if len(self._shiftedTexts) >= self._cacheSize:
+            self._shiftedTexts.clear()
+        self._shiftedTexts[plurkTime] = shiftedText
+        return shiftedText
+
+
+_shiftedTimeFormatters = {}
+_shiftedTimeFormattersLock = threading.Lock()
+
+def getShiftedTimeFormatter(offsetMinutes):
+    """ The ShiftedTimeFormatter shared by every writer displaying times offsetMinutes away from GMT,
+        so that a plurk time written out by several of them is shifted only once.
+    """
+    with _shiftedTimeFormattersLock:
+        if not offsetMinutes in _shiftedTimeFormatters:
+            _shiftedTimeFormatters[offsetMinutes] = ShiftedTimeFormatter(offsetMinutes)
+        return _shiftedTimeFormatters[offsetMinutes]